@@ -0,0 +1,475 @@
+"""
+Load test of the whole server
+
+Starts the mock Ollama (benchmarks/mock_ollama.py) unless --ollama is given,
+then runs N concurrent MCP clients against server.py and reports latency
+percentiles and reviews per second:
+
+- stdio: every client starts its own server process, as an IDE does
+- sse: one server process is started with --transport sse and all clients
+  connect to it
+
+Every server gets its own knowledge graph, caches and traces in a temporary
+directory, so runs do not affect each other or the local data. Clients send
+their next request as soon as the previous one is answered; timing starts
+once all clients are connected and Ollama is reported healthy.
+
+Usage:
+    python benchmarks/load_test.py --transport both --clients 8 --requests 10
+    python benchmarks/load_test.py --clients 16 --output results.json --baseline baseline.json
+"""
+
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import anyio
+import click
+import httpx
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.sse import sse_client
+from mcp.client.stdio import stdio_client
+
+# Add the benchmarks directory to the Python path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from report import check_baseline, format_report, summarize
+
+ROOT = Path(__file__).parent.parent
+SERVER_PATH = ROOT / "server.py"
+MOCK_OLLAMA_PATH = Path(__file__).parent / "mock_ollama.py"
+
+# Seconds to wait for a process to serve requests and for Ollama to be healthy
+STARTUP_TIMEOUT = 60
+
+
+def free_port() -> int:
+    """Find a free local TCP port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_snippet(index: int) -> str:
+    """Build a distinct Python snippet of varying size.
+
+    Args:
+        index: Number of the snippet; equal numbers give equal snippets
+
+    Returns:
+        Source code of a few functions
+    """
+    functions = []
+    for function in range(2 + index % 4):
+        lines = [f"def process_{index}_{function}(items, threshold={index % 7}):"]
+        lines.append("    result = []")
+        lines.append("    for item in items:")
+        for branch in range(1 + (index + function) % 5):
+            lines.append(f"        if item.value > threshold + {branch}:")
+            lines.append(f"            result.append(item.value * {branch + 2})")
+        lines.append("    return result")
+        functions.append("\n".join(lines))
+    return "\n\n\n".join(functions) + "\n"
+
+
+def server_env(data_dir: str, ollama_url: str, overrides: Dict[str, str]) -> Dict[str, str]:
+    """Build the environment of a server process.
+
+    Args:
+        data_dir: Directory for the server's graph, caches and traces
+        ollama_url: Ollama (or mock) the server uses
+        overrides: Additional settings, e.g. OLLAMA_MAX_IN_FLIGHT
+
+    Returns:
+        The environment, with explicit values for everything the server
+        would otherwise read from a local .env
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    return {
+        **os.environ,
+        "OLLAMA_HOST": ollama_url,
+        "OLLAMA_HOSTS": ollama_url,
+        "KNOWLEDGE_GRAPH_PATH": os.path.join(data_dir, "knowledge_graph.json"),
+        "OLLAMA_CACHE_PATH": os.path.join(data_dir, "ollama_cache.db"),
+        "VECTOR_INDEX_PATH": os.path.join(data_dir, "knowledge_graph.vectors"),
+        "TRACE_PATH": os.path.join(data_dir, "traces.jsonl"),
+        **overrides
+    }
+
+
+async def wait_for_http(url: str, process: Optional[subprocess.Popen] = None) -> None:
+    """Wait until a URL answers.
+
+    Args:
+        url: URL to poll
+        process: Process serving the URL; fail early if it exits
+
+    Raises:
+        RuntimeError: If the URL does not answer in time
+    """
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    async with httpx.AsyncClient(timeout=2) as client:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"Process serving {url} exited with code {process.returncode}")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await anyio.sleep(0.2)
+    raise RuntimeError(f"{url} did not answer within {STARTUP_TIMEOUT} seconds")
+
+
+async def wait_for_ollama(session: ClientSession) -> None:
+    """Wait until the server reports a healthy Ollama host.
+
+    Until then reviews would come from the heuristic fallback.
+
+    Raises:
+        RuntimeError: If no host becomes healthy in time
+    """
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        result = await session.call_tool("get_service_stats", {})
+        stats = json.loads(result.content[0].text)
+        if any(host["state"] == "healthy" for host in stats.get("hosts", [])):
+            return
+        await anyio.sleep(0.2)
+    raise RuntimeError(f"Ollama was not healthy within {STARTUP_TIMEOUT} seconds")
+
+
+@asynccontextmanager
+async def open_session(read_stream, write_stream) -> AsyncIterator[ClientSession]:
+    """Open an initialized MCP session that drains server notifications.
+
+    Log lines the server prints on stdio arrive as parse errors; they are
+    read and dropped so they cannot block the session.
+    """
+    async with ClientSession(read_stream, write_stream) as session:
+        async with anyio.create_task_group() as tg:
+            async def drain() -> None:
+                async for _ in session.incoming_messages:
+                    pass
+
+            tg.start_soon(drain)
+            await session.initialize()
+            yield session
+            tg.cancel_scope.cancel()
+
+
+class LoadTest:
+    """Concurrent clients sending review requests to the server."""
+
+    def __init__(
+        self,
+        clients: int,
+        requests: int,
+        tool: str,
+        distinct: int,
+        use_cache: bool,
+        ollama_url: str,
+        data_dir: str,
+        env_overrides: Dict[str, str]
+    ):
+        """Initialize the load test.
+
+        Args:
+            clients: Number of concurrent clients
+            requests: Requests sent by each client
+            tool: Review tool to call
+            distinct: Number of distinct snippets (0 for a new one per request)
+            use_cache: Whether the server may answer from its caches
+            ollama_url: Ollama (or mock) the servers use
+            data_dir: Directory for the servers' data
+            env_overrides: Additional server settings
+        """
+        self.clients = clients
+        self.requests = requests
+        self.tool = tool
+        self.distinct = distinct
+        self.use_cache = use_cache
+        self.ollama_url = ollama_url
+        self.data_dir = data_dir
+        self.env_overrides = env_overrides
+
+    def snippet_indices(self, client: int) -> List[int]:
+        """Get the snippets a client sends, in order."""
+        indices = [client * self.requests + request for request in range(self.requests)]
+        return [index % self.distinct for index in indices] if self.distinct else indices
+
+    async def run_client(
+        self,
+        session: ClientSession,
+        client: int,
+        start: anyio.Event,
+        samples: List[Dict[str, Any]]
+    ) -> None:
+        """Send a client's requests one after the other once the run starts."""
+        await start.wait()
+        for index in self.snippet_indices(client):
+            arguments = {"code": make_snippet(index), "language": "python", "useCache": self.use_cache}
+            began = time.perf_counter()
+            error = None
+            reviews: List[Dict[str, Any]] = []
+            try:
+                result = await session.call_tool(self.tool, arguments)
+                payload = json.loads(result.content[0].text)
+                if "error" in payload:
+                    error = payload["error"]
+                else:
+                    reviews = payload["reviews"] if "reviews" in payload else [payload]
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+
+            finished = time.perf_counter()
+            samples.append({
+                "client": client,
+                "finished": finished,
+                "latency": finished - began,
+                "ok": error is None,
+                "error": error,
+                "reviews": len(reviews),
+                "fallback": sum(1 for review in reviews if review.get("model") is None)
+            })
+
+    async def measure(self, run_clients) -> Dict[str, Any]:
+        """Run the clients and time them from the moment all are ready until
+        the last answer.
+
+        Args:
+            run_clients: Coroutine function starting the clients; it receives
+                a callback each client calls when it is ready, the start event
+                and the list collecting the samples
+
+        Returns:
+            Summary of the run
+        """
+        samples: List[Dict[str, Any]] = []
+        start = anyio.Event()
+        ready = 0
+        started_at = 0.0
+
+        def client_ready() -> None:
+            nonlocal ready, started_at
+            ready += 1
+            if ready == self.clients:
+                started_at = time.perf_counter()
+                start.set()
+
+        await run_clients(client_ready, start, samples)
+        # Stop the clock at the last answer, not after the servers shut down
+        finished_at = max((sample["finished"] for sample in samples), default=started_at)
+        return summarize(samples, finished_at - started_at)
+
+    async def run_stdio(self) -> Dict[str, Any]:
+        """Run every client against its own server process over stdio."""
+        async def run_clients(client_ready, start, samples) -> None:
+            async def client(number: int) -> None:
+                env = server_env(os.path.join(self.data_dir, f"stdio-{number}"), self.ollama_url, self.env_overrides)
+                params = StdioServerParameters(command=sys.executable, args=[str(SERVER_PATH)], env=env)
+                async with stdio_client(params) as (read_stream, write_stream):
+                    async with open_session(read_stream, write_stream) as session:
+                        await wait_for_ollama(session)
+                        client_ready()
+                        await self.run_client(session, number, start, samples)
+
+            async with anyio.create_task_group() as tg:
+                for number in range(self.clients):
+                    tg.start_soon(client, number)
+
+        return await self.measure(run_clients)
+
+    async def run_sse(self) -> Dict[str, Any]:
+        """Run all clients against one server process over SSE."""
+        port = free_port()
+        env = server_env(os.path.join(self.data_dir, "sse"), self.ollama_url, self.env_overrides)
+        log_path = os.path.join(self.data_dir, "sse", "server.log")
+        with open(log_path, "w") as log:
+            process = subprocess.Popen(
+                [sys.executable, str(SERVER_PATH), "--transport", "sse", "--port", str(port)],
+                env=env,
+                stdout=log,
+                stderr=subprocess.STDOUT
+            )
+        try:
+            await wait_for_http(f"http://127.0.0.1:{port}/metrics", process)
+
+            async def run_clients(client_ready, start, samples) -> None:
+                async def client(number: int) -> None:
+                    async with sse_client(f"http://127.0.0.1:{port}/sse", sse_read_timeout=600) as (read_stream, write_stream):
+                        async with open_session(read_stream, write_stream) as session:
+                            if number == 0:
+                                await wait_for_ollama(session)
+                            client_ready()
+                            await self.run_client(session, number, start, samples)
+
+                async with anyio.create_task_group() as tg:
+                    for number in range(self.clients):
+                        tg.start_soon(client, number)
+
+            return await self.measure(run_clients)
+        finally:
+            stop_process(process)
+
+
+def stop_process(process: subprocess.Popen, timeout: float = 10) -> None:
+    """Stop a process, killing it if it does not exit in time.
+
+    The SSE server waits for open event streams on shutdown, which may not end.
+    """
+    process.terminate()
+    try:
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def start_mock_ollama(port: int, options: List[str], log_path: str) -> subprocess.Popen:
+    """Start the mock Ollama server in a process.
+
+    Args:
+        port: Port to listen on
+        options: Additional command line options of the mock
+        log_path: File receiving the output of the mock
+
+    Returns:
+        The process
+    """
+    with open(log_path, "w") as log:
+        return subprocess.Popen(
+            [sys.executable, str(MOCK_OLLAMA_PATH), "--port", str(port), *options],
+            stdout=log,
+            stderr=subprocess.STDOUT
+        )
+
+
+@click.command()
+@click.option("--transport", type=click.Choice(["stdio", "sse", "both"]), default="both", help="Transports to test")
+@click.option("--clients", default=8, help="Number of concurrent clients")
+@click.option("--requests", default=10, help="Requests sent by each client")
+@click.option("--tool", type=click.Choice(["ask_martin", "ask_bob", "ask_panel"]), default="ask_bob", help="Review tool to call")
+@click.option("--distinct", default=0, help="Number of distinct snippets, to exercise the caches (0 for a new one per request)")
+@click.option("--use-cache/--no-cache", default=True, help="Whether the server may answer from its caches")
+@click.option("--ollama", default=None, help="Use this Ollama (or already running mock) instead of starting the mock")
+@click.option("--latency", default="lognormal:0.3,0.5", help="Mock time to first token in seconds")
+@click.option("--token-rate", default="normal:40,8", help="Mock generated tokens per second")
+@click.option("--tokens", default="normal:200,40", help="Mock tokens per review")
+@click.option("--parallel", default=4, help="Mock concurrent generations")
+@click.option("--replay", default=None, type=click.Path(exists=True, dir_okay=False), help="Have the mock replay these recorded responses")
+@click.option("--seed", default=0, help="Seed of the mock timings")
+@click.option("--server-env", multiple=True, help="Server setting as KEY=VALUE, e.g. OLLAMA_MAX_IN_FLIGHT=4")
+@click.option("--output", default=None, type=click.Path(dir_okay=False), help="Write the results to this JSON file")
+@click.option("--baseline", default=None, type=click.Path(exists=True, dir_okay=False), help="Results file to compare with")
+@click.option("--max-regression", default=0.2, help="Tolerated relative regression of p95 latency and reviews/s")
+@click.option("--keep-data", is_flag=True, help="Keep the servers' data directory for inspection")
+def main(
+    transport: str,
+    clients: int,
+    requests: int,
+    tool: str,
+    distinct: int,
+    use_cache: bool,
+    ollama: Optional[str],
+    latency: str,
+    token_rate: str,
+    tokens: str,
+    parallel: int,
+    replay: Optional[str],
+    seed: int,
+    server_env: List[str],
+    output: Optional[str],
+    baseline: Optional[str],
+    max_regression: float,
+    keep_data: bool
+) -> int:
+    """Measure latency and throughput of the server under concurrent clients."""
+    overrides = {}
+    for setting in server_env:
+        key, separator, value = setting.partition("=")
+        if not separator:
+            raise click.BadParameter(f"Expected KEY=VALUE: {setting}", param_hint="--server-env")
+        overrides[key] = value
+
+    data_dir = tempfile.mkdtemp(prefix="mcp-load-test-")
+    mock = None
+    if ollama is None:
+        port = free_port()
+        ollama = f"http://127.0.0.1:{port}"
+        options = [
+            "--latency", latency,
+            "--token-rate", token_rate,
+            "--tokens", tokens,
+            "--parallel", str(parallel),
+            "--seed", str(seed)
+        ]
+        if replay:
+            options += ["--replay", replay]
+        mock = start_mock_ollama(port, options, os.path.join(data_dir, "mock_ollama.log"))
+
+    load_test = LoadTest(clients, requests, tool, distinct, use_cache, ollama, data_dir, overrides)
+    transports = ["stdio", "sse"] if transport == "both" else [transport]
+    results: Dict[str, Dict[str, Any]] = {}
+    mock_stats = None
+
+    async def run() -> None:
+        nonlocal mock_stats
+        if mock is not None:
+            await wait_for_http(f"{ollama}/api/tags", mock)
+        for name in transports:
+            print(f"Running {clients} {name} client(s) x {requests} {tool} request(s)...")
+            results[name] = await (load_test.run_stdio() if name == "stdio" else load_test.run_sse())
+        if mock is not None:
+            async with httpx.AsyncClient() as client:
+                mock_stats = (await client.get(f"{ollama}/mock/stats")).json()
+
+    try:
+        anyio.run(run)
+    finally:
+        if mock is not None:
+            stop_process(mock)
+        if keep_data:
+            print(f"Server data kept in {data_dir}")
+        else:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    print(format_report(results))
+    if mock_stats and replay:
+        print(f"Mock Ollama replayed {mock_stats['replayed']} and synthesized {mock_stats['missed']} response(s)")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({
+                "config": {
+                    "clients": clients,
+                    "requests": requests,
+                    "tool": tool,
+                    "distinct": distinct,
+                    "use_cache": use_cache,
+                    "ollama": "mock" if mock is not None else ollama,
+                    "mock": {"latency": latency, "token_rate": token_rate, "tokens": tokens, "parallel": parallel,
+                             "replay": replay, "seed": seed} if mock is not None else None,
+                    "server_env": overrides
+                },
+                "results": results,
+                "mock_stats": mock_stats
+            }, f, indent=2)
+        print(f"Results written to {output}")
+
+    # Click ignores the return value, so fail the run explicitly
+    if baseline and not check_baseline(results, baseline, max_regression):
+        sys.exit(1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,426 @@
+"""
+Mock Ollama server
+
+A local stand-in for Ollama's /api/tags, /api/generate and /api/embed
+endpoints, so the whole server can be load tested on a laptop without a GPU
+or network. Time to first token, generation speed and response length are
+drawn from configurable distributions, and at most --parallel generations run
+at once like on a real Ollama host; further requests queue.
+
+Responses of a real Ollama can be recorded once and replayed later: with
+--upstream and --record every request is forwarded to Ollama and its response
+and timing are appended to a file, with --replay recorded responses are
+served again for identical requests, with their recorded timing.
+
+Distributions are given as "<kind>:<parameters>":
+    0.2 or const:0.2          always 0.2
+    uniform:0.1,0.5           uniformly between 0.1 and 0.5
+    normal:40,8               normal with mean 40 and standard deviation 8
+    lognormal:0.3,0.5         log-normal with median 0.3 and sigma 0.5
+    exp:0.3                   exponential with mean 0.3
+
+Usage:
+    python benchmarks/mock_ollama.py --port 11435 --latency lognormal:0.3,0.5 --token-rate normal:40,8
+    python benchmarks/mock_ollama.py --upstream http://localhost:11434 --record benchmarks/recording.jsonl
+    python benchmarks/mock_ollama.py --replay benchmarks/recording.jsonl
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import anyio
+import click
+import httpx
+import numpy as np
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+# Pieces of text streamed as one token: a word or a punctuation mark with
+# the whitespace before it
+TOKEN_PATTERN = re.compile(r"\s*(?:\w+|[^\w\s])")
+
+# Vocabulary of the synthetic reviews
+REVIEW_WORDS = (
+    "the function is long and mixes several responsibilities consider extracting a method "
+    "naming could reveal intent more clearly duplicated logic should move into a helper "
+    "the class depends on concrete details instead of abstractions tests would make this "
+    "refactoring safer the loop hides a query that deserves its own name"
+).split()
+
+Distribution = Callable[[random.Random], float]
+
+
+def parse_distribution(spec: str) -> Distribution:
+    """Parse a distribution specification like 'lognormal:0.3,0.5'.
+
+    Args:
+        spec: Distribution kind and parameters, or a constant
+
+    Returns:
+        Function drawing a non-negative sample from a random generator
+    """
+    kind, _, params = spec.partition(":")
+    if not params:
+        kind, params = "const", kind
+    try:
+        values = [float(value) for value in params.split(",")]
+        samplers = {
+            "const": (1, lambda rng: values[0]),
+            "uniform": (2, lambda rng: rng.uniform(values[0], values[1])),
+            "normal": (2, lambda rng: rng.gauss(values[0], values[1])),
+            "lognormal": (2, lambda rng: values[0] * rng.lognormvariate(0, values[1])),
+            "exp": (1, lambda rng: rng.expovariate(1 / values[0]) if values[0] > 0 else 0.0)
+        }
+        count, sampler = samplers[kind]
+    except (KeyError, ValueError):
+        raise click.BadParameter(f"Invalid distribution: {spec}")
+    if len(values) != count:
+        raise click.BadParameter(f"Distribution {kind} takes {count} parameter(s): {spec}")
+    return lambda rng: max(0.0, sampler(rng))
+
+
+def request_key(endpoint: str, model: str, payload: Any) -> str:
+    """Build the key under which a response is recorded.
+
+    Args:
+        endpoint: 'generate' or 'embed'
+        model: Requested model
+        payload: Prompt of a generation, or one text to embed
+
+    Returns:
+        Hash of the request
+    """
+    return hashlib.sha256(json.dumps([endpoint, model, payload]).encode("utf-8")).hexdigest()
+
+
+class MockOllama:
+    """Ollama API stand-in with simulated latency and record/replay."""
+
+    def __init__(
+        self,
+        latency: Distribution,
+        token_rate: Distribution,
+        tokens: Distribution,
+        embed_latency: Distribution,
+        embed_dim: int = 768,
+        parallel: int = 4,
+        seed: int = 0,
+        upstream: Optional[str] = None,
+        record_path: Optional[str] = None,
+        replay_path: Optional[str] = None,
+        recorded_timing: bool = True
+    ):
+        """Initialize the mock.
+
+        Args:
+            latency: Time to first token in seconds, i.e. queueing in Ollama
+                aside, the prompt evaluation time
+            token_rate: Generated tokens per second
+            tokens: Number of tokens of a generated review
+            embed_latency: Duration of an embedding request in seconds
+            embed_dim: Dimension of the embeddings
+            parallel: Maximum number of concurrent generations (0 for no limit)
+            seed: Seed of the random generator
+            upstream: Ollama to forward requests to while recording
+            record_path: File recorded responses are appended to
+            replay_path: File of recorded responses to serve
+            recorded_timing: Whether replayed responses keep their recorded
+                timing instead of the simulated one
+        """
+        self.latency = latency
+        self.token_rate = token_rate
+        self.tokens = tokens
+        self.embed_latency = embed_latency
+        self.embed_dim = embed_dim
+        # A semaphore, as a closed stream may be finalized by another task
+        self.slots = anyio.Semaphore(parallel) if parallel > 0 else None
+        self.rng = random.Random(seed)
+        self.upstream = upstream.rstrip("/") if upstream else None
+        self.record_path = record_path
+        self.recorded_timing = recorded_timing
+        self.recordings: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"generate": 0, "embed": 0, "embedded": 0, "replayed": 0, "missed": 0, "recorded": 0}
+        self._client: Optional[httpx.AsyncClient] = None
+        if replay_path:
+            self._load(replay_path)
+
+    def _load(self, path: str) -> None:
+        """Load recorded responses."""
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    recording = json.loads(line)
+                    self.recordings[recording["key"]] = recording
+        print(f"Loaded {len(self.recordings)} recorded responses from {path}")
+
+    def _record(self, recording: Dict[str, Any]) -> None:
+        """Append a recorded response to the recording file."""
+        self.recordings[recording["key"]] = recording
+        self.stats["recorded"] += 1
+        with open(self.record_path, "a") as f:
+            f.write(json.dumps(recording) + "\n")
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """HTTP client of the upstream Ollama."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(600, connect=5))
+        return self._client
+
+    @property
+    def app(self) -> Starlette:
+        """The ASGI application serving the mock."""
+        return Starlette(routes=[
+            Route("/api/tags", self.tags),
+            Route("/api/generate", self.generate, methods=["POST"]),
+            Route("/api/embed", self.embed, methods=["POST"]),
+            Route("/mock/stats", self.get_stats)
+        ])
+
+    async def tags(self, request: Request) -> Response:
+        """List the available models."""
+        if self.upstream:
+            response = await self.client.get(f"{self.upstream}/api/tags")
+            return Response(response.content, status_code=response.status_code, media_type="application/json")
+        return JSONResponse({"models": [{"name": "mock", "model": "mock"}]})
+
+    async def get_stats(self, request: Request) -> Response:
+        """Report how many requests were served, replayed and recorded."""
+        return JSONResponse(self.stats)
+
+    async def generate(self, request: Request) -> Response:
+        """Generate a review, streamed as NDJSON unless 'stream' is false."""
+        body = await request.json()
+        model = body.get("model", "")
+        prompt = body.get("prompt", "")
+        self.stats["generate"] += 1
+
+        key = request_key("generate", model, prompt)
+        if self.upstream and self.record_path:
+            recording = await self._record_generation(key, body)
+            # The upstream already took its time
+            ttft, rate = 0.0, 0.0
+        elif key in self.recordings:
+            recording = self.recordings[key]
+            self.stats["replayed"] += 1
+            ttft, rate = self._timing(recording)
+        else:
+            if self.recordings:
+                self.stats["missed"] += 1
+            recording = {"tokens": self._synthetic_tokens(prompt)}
+            ttft, rate = self.latency(self.rng), self.token_rate(self.rng)
+
+        chunks = self._chunks(model, recording["tokens"], ttft, rate)
+        if body.get("stream", True):
+            return StreamingResponse(
+                (json.dumps(chunk) + "\n" async for chunk in chunks),
+                media_type="application/x-ndjson"
+            )
+
+        text = []
+        final: Dict[str, Any] = {}
+        async for chunk in chunks:
+            text.append(chunk["response"])
+            final = chunk
+        return JSONResponse({**final, "response": "".join(text)})
+
+    def _timing(self, recording: Dict[str, Any]) -> Tuple[float, float]:
+        """Get the time to first token and token rate of a replayed response."""
+        if not self.recorded_timing:
+            return self.latency(self.rng), self.token_rate(self.rng)
+        ttft = recording.get("ttft", 0.0)
+        decode = recording.get("duration", 0.0) - ttft
+        count = len(recording["tokens"])
+        return ttft, (count - 1) / decode if decode > 0 and count > 1 else 0.0
+
+    async def _chunks(
+        self,
+        model: str,
+        tokens: List[str],
+        ttft: float,
+        rate: float
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Emit the tokens of a response at the given pace.
+
+        Args:
+            model: Requested model
+            tokens: Tokens of the response
+            ttft: Time to first token in seconds
+            rate: Tokens per second after the first one (0 for no delay)
+
+        Yields:
+            Ollama stream chunks, ending with a 'done' chunk with timing
+            statistics
+        """
+        if self.slots is not None:
+            await self.slots.acquire()
+        try:
+            start = time.monotonic()
+            await anyio.sleep(ttft)
+            first = time.monotonic()
+            for index, token in enumerate(tokens):
+                if rate > 0 and index:
+                    await anyio.sleep(max(0.0, first + index / rate - time.monotonic()))
+                yield {"model": model, "response": token, "done": False}
+            end = time.monotonic()
+        finally:
+            if self.slots is not None:
+                self.slots.release()
+
+        yield {
+            "model": model,
+            "response": "",
+            "done": True,
+            "total_duration": int((end - start) * 1e9),
+            "prompt_eval_duration": int((first - start) * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": int((end - first) * 1e9)
+        }
+
+    def _synthetic_tokens(self, prompt: str) -> List[str]:
+        """Build the tokens of a synthetic review, varying with the prompt."""
+        rng = random.Random(prompt)
+        count = max(8, int(self.tokens(self.rng)))
+        words = [rng.choice(REVIEW_WORDS) for _ in range(count)]
+        suggestions = [" ".join(rng.choice(REVIEW_WORDS) for _ in range(6)).capitalize() for _ in range(3)]
+        text = json.dumps({
+            "review": " ".join(words).capitalize() + ".",
+            "suggestions": suggestions,
+            "rating": rng.randint(1, 5)
+        })
+        return TOKEN_PATTERN.findall(text)
+
+    async def _record_generation(self, key: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Forward a generation to the upstream Ollama and record it."""
+        start = time.monotonic()
+        ttft = None
+        tokens: List[str] = []
+        async with self.client.stream("POST", f"{self.upstream}/api/generate", json={**body, "stream": True}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("response"):
+                    if ttft is None:
+                        ttft = time.monotonic() - start
+                    tokens.append(chunk["response"])
+                if chunk.get("done"):
+                    break
+
+        duration = time.monotonic() - start
+        recording = {
+            "key": key,
+            "endpoint": "generate",
+            "tokens": tokens,
+            "ttft": ttft if ttft is not None else duration,
+            "duration": duration
+        }
+        self._record(recording)
+        return recording
+
+    async def embed(self, request: Request) -> Response:
+        """Embed one text or a list of texts."""
+        body = await request.json()
+        model = body.get("model", "")
+        texts = body.get("input", [])
+        texts = [texts] if isinstance(texts, str) else texts
+        self.stats["embed"] += 1
+        self.stats["embedded"] += len(texts)
+
+        keys = [request_key("embed", model, text) for text in texts]
+        if self.upstream and self.record_path:
+            start = time.monotonic()
+            response = await self.client.post(f"{self.upstream}/api/embed", json=body)
+            if response.status_code != 200:
+                return Response(response.content, status_code=response.status_code, media_type="application/json")
+            embeddings = response.json()["embeddings"]
+            duration = (time.monotonic() - start) / max(1, len(texts))
+            for key, embedding in zip(keys, embeddings):
+                self._record({"key": key, "endpoint": "embed", "embedding": embedding, "duration": duration})
+            return JSONResponse({"model": model, "embeddings": embeddings})
+
+        embeddings = []
+        delay = self.embed_latency(self.rng)
+        for key, text in zip(keys, texts):
+            recording = self.recordings.get(key)
+            if recording is not None:
+                self.stats["replayed"] += 1
+                embeddings.append(recording["embedding"])
+            else:
+                if self.recordings:
+                    self.stats["missed"] += 1
+                embeddings.append(self._synthetic_embedding(text))
+        await anyio.sleep(delay)
+        return JSONResponse({"model": model, "embeddings": embeddings})
+
+    def _synthetic_embedding(self, text: str) -> List[float]:
+        """Build a deterministic unit vector for a text."""
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.embed_dim)
+        return (vector / np.linalg.norm(vector)).round(6).tolist()
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", help="Interface to listen on")
+@click.option("--port", default=11435, help="Port to listen on")
+@click.option("--latency", default="lognormal:0.3,0.5", help="Time to first token in seconds")
+@click.option("--token-rate", default="normal:40,8", help="Generated tokens per second")
+@click.option("--tokens", default="normal:200,40", help="Tokens per generated review")
+@click.option("--embed-latency", default="0.02", help="Duration of an embedding request in seconds")
+@click.option("--embed-dim", default=768, help="Dimension of the embeddings")
+@click.option("--parallel", default=4, help="Concurrent generations, like OLLAMA_NUM_PARALLEL (0 for no limit)")
+@click.option("--seed", default=0, help="Seed of the simulated timings")
+@click.option("--upstream", default=None, help="Real Ollama to forward requests to while recording")
+@click.option("--record", "record_path", default=None, type=click.Path(dir_okay=False), help="Append upstream responses to this file")
+@click.option("--replay", "replay_path", default=None, type=click.Path(exists=True, dir_okay=False), help="Serve the responses recorded in this file")
+@click.option("--recorded-timing/--simulated-timing", default=True, help="Timing of replayed responses")
+def main(
+    host: str,
+    port: int,
+    latency: str,
+    token_rate: str,
+    tokens: str,
+    embed_latency: str,
+    embed_dim: int,
+    parallel: int,
+    seed: int,
+    upstream: Optional[str],
+    record_path: Optional[str],
+    replay_path: Optional[str],
+    recorded_timing: bool
+) -> None:
+    """Run a mock Ollama server."""
+    if bool(upstream) != bool(record_path):
+        raise click.UsageError("--upstream and --record must be used together")
+    if record_path and os.path.dirname(record_path):
+        os.makedirs(os.path.dirname(record_path), exist_ok=True)
+
+    mock = MockOllama(
+        latency=parse_distribution(latency),
+        token_rate=parse_distribution(token_rate),
+        tokens=parse_distribution(tokens),
+        embed_latency=parse_distribution(embed_latency),
+        embed_dim=embed_dim,
+        parallel=parallel,
+        seed=seed,
+        upstream=upstream,
+        record_path=record_path,
+        replay_path=replay_path,
+        recorded_timing=recorded_timing
+    )
+
+    import uvicorn
+    print(f"Mock Ollama at http://{host}:{port}")
+    uvicorn.run(mock.app, host=host, port=port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark of the prompt prefix cache
+
+Sends the two expert prompts for the same snippet to Ollama one after the
+other, once with the persona-first layout the prompts used to have and once
+with the shared code-first layout, and compares how much prompt evaluation
+(prefill) the second expert needs. With the code-first layout Ollama can
+reuse the evaluated code from the first expert's prompt.
+
+Usage:
+    python benchmarks/prefix_cache.py examples/python_example.py examples/javascript_example.js
+"""
+
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Any
+
+import click
+import httpx
+
+# Add the project root to the Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from ollama_service import OLLAMA_HOST, OLLAMA_MODEL, OllamaService
+
+JSON_RESPONSE_MARKER = "JSON RESPONSE:\n"
+
+
+def persona_first(prompt: str, prefix: str) -> str:
+    """Rebuild a prompt in the old layout, with the persona before the code.
+
+    Args:
+        prompt: Code-first expert prompt
+        prefix: Shared code prefix of the prompt
+
+    Returns:
+        The same instructions and code with the persona first
+    """
+    persona = prompt[len(prefix):].replace(JSON_RESPONSE_MARKER, "")
+    return persona + prefix + JSON_RESPONSE_MARKER
+
+
+def generate(client: httpx.Client, host: str, model: str, prompt: str, num_predict: int) -> Dict[str, Any]:
+    """Run one generation and return Ollama's timing statistics.
+
+    Args:
+        client: HTTP client
+        host: Ollama API host
+        model: Model to use
+        prompt: Prompt for the model
+        num_predict: Number of tokens to generate
+
+    Returns:
+        The final response of Ollama, with prompt_eval_count and
+        prompt_eval_duration (in nanoseconds)
+    """
+    response = client.post(
+        f"{host}/api/generate",
+        json={
+            "model": model,
+            "prompt": prompt,
+            "stream": False,
+            "keep_alive": "30m",
+            "options": {"num_predict": num_predict}
+        }
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+@click.command()
+@click.argument("files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--host", default=OLLAMA_HOST, help="Ollama API host")
+@click.option("--model", default=OLLAMA_MODEL, help="Model to benchmark")
+@click.option("--runs", default=3, help="Runs per file and layout")
+@click.option("--num-predict", default=16, help="Tokens generated per prompt")
+def main(files: List[str], host: str, model: str, runs: int, num_predict: int) -> int:
+    """Compare the prefill time of the second expert for both prompt layouts."""
+    service = OllamaService(hosts=[host], model=model)
+    results: Dict[str, List[Dict[str, Any]]] = {"persona-first": [], "code-first": []}
+
+    with httpx.Client(timeout=600) as client:
+        # Load the model so the first measurement does not include it
+        generate(client, host, model, "Hello", 1)
+
+        for path in files:
+            code = Path(path).read_text()
+            language = Path(path).suffix.lstrip(".") or None
+            for run in range(runs):
+                for layout in results:
+                    # A unique description keeps runs from hitting each other's cache
+                    description = f"Benchmark run {uuid.uuid4()}"
+                    prefix = service._prepare_code_prefix(code, language, description)
+                    prompts = [
+                        service._prepare_martin_fowler_prompt(code, language, description),
+                        service._prepare_robert_c_martin_prompt(code, language, description)
+                    ]
+                    if layout == "persona-first":
+                        prompts = [persona_first(prompt, prefix) for prompt in prompts]
+
+                    start = time.monotonic()
+                    first = generate(client, host, model, prompts[0], num_predict)
+                    second = generate(client, host, model, prompts[1], num_predict)
+                    results[layout].append({
+                        "file": os.path.basename(path),
+                        "first_ms": first.get("prompt_eval_duration", 0) / 1e6,
+                        "second_ms": second.get("prompt_eval_duration", 0) / 1e6,
+                        "second_tokens": second.get("prompt_eval_count", 0),
+                        "wall_s": time.monotonic() - start
+                    })
+
+    print(f"Model: {model} on {host}, {runs} run(s) per file, {num_predict} tokens generated per prompt")
+    print(f"{'layout':<15}{'1st prefill ms':>16}{'2nd prefill ms':>16}{'2nd tokens':>12}{'wall s':>10}")
+    averages = {}
+    for layout, samples in results.items():
+        count = len(samples)
+        averages[layout] = {
+            key: sum(sample[key] for sample in samples) / count
+            for key in ("first_ms", "second_ms", "second_tokens", "wall_s")
+        }
+        avg = averages[layout]
+        print(
+            f"{layout:<15}{avg['first_ms']:>16.1f}{avg['second_ms']:>16.1f}"
+            f"{avg['second_tokens']:>12.0f}{avg['wall_s']:>10.2f}"
+        )
+
+    saved = averages["persona-first"]["second_ms"] - averages["code-first"]["second_ms"]
+    print(f"Prefill time saved per additional expert: {saved:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Load test report
+
+Summarizes the calls of a load test run into latency percentiles and
+throughput, prints them as a table and compares them with an earlier run, so
+regressions are caught before rollout.
+
+Usage:
+    python benchmarks/report.py results.json
+    python benchmarks/report.py results.json --baseline baseline.json --max-regression 0.2
+"""
+
+import json
+import sys
+from typing import Any, Dict, List
+
+import click
+import numpy as np
+
+# Latency percentiles in the report
+PERCENTILES = (50, 95, 99)
+
+
+def summarize(samples: List[Dict[str, Any]], wall_seconds: float) -> Dict[str, Any]:
+    """Summarize the calls of one run.
+
+    Args:
+        samples: One entry per tool call with its 'latency' in seconds,
+            whether it succeeded ('ok'), the number of 'reviews' it returned
+            and how many of them were 'fallback' reviews
+        wall_seconds: Duration of the run
+
+    Returns:
+        Call counts, latency percentiles of the successful calls in
+        milliseconds, and reviews and calls per second
+    """
+    succeeded = [sample for sample in samples if sample["ok"]]
+    latencies = np.array([sample["latency"] for sample in succeeded]) * 1000
+    reviews = sum(sample["reviews"] for sample in succeeded)
+    summary = {
+        "calls": len(samples),
+        "succeeded": len(succeeded),
+        "failed": len(samples) - len(succeeded),
+        "reviews": reviews,
+        "fallback_reviews": sum(sample["fallback"] for sample in succeeded),
+        "wall_seconds": round(wall_seconds, 3),
+        "reviews_per_second": round(reviews / wall_seconds, 3) if wall_seconds > 0 else 0.0,
+        "calls_per_second": round(len(succeeded) / wall_seconds, 3) if wall_seconds > 0 else 0.0,
+        "latency_ms": {}
+    }
+    if len(latencies):
+        summary["latency_ms"] = {
+            **{f"p{p}": round(float(np.percentile(latencies, p)), 1) for p in PERCENTILES},
+            "mean": round(float(latencies.mean()), 1),
+            "max": round(float(latencies.max()), 1)
+        }
+
+    errors: Dict[str, int] = {}
+    for sample in samples:
+        if not sample["ok"]:
+            errors[sample["error"]] = errors.get(sample["error"], 0) + 1
+    if errors:
+        summary["errors"] = errors
+    return summary
+
+
+def format_report(results: Dict[str, Dict[str, Any]]) -> str:
+    """Format the summaries of several runs as a table.
+
+    Args:
+        results: Summary of each run by name, e.g. by transport
+
+    Returns:
+        The table, followed by the errors and warnings of the runs
+    """
+    header = f"{'run':<10}{'calls':>7}{'failed':>8}" + "".join(f"{f'p{p} ms':>11}" for p in PERCENTILES)
+    header += f"{'max ms':>11}{'reviews/s':>11}{'calls/s':>9}"
+    lines = [header]
+    notes = []
+    for name, summary in results.items():
+        latency = summary["latency_ms"]
+        lines.append(
+            f"{name:<10}{summary['calls']:>7}{summary['failed']:>8}"
+            + "".join(f"{latency.get(f'p{p}', float('nan')):>11.1f}" for p in PERCENTILES)
+            + f"{latency.get('max', float('nan')):>11.1f}"
+            + f"{summary['reviews_per_second']:>11.2f}{summary['calls_per_second']:>9.2f}"
+        )
+        for error, count in summary.get("errors", {}).items():
+            notes.append(f"{name}: {count} call(s) failed: {error[:200]}")
+        if summary["fallback_reviews"]:
+            notes.append(
+                f"{name}: {summary['fallback_reviews']} review(s) came from the heuristic fallback, "
+                "not from Ollama; their latency is not representative"
+            )
+    return "\n".join(lines + notes)
+
+
+def compare(
+    results: Dict[str, Dict[str, Any]],
+    baseline: Dict[str, Dict[str, Any]],
+    max_regression: float
+) -> List[str]:
+    """Find the runs that got slower than a baseline.
+
+    Args:
+        results: Summaries of the current runs by name
+        baseline: Summaries of the baseline runs by name
+        max_regression: Tolerated relative increase of p95 latency or
+            decrease of reviews per second, e.g. 0.2 for 20%
+
+    Returns:
+        Description of every regression beyond the tolerance
+    """
+    regressions = []
+    for name, summary in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+
+        p95, p95_before = summary["latency_ms"].get("p95"), before["latency_ms"].get("p95")
+        if p95 is not None and p95_before and p95 > p95_before * (1 + max_regression):
+            regressions.append(f"{name}: p95 latency {p95_before:.1f} ms -> {p95:.1f} ms")
+
+        throughput, throughput_before = summary["reviews_per_second"], before["reviews_per_second"]
+        if throughput_before and throughput < throughput_before * (1 - max_regression):
+            regressions.append(f"{name}: reviews/s {throughput_before:.2f} -> {throughput:.2f}")
+    return regressions
+
+
+def check_baseline(results: Dict[str, Dict[str, Any]], baseline_path: str, max_regression: float) -> bool:
+    """Print the comparison with a baseline results file.
+
+    Args:
+        results: Summaries of the current runs by name
+        baseline_path: Results file written by an earlier load test
+        max_regression: Tolerated relative regression
+
+    Returns:
+        True if no run regressed beyond the tolerance
+    """
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)["results"]
+
+    regressions = compare(results, baseline, max_regression)
+    if regressions:
+        print(f"Regressions beyond {max_regression:.0%} compared with {baseline_path}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return False
+    print(f"No regression beyond {max_regression:.0%} compared with {baseline_path}")
+    return True
+
+
+@click.command()
+@click.argument("results_path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--baseline", default=None, type=click.Path(exists=True, dir_okay=False), help="Results file to compare with")
+@click.option("--max-regression", default=0.2, help="Tolerated relative regression of p95 latency and reviews/s")
+def main(results_path: str, baseline: str, max_regression: float) -> int:
+    """Print the report of a load test results file."""
+    with open(results_path, "r") as f:
+        results = json.load(f)["results"]
+
+    print(format_report(results))
+    # Click ignores the return value, so fail the run explicitly
+    if baseline and not check_baseline(results, baseline, max_regression):
+        sys.exit(1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
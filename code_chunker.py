@@ -0,0 +1,174 @@
+"""
+Code Chunker
+
+Splits large source files into chunks at function and class boundaries, so
+each chunk can be reviewed on its own.
+"""
+
+import ast
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+# Languages whose code is split with the Python parser
+PYTHON_LANGUAGES = {"python", "py", "python3"}
+
+# Lines that close a block rather than start one (e.g. '}' or 'end')
+CLOSING_LINE_PATTERN = re.compile(r"^(\}|\)|\]|end\b)")
+
+
+class CodeChunk(NamedTuple):
+    """A contiguous part of a source file."""
+    start_line: int
+    end_line: int
+    code: str
+
+
+def split_code(code: str, language: Optional[str] = None, max_chars: int = 12000) -> List[CodeChunk]:
+    """Split code into chunks of at most max_chars characters.
+
+    Python code is split at top-level function and class boundaries found
+    with the ast module, and classes that do not fit into one chunk are split
+    between their methods. Other languages (and Python that does not parse)
+    are split at blank lines followed by an unindented line, which is where
+    top-level definitions start in most languages. Neighbouring parts are
+    packed together up to max_chars, and parts that still do not fit are
+    split between lines.
+
+    Args:
+        code: Code to split
+        language: Programming language
+        max_chars: Maximum size of a chunk
+
+    Returns:
+        The chunks in source order; a single chunk if the code fits
+    """
+    lines = code.splitlines(keepends=True)
+    if len(code) <= max_chars or len(lines) < 2:
+        return [CodeChunk(1, max(1, len(lines)), code)]
+
+    segments = None
+    if language and language.lower() in PYTHON_LANGUAGES:
+        segments = _python_segments(code, lines, max_chars)
+    if segments is None:
+        segments = _heuristic_segments(lines)
+
+    return _pack(lines, segments, max_chars)
+
+
+def _python_segments(code: str, lines: List[str], max_chars: int) -> Optional[List[Tuple[int, int]]]:
+    """Find the line ranges of top-level Python definitions.
+
+    Args:
+        code: Code to split
+        lines: Lines of the code
+        max_chars: Maximum size of a chunk, used to decide which classes are
+            split between their methods
+
+    Returns:
+        0-based [start, end) line ranges covering the code, or None if the
+        code does not parse
+    """
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+
+    starts = [0]
+    for node in tree.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        starts.append(_node_start(node))
+        if isinstance(node, ast.ClassDef):
+            size = sum(len(line) for line in lines[_node_start(node):node.end_lineno])
+            if size > max_chars:
+                # Split large classes between their methods
+                for child in node.body[1:]:
+                    starts.append(_node_start(child))
+
+    return _ranges(starts, len(lines))
+
+
+def _node_start(node: ast.AST) -> int:
+    """Get the 0-based first line of a statement, including its decorators."""
+    decorators = getattr(node, "decorator_list", [])
+    return min([node.lineno] + [d.lineno for d in decorators]) - 1
+
+
+def _heuristic_segments(lines: List[str]) -> List[Tuple[int, int]]:
+    """Find likely top-level definitions in code of any language.
+
+    Args:
+        lines: Lines of the code
+
+    Returns:
+        0-based [start, end) line ranges covering the code
+    """
+    starts = [0]
+    for index in range(1, len(lines)):
+        line = lines[index]
+        if (
+            line.strip()
+            and not line[0].isspace()
+            and not CLOSING_LINE_PATTERN.match(line)
+            and not lines[index - 1].strip()
+        ):
+            starts.append(index)
+    return _ranges(starts, len(lines))
+
+
+def _ranges(starts: List[int], line_count: int) -> List[Tuple[int, int]]:
+    """Turn segment start lines into contiguous [start, end) ranges.
+
+    Args:
+        starts: 0-based start lines, not necessarily sorted or unique
+        line_count: Number of lines of the code
+
+    Returns:
+        Ranges covering all lines
+    """
+    bounds = sorted(set(start for start in starts if 0 <= start < line_count))
+    if not bounds or bounds[0] != 0:
+        bounds.insert(0, 0)
+    return list(zip(bounds, bounds[1:] + [line_count]))
+
+
+def _pack(lines: List[str], segments: List[Tuple[int, int]], max_chars: int) -> List[CodeChunk]:
+    """Pack neighbouring segments into chunks of at most max_chars characters.
+
+    Args:
+        lines: Lines of the code
+        segments: 0-based [start, end) line ranges covering the code
+        max_chars: Maximum size of a chunk
+
+    Returns:
+        The chunks in source order
+    """
+    # Split segments that are too large on their own between lines
+    pieces: List[Tuple[int, int]] = []
+    for start, end in segments:
+        piece_start, size = start, 0
+        for index in range(start, end):
+            if size and size + len(lines[index]) > max_chars:
+                pieces.append((piece_start, index))
+                piece_start, size = index, 0
+            size += len(lines[index])
+        pieces.append((piece_start, end))
+
+    chunks: List[CodeChunk] = []
+    chunk_start, chunk_end, size = pieces[0][0], pieces[0][0], 0
+    for start, end in pieces:
+        piece_size = sum(len(line) for line in lines[start:end])
+        if size and size + piece_size > max_chars:
+            chunks.append(_chunk(lines, chunk_start, chunk_end))
+            chunk_start, size = start, 0
+        chunk_end = end
+        size += piece_size
+    chunks.append(_chunk(lines, chunk_start, chunk_end))
+
+    # Chunks of only blank lines are not worth a review
+    return [chunk for chunk in chunks if chunk.code.strip()]
+
+
+def _chunk(lines: List[str], start: int, end: int) -> CodeChunk:
+    """Build a chunk from 0-based [start, end) lines."""
+    return CodeChunk(start + 1, end, "".join(lines[start:end]))
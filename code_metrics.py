@@ -0,0 +1,573 @@
+"""
+Code Metrics
+
+Static analysis run before a review: per-function cyclomatic complexity,
+length, nesting depth and parameter count. Python is analyzed with the ast
+module and JavaScript/TypeScript with a lightweight tokenizer. Each snippet
+also gets a fingerprint that ignores formatting and comments, so identical
+code can be recognized. Results are cached by a hash of the code.
+"""
+
+import ast
+import hashlib
+import io
+import re
+import textwrap
+import tokenize
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+
+# Languages analyzed with the Python parser and with the JavaScript tokenizer
+PYTHON_LANGUAGES = {"python", "py", "python3"}
+JAVASCRIPT_LANGUAGES = {"javascript", "js", "jsx", "typescript", "ts", "tsx", "mjs", "cjs"}
+
+# Alternative names of the languages, mapped to the name used in fingerprints
+LANGUAGE_ALIASES = {
+    "py": "python", "python3": "python",
+    "js": "javascript", "mjs": "javascript", "cjs": "javascript", "ts": "typescript"
+}
+
+# Version of the fingerprint scheme, so that snippets stored with an older
+# one can be fingerprinted again (version 2 added the language)
+FINGERPRINT_VERSION = 2
+
+# Python tokens that carry no code: comments, line breaks and indentation
+PYTHON_SKIPPED_TOKENS = {
+    tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT, tokenize.ENDMARKER
+}
+
+# Maximum number of analyzed snippets kept in the cache
+METRICS_CACHE_SIZE = 512
+
+# Thresholds above which a function is reported as a hotspot
+COMPLEXITY_THRESHOLD = 10
+LENGTH_THRESHOLD = 50
+NESTING_THRESHOLD = 4
+PARAMETER_THRESHOLD = 5
+
+# Python nodes that add a branch to the cyclomatic complexity
+PYTHON_BRANCH_NODES = (
+    ast.If, ast.For, ast.AsyncFor, ast.While, ast.IfExp, ast.ExceptHandler,
+    ast.Assert, ast.comprehension
+)
+
+# Python statements that nest a block
+PYTHON_BLOCK_NODES = (
+    ast.If, ast.For, ast.AsyncFor, ast.While, ast.With, ast.AsyncWith, ast.Try
+) + ((ast.Match,) if hasattr(ast, "Match") else ()) + ((ast.TryStar,) if hasattr(ast, "TryStar") else ())
+
+# JavaScript tokens: comments, strings, template literals, identifiers and operators
+JS_TOKEN_PATTERN = re.compile(
+    r"(?P<comment>//[^\n]*|/\*.*?\*/)"
+    r"|(?P<string>'(?:\\.|[^'\\\n])*'|\"(?:\\.|[^\"\\\n])*\"|`(?:\\.|[^`\\])*`)"
+    r"|(?P<word>[A-Za-z_$][\w$]*)"
+    r"|(?P<op>=>|\?\?|\?\.|&&|\|\||[{}()\[\];,?:=])"
+    r"|(?P<newline>\n)"
+    r"|(?P<other>.)",
+    re.DOTALL
+)
+
+# JavaScript keywords that add a branch to the cyclomatic complexity
+JS_BRANCH_WORDS = {"if", "for", "while", "case", "catch"}
+JS_BRANCH_OPERATORS = {"&&", "||", "??", "?"}
+
+# Words followed by parentheses that are not function definitions
+JS_NON_FUNCTION_WORDS = {
+    "if", "for", "while", "switch", "catch", "return", "typeof", "new", "await",
+    "function", "super", "import", "with", "do", "else", "yield", "delete", "void"
+}
+
+_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def get_code_metrics(code: str, language: Optional[str] = None) -> Dict[str, Any]:
+    """Get the metrics of a snippet, from the cache when it was analyzed before.
+
+    Args:
+        code: Code to analyze
+        language: Programming language
+
+    Returns:
+        Dictionary with line counts, per-function metrics and totals
+    """
+    key = hashlib.sha256(f"{(language or '').lower()}\0{code}".encode("utf-8")).hexdigest()
+    metrics = _cache.get(key)
+    if metrics is not None:
+        _cache.move_to_end(key)
+        _cache_stats["hits"] += 1
+        return metrics
+
+    _cache_stats["misses"] += 1
+    metrics = analyze_code(code, language)
+    _cache[key] = metrics
+    if len(_cache) > METRICS_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return metrics
+
+
+def metrics_cache_stats() -> Dict[str, Any]:
+    """Get the statistics of the metrics cache.
+
+    Returns:
+        Dictionary with the number of entries, hits and misses
+    """
+    return {"entries": len(_cache), **_cache_stats}
+
+
+def code_fingerprint(code: str, language: Optional[str] = None) -> str:
+    """Get the fingerprint of a snippet, from the cache when it was analyzed before.
+
+    Args:
+        code: Code to fingerprint
+        language: Programming language
+
+    Returns:
+        Hex digest that is the same for code in the same language differing
+        only in whitespace and comments
+    """
+    return get_code_metrics(code, language)["fingerprint"]
+
+
+def code_tokens(code: str, language: Optional[str] = None) -> List[str]:
+    """Split a snippet into tokens, dropping comments and whitespace.
+
+    Code that is analyzed as Python is split with the tokenize module, any
+    other code with the JavaScript tokenizer.
+
+    Args:
+        code: Code to split
+        language: Programming language
+
+    Returns:
+        Text of each token
+    """
+    if get_code_metrics(code, language)["analyzer"] == "python":
+        try:
+            return [
+                token.string
+                for token in tokenize.generate_tokens(io.StringIO(textwrap.dedent(code)).readline)
+                if token.type not in PYTHON_SKIPPED_TOKENS
+            ]
+        except (tokenize.TokenError, SyntaxError):
+            pass
+    return [text for _, text, _ in _tokenize_javascript(code)]
+
+
+def analyze_code(code: str, language: Optional[str] = None) -> Dict[str, Any]:
+    """Compute the static metrics of a snippet.
+
+    Python is parsed with ast and JavaScript/TypeScript tokenized. Code of
+    an unknown language is tried as Python and then as a brace language.
+    For other languages only line counts are reported.
+
+    Args:
+        code: Code to analyze
+        language: Programming language
+
+    Returns:
+        Dictionary with the fingerprint, line counts, per-function metrics
+        and totals
+    """
+    language = (language or "").lower()
+    functions: Optional[List[Dict[str, Any]]] = None
+    classes = 0
+    analyzer = None
+    tree = None
+
+    if language in PYTHON_LANGUAGES or not language:
+        tree = _parse_python(code)
+        if tree is not None:
+            functions, classes = _analyze_python(tree)
+            analyzer = "python"
+    if functions is None and (language in JAVASCRIPT_LANGUAGES or (not language and "{" in code)):
+        functions, classes = _analyze_javascript(code)
+        analyzer = "javascript"
+
+    lines = code.splitlines()
+    metrics: Dict[str, Any] = {
+        "analyzer": analyzer,
+        "fingerprint": _fingerprint(code, LANGUAGE_ALIASES.get(language, language), tree),
+        "lines": len(lines),
+        "code_lines": sum(1 for line in lines if line.strip()),
+        "classes": classes,
+        "functions": functions or []
+    }
+    functions = metrics["functions"]
+    if functions:
+        metrics["average_complexity"] = round(sum(f["complexity"] for f in functions) / len(functions), 1)
+        metrics["max_complexity"] = max(f["complexity"] for f in functions)
+        metrics["max_length"] = max(f["length"] for f in functions)
+        metrics["max_nesting"] = max(f["nesting"] for f in functions)
+        metrics["max_parameters"] = max(f["parameters"] for f in functions)
+    return metrics
+
+
+def hotspots(metrics: Dict[str, Any], limit: int = 3) -> List[Dict[str, Any]]:
+    """Get the functions exceeding any of the hotspot thresholds.
+
+    Args:
+        metrics: Metrics from analyze_code
+        limit: Maximum number of functions returned
+
+    Returns:
+        The worst functions, most complex first, each with a list of issues
+    """
+    found = []
+    for function in metrics["functions"]:
+        issues = []
+        if function["complexity"] > COMPLEXITY_THRESHOLD:
+            issues.append(f"complexity {function['complexity']}")
+        if function["length"] > LENGTH_THRESHOLD:
+            issues.append(f"{function['length']} lines")
+        if function["nesting"] > NESTING_THRESHOLD:
+            issues.append(f"nesting depth {function['nesting']}")
+        if function["parameters"] > PARAMETER_THRESHOLD:
+            issues.append(f"{function['parameters']} parameters")
+        if issues:
+            found.append({**function, "issues": issues})
+    found.sort(key=lambda f: (f["complexity"], f["length"]), reverse=True)
+    return found[:limit]
+
+
+def summarize_metrics(metrics: Dict[str, Any]) -> str:
+    """Summarize metrics in a few lines for a review prompt.
+
+    Args:
+        metrics: Metrics from analyze_code
+
+    Returns:
+        Compact summary, or an empty string when nothing was analyzed
+    """
+    if not metrics["analyzer"]:
+        return ""
+
+    functions = metrics["functions"]
+    parts = [
+        f"{metrics['lines']} lines ({metrics['code_lines']} non-blank), "
+        f"{len(functions)} functions, {metrics['classes']} classes"
+    ]
+    if functions:
+        parts.append(
+            f"cyclomatic complexity avg {metrics['average_complexity']}, max {metrics['max_complexity']}; "
+            f"longest function {metrics['max_length']} lines; max nesting depth {metrics['max_nesting']}; "
+            f"max parameters {metrics['max_parameters']}"
+        )
+    for function in hotspots(metrics):
+        parts.append(f"hotspot: {function['name']} (line {function['line']}): {', '.join(function['issues'])}")
+    return "\n".join(f"- {part}" for part in parts)
+
+
+def _fingerprint(code: str, language: str, tree: Optional[ast.AST] = None) -> str:
+    """Hash the canonical form of a snippet.
+
+    Parsed Python is hashed as its ast.dump(), which contains neither
+    comments nor formatting (docstrings are kept, as they are part of the
+    code). Anything else is hashed as its tokens, with comments in // and
+    /* */ form and all whitespace outside of strings dropped. The language
+    is hashed too, so identical text in different languages is told apart.
+
+    Args:
+        code: Code to fingerprint
+        language: Canonical name of the language, or "" if unknown
+        tree: Parsed Python module of the code, if it is Python
+
+    Returns:
+        Hex digest of the canonical form
+    """
+    if tree is not None:
+        canonical = f"{language}\0python\0" + ast.dump(tree)
+    else:
+        canonical = f"{language}\0tokens\0" + "\0".join(text for _, text, _ in _tokenize_javascript(code))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _parse_python(code: str) -> Optional[ast.AST]:
+    """Parse Python code with ast.
+
+    Args:
+        code: Code to parse; indented code such as a single method is
+            dedented first
+
+    Returns:
+        The parsed module, or None if the code does not parse
+    """
+    try:
+        return ast.parse(code)
+    except (SyntaxError, ValueError):
+        try:
+            return ast.parse(textwrap.dedent(code))
+        except (SyntaxError, ValueError):
+            return None
+
+
+def _analyze_python(tree: ast.AST) -> Tuple[List[Dict[str, Any]], int]:
+    """Analyze parsed Python code.
+
+    Args:
+        tree: Parsed module
+
+    Returns:
+        Function metrics and number of classes
+    """
+    functions: List[Dict[str, Any]] = []
+    classes = 0
+
+    def visit(node: ast.AST, scope: str) -> None:
+        nonlocal classes
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.ClassDef):
+                classes += 1
+                visit(child, f"{scope}{child.name}.")
+            elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                functions.append(_python_function(child, scope))
+                visit(child, f"{scope}{child.name}.")
+            else:
+                visit(child, scope)
+
+    visit(tree, "")
+    return functions, classes
+
+
+def _python_function(node: ast.AST, scope: str) -> Dict[str, Any]:
+    """Compute the metrics of one Python function.
+
+    Nested functions and classes are not counted towards it, nor is a
+    leading self or cls parameter.
+
+    Args:
+        node: Function definition
+        scope: Qualified name prefix, e.g. 'Class.'
+
+    Returns:
+        Dictionary with name, line, length, complexity, nesting and parameters
+    """
+    complexity = 1
+    max_depth = 0
+
+    def walk(parent: ast.AST, depth: int) -> None:
+        nonlocal complexity, max_depth
+        for child in ast.iter_child_nodes(parent):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+                continue
+            if isinstance(child, PYTHON_BRANCH_NODES):
+                complexity += 1
+            elif isinstance(child, ast.BoolOp):
+                complexity += len(child.values) - 1
+            elif hasattr(ast, "match_case") and isinstance(child, ast.match_case):
+                complexity += 1
+            child_depth = depth + 1 if isinstance(child, PYTHON_BLOCK_NODES) else depth
+            max_depth = max(max_depth, child_depth)
+            walk(child, child_depth)
+
+    walk(node, 0)
+
+    args = node.args
+    parameters = [a.arg for a in args.posonlyargs + args.args + args.kwonlyargs]
+    if args.vararg:
+        parameters.append(args.vararg.arg)
+    if args.kwarg:
+        parameters.append(args.kwarg.arg)
+    if parameters and parameters[0] in ("self", "cls"):
+        parameters = parameters[1:]
+
+    return {
+        "name": f"{scope}{node.name}",
+        "line": node.lineno,
+        "length": node.end_lineno - node.lineno + 1,
+        "complexity": complexity,
+        "nesting": max_depth,
+        "parameters": len(parameters)
+    }
+
+
+def _tokenize_javascript(code: str) -> List[Tuple[str, str, int]]:
+    """Split JavaScript/TypeScript into tokens, dropping comments and whitespace.
+
+    Args:
+        code: Code to tokenize
+
+    Returns:
+        Kind, text and line number of each token
+    """
+    tokens = []
+    line = 1
+    for match in JS_TOKEN_PATTERN.finditer(code):
+        kind = match.lastgroup
+        text = match.group()
+        if kind == "newline":
+            line += 1
+            continue
+        if kind not in ("comment", "other"):
+            tokens.append((kind, text, line))
+        elif kind == "other" and not text.isspace():
+            tokens.append(("op", text, line))
+        line += text.count("\n") if kind in ("comment", "string") else 0
+    return tokens
+
+
+def _analyze_javascript(code: str) -> Tuple[List[Dict[str, Any]], int]:
+    """Analyze JavaScript/TypeScript with a lightweight tokenizer.
+
+    Functions are recognized as 'function name(...) {', 'name(...) {'
+    methods and '(...) => {' arrows assigned to a name; their body is
+    delimited by matching braces. Nesting counts braces opened inside a
+    function, so object literals count as well.
+
+    Args:
+        code: Code to analyze
+
+    Returns:
+        Function metrics and number of classes
+    """
+    tokens = _tokenize_javascript(code)
+    functions: List[Dict[str, Any]] = []
+    classes = 0
+    # Open braces: the function record for function bodies, None for other blocks
+    stack: List[Optional[Dict[str, Any]]] = []
+    pending: Optional[Dict[str, Any]] = None
+
+    def current() -> Optional[Dict[str, Any]]:
+        for frame in reversed(stack):
+            if frame is not None:
+                return frame
+        return None
+
+    index = 0
+    while index < len(tokens):
+        kind, text, line = tokens[index]
+
+        if kind == "word" and text == "class":
+            classes += 1
+        elif kind == "op" and text == "(":
+            close, parameters = _match_parameters(tokens, index)
+            name = _function_name(tokens, index, close)
+            if name is not None:
+                pending = {"name": name, "line": tokens[index][2], "parameters": parameters}
+        elif kind == "op" and text == "{":
+            if pending is not None:
+                function = {**pending, "complexity": 1, "nesting": 0, "depth": 0}
+                functions.append(function)
+                stack.append(function)
+                pending = None
+            else:
+                stack.append(None)
+                function = current()
+                if function is not None:
+                    function["depth"] += 1
+                    function["nesting"] = max(function["nesting"], function["depth"])
+        elif kind == "op" and text == "}":
+            if stack:
+                frame = stack.pop()
+                if frame is not None:
+                    frame["length"] = line - frame["line"] + 1
+                else:
+                    function = current()
+                    if function is not None:
+                        function["depth"] -= 1
+        elif kind == "op" and text == ";":
+            # An arrow with an expression body, or a declaration without a body
+            pending = None
+        else:
+            function = current()
+            if function is not None and (
+                (kind == "word" and text in JS_BRANCH_WORDS)
+                or (kind == "op" and text in JS_BRANCH_OPERATORS)
+            ):
+                function["complexity"] += 1
+        index += 1
+
+    last_line = tokens[-1][2] if tokens else 1
+    results = []
+    for function in functions:
+        results.append({
+            "name": function["name"],
+            "line": function["line"],
+            "length": function.get("length", last_line - function["line"] + 1),
+            "complexity": function["complexity"],
+            "nesting": function["nesting"],
+            "parameters": function["parameters"]
+        })
+    return results, classes
+
+
+def _match_parameters(tokens: List[Tuple[str, str, int]], open_index: int) -> Tuple[int, int]:
+    """Find the closing parenthesis and count the parameters inside.
+
+    Args:
+        tokens: Tokens of the code
+        open_index: Index of the opening parenthesis
+
+    Returns:
+        Index of the closing parenthesis and number of comma-separated items
+    """
+    depth = 0
+    items = 0
+    has_item = False
+    for index in range(open_index, len(tokens)):
+        kind, text, _ = tokens[index]
+        if kind == "op" and text in "([{" and len(text) == 1:
+            depth += 1
+            if depth > 1:
+                has_item = True
+        elif kind == "op" and text in ")]}" and len(text) == 1:
+            depth -= 1
+            if depth == 0:
+                return index, items + (1 if has_item else 0)
+        elif depth == 1 and kind == "op" and text == ",":
+            items += 1
+            has_item = False
+        else:
+            has_item = True
+    return len(tokens) - 1, items + (1 if has_item else 0)
+
+
+def _function_name(tokens: List[Tuple[str, str, int]], open_index: int, close_index: int) -> Optional[str]:
+    """Name the function whose parameter list spans the given parentheses.
+
+    Args:
+        tokens: Tokens of the code
+        open_index: Index of the opening parenthesis
+        close_index: Index of the closing parenthesis
+
+    Returns:
+        The function name ('<anonymous>' if it has none), or None if the
+        parentheses do not start a function with a block body
+    """
+    following = tokens[close_index + 1:close_index + 3]
+    # Skip a TypeScript return type annotation such as '): Promise<void> {'
+    lookahead = close_index + 1
+    if lookahead < len(tokens) and tokens[lookahead][1] == ":":
+        while lookahead < len(tokens) and tokens[lookahead][1] not in ("{", "=>", ";"):
+            lookahead += 1
+        following = tokens[lookahead:lookahead + 2]
+    if not following:
+        return None
+
+    is_arrow = following[0][1] == "=>"
+    if not is_arrow and following[0][1] != "{":
+        return None
+    if is_arrow and (len(following) < 2 or following[1][1] != "{"):
+        return None
+
+    before = tokens[open_index - 1] if open_index > 0 else None
+    if is_arrow:
+        # const name = (...) => {  /  name: (...) => {
+        if open_index >= 2 and tokens[open_index - 1][1] in ("=", ":") and tokens[open_index - 2][0] == "word":
+            return tokens[open_index - 2][1]
+        if before is not None and before[1] == "async" and open_index >= 3 and tokens[open_index - 2][1] in ("=", ":"):
+            return tokens[open_index - 3][1]
+        return "<anonymous>"
+
+    if before is None:
+        return None
+    if before[1] == "function" or (before[0] == "word" and open_index >= 2 and tokens[open_index - 2][1] == "function"):
+        # function name(...) {  /  name = function (...) {
+        if before[1] != "function":
+            return before[1]
+        if open_index >= 3 and tokens[open_index - 2][1] in ("=", ":") and tokens[open_index - 3][0] == "word":
+            return tokens[open_index - 3][1]
+        return "<anonymous>"
+    if before[0] == "word" and before[1] not in JS_NON_FUNCTION_WORDS:
+        return before[1]
+    return None
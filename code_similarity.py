@@ -0,0 +1,134 @@
+"""
+Code Similarity
+
+MinHash signatures over token shingles of code, and the locality-sensitive
+hashing (LSH) keys derived from them. Snippets sharing at least one LSH key
+are candidate near-duplicates, so similar code can be found by looking up a
+few keys instead of comparing against every stored snippet.
+"""
+
+import base64
+import hashlib
+import random
+import struct
+from typing import List, Optional, Sequence, Set
+
+import numpy as np
+
+from code_metrics import code_tokens
+
+# Number of hash functions in a signature, split into bands of rows for LSH.
+# Two snippets become candidates when all rows of any band are equal, which
+# is likely above a similarity of about (1 / LSH_BANDS) ** (1 / LSH_ROWS) = 0.5.
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+
+# Number of consecutive tokens in a shingle
+SHINGLE_SIZE = 4
+
+# Default minimum estimated similarity of near-duplicates
+DEFAULT_SIMILARITY_THRESHOLD = 0.5
+
+# Signatures are persisted, so the hash functions must never change:
+# h(x) = (a * x + b) mod p with a fixed seed and the Mersenne prime p = 2^31 - 1,
+# which keeps every product within 64 bits and every value within 32 bits
+_PRIME = (1 << 31) - 1
+_random = random.Random(20240601)
+_A = np.array([_random.randrange(1, _PRIME) for _ in range(NUM_PERMUTATIONS)], dtype=np.uint64)
+_B = np.array([_random.randrange(0, _PRIME) for _ in range(NUM_PERMUTATIONS)], dtype=np.uint64)
+
+_SIGNATURE_FORMAT = f"<{NUM_PERMUTATIONS}I"
+
+
+def shingles(code: str, language: Optional[str] = None) -> Set[int]:
+    """Hash the overlapping token shingles of a snippet.
+
+    Args:
+        code: Code to split into shingles
+        language: Programming language
+
+    Returns:
+        64-bit hashes of the shingles; a snippet shorter than a shingle is
+        one shingle, and code without tokens has none
+    """
+    tokens = code_tokens(code, language)
+    if not tokens:
+        return set()
+
+    size = min(SHINGLE_SIZE, len(tokens))
+    hashes = set()
+    for index in range(len(tokens) - size + 1):
+        shingle = "\0".join(tokens[index:index + size]).encode("utf-8")
+        hashes.add(int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), "little"))
+    return hashes
+
+
+def minhash_signature(code: str, language: Optional[str] = None) -> Optional[List[int]]:
+    """Compute the MinHash signature of a snippet.
+
+    Args:
+        code: Code to sign
+        language: Programming language
+
+    Returns:
+        NUM_PERMUTATIONS values, or None if the code has no tokens
+    """
+    hashes = shingles(code, language)
+    if not hashes:
+        return None
+
+    # One row of hashed shingles per hash function, minimized per row
+    values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes)) % np.uint64(_PRIME)
+    permuted = (_A[:, None] * values[None, :] + _B[:, None]) % np.uint64(_PRIME)
+    return permuted.min(axis=1).tolist()
+
+
+def lsh_keys(signature: Sequence[int]) -> List[int]:
+    """Compute the LSH bucket keys of a signature, one per band.
+
+    Args:
+        signature: MinHash signature
+
+    Returns:
+        Signed 64-bit keys, so they can be stored as SQLite integers
+    """
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        data = struct.pack(f"<H{LSH_ROWS}I", band, *rows)
+        keys.append(int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little", signed=True))
+    return keys
+
+
+def estimate_similarity(first: Sequence[int], second: Sequence[int]) -> float:
+    """Estimate the Jaccard similarity of two snippets from their signatures.
+
+    Args:
+        first: MinHash signature of one snippet
+        second: MinHash signature of the other snippet
+
+    Returns:
+        Fraction of equal signature values, between 0 and 1
+    """
+    return sum(1 for a, b in zip(first, second) if a == b) / NUM_PERMUTATIONS
+
+
+def encode_signature(signature: Sequence[int]) -> bytes:
+    """Pack a signature into bytes for storage."""
+    return struct.pack(_SIGNATURE_FORMAT, *signature)
+
+
+def decode_signature(data: bytes) -> List[int]:
+    """Unpack a signature packed by encode_signature."""
+    return list(struct.unpack(_SIGNATURE_FORMAT, data))
+
+
+def signature_to_text(signature: Sequence[int]) -> str:
+    """Encode a signature as base64 text for JSON storage."""
+    return base64.b64encode(encode_signature(signature)).decode("ascii")
+
+
+def signature_from_text(text: str) -> List[int]:
+    """Decode a signature encoded by signature_to_text."""
+    return decode_signature(base64.b64decode(text))
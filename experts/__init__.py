@@ -2,9 +2,20 @@
 Code Expert System - Expert Modules
 """
 
-from typing import Dict, List, Any, Optional, Protocol
+import os
+from typing import Dict, List, Any, Literal, Optional, Protocol
 from pydantic import BaseModel
 
+from code_metrics import code_fingerprint
+from code_similarity import DEFAULT_SIMILARITY_THRESHOLD
+from knowledge_graph import FINGERPRINT_PROPERTY
+from ollama_service import ProgressCallback
+
+# Number of the expert's earlier reviews of similar code added to its
+# prompt (0 disables it), and how similar that code must be
+PRIOR_REVIEWS = int(os.environ.get("PRIOR_REVIEWS", "0"))
+PRIOR_REVIEW_SIMILARITY = float(os.environ.get("PRIOR_REVIEW_SIMILARITY", "0.6"))
+
 # Standardized models for all experts
 class CodeReviewRequest(BaseModel):
     """Request model for code review"""
@@ -12,12 +23,15 @@ class CodeReviewRequest(BaseModel):
     description: Optional[str] = None
     language: Optional[str] = None
     storeInGraph: bool = True
+    useCache: bool = True
+    priority: Literal["interactive", "batch"] = "interactive"
 
 class CodeReviewResponse(BaseModel):
     """Response model for code review"""
     review: str
     suggestions: List[str]
     rating: int
+    model: Optional[str] = None
     
     # Pydantic v2 configuration
     model_config = {
@@ -53,13 +67,169 @@ class ExpertInterface(Protocol):
         """Get the input schema for this expert's tool"""
         ...
     
-    async def review_code(self, request: CodeReviewRequest) -> CodeReviewResponse:
-        """Review code according to this expert's principles"""
+    async def review_code(
+        self,
+        request: CodeReviewRequest,
+        progress: Optional[ProgressCallback] = None
+    ) -> CodeReviewResponse:
+        """Review code according to this expert's principles, optionally reporting generation progress"""
+        ...
+    
+    async def generate_review(
+        self,
+        request: CodeReviewRequest,
+        progress: Optional[ProgressCallback] = None
+    ) -> CodeReviewResponse:
+        """Generate a review without storing it in the knowledge graph"""
+        ...
+    
+    def store_review(self, code_name: str, response: CodeReviewResponse) -> str:
+        """Store a review linked to an already stored code snippet and return its node name"""
+        ...
+    
+    def find_review(self, request: CodeReviewRequest) -> Optional[CodeReviewResponse]:
+        """Find a stored review of identical code by this expert and model, if reuse is allowed"""
         ...
 
+def store_code_snippet(knowledge_graph, request: CodeReviewRequest) -> str:
+    """Store the code of a review request as a CodeSnippet node
+    
+    Code that only differs from an already stored snippet in formatting and
+    comments is not stored again; the existing node is returned instead.
+    
+    Args:
+        knowledge_graph: The knowledge graph instance
+        request: The code review request
+        
+    Returns:
+        Name of the CodeSnippet node
+    """
+    fingerprint = code_fingerprint(request.code, request.language)
+    for node in knowledge_graph.get_nodes_by_fingerprint(fingerprint):
+        if node["type"] == "CodeSnippet":
+            return node["name"]
+    
+    code_name = f"code-{len(knowledge_graph.nodes) + 1}"
+    knowledge_graph.add_node(
+        code_name,
+        "CodeSnippet",
+        {
+            "code": request.code,
+            "description": request.description,
+            "language": request.language,
+            FINGERPRINT_PROPERTY: fingerprint,
+        }
+    )
+    return code_name
+
+def find_stored_review(
+    knowledge_graph,
+    request: CodeReviewRequest,
+    reviewer: str,
+    model: str
+) -> Optional[CodeReviewResponse]:
+    """Find the latest stored review of identical code
+    
+    Snippets are matched by their fingerprint, so code that only differs in
+    formatting and comments counts as identical. Mock reviews are never
+    returned, as they are stored without a model.
+    
+    Args:
+        knowledge_graph: The knowledge graph instance
+        request: The code review request
+        reviewer: Name of the expert who wrote the review
+        model: Model that generated the review
+        
+    Returns:
+        The stored review, or None if there is none
+    """
+    fingerprint = code_fingerprint(request.code, request.language)
+    for snippet in reversed(knowledge_graph.get_nodes_by_fingerprint(fingerprint)):
+        reviews = knowledge_graph.get_related_nodes(snippet["name"], edge_type="reviews", direction="incoming")
+        for review in reversed(reviews):
+            properties = review["properties"]
+            if (
+                review["type"] == "CodeReview"
+                and properties.get("reviewer") == reviewer
+                and properties.get("model") == model
+            ):
+                return CodeReviewResponse(**properties)
+    return None
+
+def find_similar_snippets(
+    knowledge_graph,
+    code: str,
+    language: Optional[str] = None,
+    threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+    limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Find stored snippets that are near-duplicates of some code
+    
+    Args:
+        knowledge_graph: The knowledge graph instance
+        code: Code to find similar snippets for
+        language: Programming language of the code
+        threshold: Minimum estimated similarity, between 0 and 1
+        limit: Optional maximum number of snippets
+        
+    Returns:
+        The snippets, most similar first, each with its 'similarity' and
+        its 'reviews' in the order they were stored
+    """
+    snippets = knowledge_graph.find_similar_nodes(code, language, threshold=threshold, limit=limit)
+    for snippet in snippets:
+        reviews = knowledge_graph.get_related_nodes(snippet["name"], edge_type="reviews", direction="incoming")
+        snippet["reviews"] = [
+            {"name": review["name"], **review["properties"]}
+            for review in reviews
+            if review["type"] == "CodeReview"
+        ]
+    return snippets
+
+def find_prior_reviews(
+    knowledge_graph,
+    request: CodeReviewRequest,
+    reviewer: str,
+    limit: int = PRIOR_REVIEWS,
+    threshold: float = PRIOR_REVIEW_SIMILARITY
+) -> List[Dict[str, Any]]:
+    """Find an expert's earlier reviews of code similar to a request's
+    
+    Reviews of identical code are left out; those are reused as a whole
+    instead (see find_stored_review).
+    
+    Args:
+        knowledge_graph: The knowledge graph instance
+        request: The code review request
+        reviewer: Name of the expert who wrote the reviews
+        limit: Maximum number of reviews, at most one per snippet
+        threshold: Minimum estimated similarity of the code
+        
+    Returns:
+        The latest review of each similar snippet by the expert, most
+        similar first, with the 'similarity' of its code
+    """
+    if limit <= 0:
+        return []
+    
+    fingerprint = code_fingerprint(request.code, request.language)
+    prior_reviews = []
+    for snippet in find_similar_snippets(knowledge_graph, request.code, request.language, threshold):
+        if snippet["properties"].get(FINGERPRINT_PROPERTY) == fingerprint:
+            continue
+        for review in reversed(snippet["reviews"]):
+            if review.get("reviewer") == reviewer:
+                prior_reviews.append({"similarity": snippet["similarity"], **review})
+                break
+        if len(prior_reviews) >= limit:
+            break
+    return prior_reviews
+
 # Import and expose expert implementations
 from .martin_fowler import MartinFowlerExpert
 from .robert_c_martin import RobertCMartinExpert
+from .panel import ExpertPanel
+from .batch import BatchReviewer
 
 # Function to get all expert implementations
 def get_all_experts(knowledge_graph=None, ollama_service=None) -> List[ExpertInterface]:
@@ -0,0 +1,221 @@
+"""
+Batch Review Implementation
+"""
+
+from typing import Dict, List, Any, Optional, Callable, Awaitable, Tuple
+import anyio
+from experts import CodeReviewRequest, CodeReviewResponse, ExpertInterface, store_code_snippet
+from knowledge_graph import KnowledgeGraph
+from tracing import span
+
+# Default and maximum number of reviews generated at once for one batch
+DEFAULT_BATCH_CONCURRENCY = 4
+MAX_BATCH_CONCURRENCY = 32
+
+# Callback receiving each item result as soon as it is complete
+ResultCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+class BatchReviewer:
+    """
+    Batch variant of an expert's tool
+    Reviews many snippets in one call: reviews are generated by a bounded
+    pool of workers while a single writer stores the finished ones in the
+    knowledge graph, grouping whatever is ready into one graph batch
+    """
+
+    def __init__(self, expert: ExpertInterface, knowledge_graph: KnowledgeGraph):
+        """
+        Initialize the batch reviewer
+
+        Args:
+            expert: The expert reviewing the snippets
+            knowledge_graph: The knowledge graph instance
+        """
+        self.expert = expert
+        self.knowledge_graph = knowledge_graph
+
+    @property
+    def tool_name(self) -> str:
+        """Get the name of the batch tool"""
+        return f"{self.expert.tool_name}_batch"
+
+    @property
+    def tool_description(self) -> str:
+        """Get the description of the batch tool"""
+        return f"{self.expert.tool_description} (many snippets per call; results are streamed as log messages)"
+
+    @property
+    def input_schema(self) -> Dict[str, Any]:
+        """Get the input schema for the batch tool"""
+        item_schema = dict(self.expert.input_schema)
+        item_properties = dict(item_schema["properties"])
+        item_properties["priority"] = {**item_properties["priority"], "default": "batch"}
+        item_schema["properties"] = item_properties
+        return {
+            "type": "object",
+            "required": ["requests"],
+            "properties": {
+                "requests": {
+                    "type": "array",
+                    "items": item_schema,
+                    "description": "The code review requests"
+                },
+                "concurrency": {
+                    "type": "integer",
+                    "minimum": 1,
+                    "maximum": MAX_BATCH_CONCURRENCY,
+                    "description": "Maximum number of reviews generated at once",
+                    "default": DEFAULT_BATCH_CONCURRENCY
+                }
+            }
+        }
+
+    async def review_batch(
+        self,
+        requests: List[Dict[str, Any]],
+        concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+        on_result: Optional[ResultCallback] = None
+    ) -> Dict[str, Any]:
+        """
+        Review many snippets with the expert
+
+        A failing item is reported with its error and does not fail the batch.
+
+        Args:
+            requests: The code review requests, as tool arguments
+            concurrency: Maximum number of reviews generated at once
+            on_result: Optional callback notified with each item result as
+                soon as it is complete (including stored in the graph)
+
+        Returns:
+            The item results in request order, and the number of successes
+            and failures
+        """
+        concurrency = min(max(1, concurrency), MAX_BATCH_CONCURRENCY)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+        pending = iter(enumerate(requests))
+        send_stream, receive_stream = anyio.create_memory_object_stream(len(requests) or 1)
+
+        async def finish(index: int, result: Dict[str, Any]) -> None:
+            results[index] = result
+            if on_result:
+                await on_result(result)
+
+        async def worker(send_stream) -> None:
+            async with send_stream:
+                for index, arguments in pending:
+                    try:
+                        with span("review_item", index=index):
+                            request = CodeReviewRequest(**{"priority": "batch", **arguments})
+                            stored = self.expert.find_review(request)
+                            response = stored or await self.expert.generate_review(request)
+                    except Exception as e:
+                        await finish(index, self._error_result(index, e))
+                        continue
+
+                    # Stored reviews of identical code are already in the graph
+                    if request.storeInGraph and stored is None:
+                        await send_stream.send((index, request, response))
+                    else:
+                        await finish(index, self._review_result(index, response))
+
+        async def writer() -> None:
+            async with receive_stream:
+                async for item in receive_stream:
+                    # Store everything that is ready with a single write
+                    items = [item]
+                    while True:
+                        try:
+                            items.append(receive_stream.receive_nowait())
+                        except (anyio.WouldBlock, anyio.EndOfStream):
+                            break
+                    for index, result in self._store_reviews(items):
+                        await finish(index, result)
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(writer)
+            async with send_stream:
+                for _ in range(min(concurrency, len(requests))):
+                    tg.start_soon(worker, send_stream.clone())
+
+        succeeded = sum(1 for result in results if result and result["success"])
+        return {
+            "results": results,
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded
+        }
+
+    def _store_reviews(
+        self,
+        items: List[Tuple[int, CodeReviewRequest, CodeReviewResponse]]
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        Store finished reviews in the knowledge graph
+
+        All reviews are stored in one graph batch. If that fails they are
+        stored one by one, so only the failing items report an error.
+
+        Args:
+            items: Index, request and response of each review
+
+        Returns:
+            Index and result of each item
+        """
+        try:
+            with span("store_reviews", reviews=len(items)), self.knowledge_graph.batch():
+                for _, request, response in items:
+                    self._store_review(request, response)
+        except Exception as e:
+            print(f"Error storing {len(items)} reviews in the knowledge graph, storing them one by one: {e}")
+            return self._store_each(items)
+
+        return [(index, self._review_result(index, response)) for index, _, response in items]
+
+    def _store_each(
+        self,
+        items: List[Tuple[int, CodeReviewRequest, CodeReviewResponse]]
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        Store finished reviews in the knowledge graph one by one
+
+        Args:
+            items: Index, request and response of each review
+
+        Returns:
+            Index and result of each item
+        """
+        results = []
+        for index, request, response in items:
+            try:
+                with self.knowledge_graph.batch():
+                    self._store_review(request, response)
+            except Exception as e:
+                print(f"Error storing review {index} in the knowledge graph: {e}")
+                results.append((index, self._error_result(index, e)))
+            else:
+                results.append((index, self._review_result(index, response)))
+        return results
+
+    def _store_review(self, request: CodeReviewRequest, response: CodeReviewResponse) -> None:
+        """
+        Store one review and its code snippet
+
+        Args:
+            request: The code review request
+            response: The code review response
+        """
+        code_name = store_code_snippet(self.knowledge_graph, request)
+        self.expert.store_review(code_name, response)
+
+    @staticmethod
+    def _review_result(index: int, response: CodeReviewResponse) -> Dict[str, Any]:
+        """Build the result of a successful item"""
+        return {"index": index, "success": True, **response.model_dump()}
+
+    @staticmethod
+    def _error_result(index: int, error: Exception) -> Dict[str, Any]:
+        """Build the result of a failed item"""
+        result = {"index": index, "success": False, "error": str(error)}
+        if getattr(error, "retryable", False):
+            result["retryable"] = True
+        return result
@@ -0,0 +1,149 @@
+"""
+Expert Panel Implementation
+"""
+
+from contextlib import nullcontext
+from typing import Dict, List, Any, Optional
+import anyio
+from experts import CodeReviewRequest, CodeReviewResponse, ExpertInterface, ProgressCallback, store_code_snippet
+from knowledge_graph import KnowledgeGraph
+from tracing import span
+
+class ExpertPanel:
+    """
+    Panel of experts reviewing the same code
+    Sends one request to every expert concurrently, so the review takes as
+    long as the slowest expert instead of the sum of all of them
+    """
+
+    def __init__(self, experts: List[ExpertInterface], knowledge_graph: KnowledgeGraph, ollama_service=None):
+        """
+        Initialize the expert panel
+
+        Args:
+            experts: The experts on the panel
+            knowledge_graph: The knowledge graph instance
+            ollama_service: Optional Ollama service instance, used to share
+                the evaluation of the code between the experts' prompts
+        """
+        self.experts = experts
+        self.knowledge_graph = knowledge_graph
+        self.ollama_service = ollama_service
+
+    @property
+    def tool_name(self) -> str:
+        """Get the name of the tool for the panel"""
+        return "ask_panel"
+
+    @property
+    def tool_description(self) -> str:
+        """Get the description of the tool for the panel"""
+        names = ", ".join(expert.name for expert in self.experts)
+        return f"Ask all experts ({names}) to review your code at once"
+
+    @property
+    def input_schema(self) -> Dict[str, Any]:
+        """Get the input schema for the panel's tool"""
+        return {
+            "type": "object",
+            "required": ["code"],
+            "properties": {
+                "code": {
+                    "type": "string",
+                    "description": "The code to review"
+                },
+                "description": {
+                    "type": "string",
+                    "description": "Description of what the code does"
+                },
+                "language": {
+                    "type": "string",
+                    "description": "The programming language"
+                },
+                "storeInGraph": {
+                    "type": "boolean",
+                    "description": "Whether to store the code and all reviews in the knowledge graph",
+                    "default": True
+                },
+                "useCache": {
+                    "type": "boolean",
+                    "description": "Whether cached reviews of identical code may be returned",
+                    "default": True
+                },
+                "priority": {
+                    "type": "string",
+                    "enum": ["interactive", "batch"],
+                    "description": "Scheduling priority; use 'batch' for CI and other non-interactive callers",
+                    "default": "interactive"
+                }
+            }
+        }
+
+    async def review_code(
+        self,
+        request: CodeReviewRequest,
+        progress: Optional[ProgressCallback] = None
+    ) -> Dict[str, Any]:
+        """
+        Review code with every expert on the panel
+
+        Args:
+            request: The code review request
+            progress: Optional callback notified with the combined progress
+                of all experts
+
+        Returns:
+            The review of each expert and their average rating
+        """
+        # Experts that reviewed identical code before reuse their stored review
+        with span("find_stored_reviews"):
+            responses: List[Optional[CodeReviewResponse]] = [expert.find_review(request) for expert in self.experts]
+        reused = [response is not None for response in responses]
+        completed: List[float] = [0.0] * len(self.experts)
+        totals: List[float] = [0.0] * len(self.experts)
+
+        def expert_progress(index: int) -> Optional[ProgressCallback]:
+            if progress is None:
+                return None
+
+            async def report(value: float, total: Optional[float] = None) -> None:
+                completed[index] = value
+                totals[index] = total or 0.0
+                await progress(sum(completed), sum(totals) or None)
+
+            return report
+
+        async def review(index: int, expert: ExpertInterface) -> None:
+            with span("expert_review", expert=expert.name):
+                responses[index] = await expert.generate_review(request, expert_progress(index))
+
+        # All expert prompts start with the code, so have it evaluated only once
+        shared_prefix = nullcontext()
+        if reused.count(False) > 1 and self.ollama_service is not None:
+            shared_prefix = self.ollama_service.share_prompt_prefix(
+                request.code,
+                language=request.language,
+                description=request.description
+            )
+
+        async with shared_prefix, anyio.create_task_group() as tg:
+            for index, expert in enumerate(self.experts):
+                if not reused[index]:
+                    tg.start_soon(review, index, expert)
+
+        # Store the code once and link every new review to it with a single write
+        if request.storeInGraph and not all(reused):
+            with span("store_reviews"), self.knowledge_graph.batch():
+                code_name = store_code_snippet(self.knowledge_graph, request)
+                for expert, response, is_reused in zip(self.experts, responses, reused):
+                    if not is_reused:
+                        expert.store_review(code_name, response)
+
+        reviews = [
+            {"expert": expert.name, **response.model_dump()}
+            for expert, response in zip(self.experts, responses)
+        ]
+        return {
+            "reviews": reviews,
+            "averageRating": sum(review["rating"] for review in reviews) / len(reviews) if reviews else None
+        }
@@ -4,8 +4,9 @@ Robert C. Martin Expert Implementation
 
 from typing import Dict, List, Any, Optional
 import mcp.types as types
-from experts import CodeReviewRequest, CodeReviewResponse
+from experts import CodeReviewRequest, CodeReviewResponse, ProgressCallback, find_prior_reviews, find_stored_review, store_code_snippet
 from knowledge_graph import KnowledgeGraph
+from tracing import span
 
 class RobertCMartinExpert:
     """
@@ -67,94 +68,157 @@ class RobertCMartinExpert:
                     "type": "boolean",
                     "description": "Whether to store the review in the knowledge graph",
                     "default": True
+                },
+                "useCache": {
+                    "type": "boolean",
+                    "description": "Whether a cached review of identical code may be returned",
+                    "default": True
+                },
+                "priority": {
+                    "type": "string",
+                    "enum": ["interactive", "batch"],
+                    "description": "Scheduling priority; use 'batch' for CI and other non-interactive callers",
+                    "default": "interactive"
                 }
             }
         }
     
-    async def review_code(self, request: CodeReviewRequest) -> CodeReviewResponse:
+    async def review_code(
+        self,
+        request: CodeReviewRequest,
+        progress: Optional[ProgressCallback] = None
+    ) -> CodeReviewResponse:
         """
         Review code according to Robert C. Martin's Clean Code principles
         
         Args:
             request: The code review request
+            progress: Optional callback notified while the review is generated
+        
+        Returns:
+            The code review response
+        """
+        # Code reviewed before by this expert and model is not reviewed again
+        with span("find_stored_review"):
+            stored = self.find_review(request)
+        if stored is not None:
+            print("[RobertCMartinExpert] Reusing stored review of identical code")
+            return stored
+        
+        response = await self.generate_review(request, progress)
+        
+        # Store in knowledge graph if requested, with a single write
+        if request.storeInGraph:
+            with span("store_review"), self.knowledge_graph.batch():
+                code_name = store_code_snippet(self.knowledge_graph, request)
+                self.store_review(code_name, response)
+        
+        return response
+    
+    async def generate_review(
+        self,
+        request: CodeReviewRequest,
+        progress: Optional[ProgressCallback] = None
+    ) -> CodeReviewResponse:
+        """
+        Generate a review without storing it in the knowledge graph
+        
+        Args:
+            request: The code review request
+            progress: Optional callback notified while the review is generated
         
         Returns:
             The code review response
         """
         print(f"[RobertCMartinExpert] Reviewing code: {request.code[:50]}...")
         
+        # Earlier reviews of similar code keep the review consistent with them
+        with span("find_prior_reviews"):
+            prior_reviews = find_prior_reviews(self.knowledge_graph, request, self.name)
+        
         # Get review from Ollama
-        result = self.ollama_service.get_robert_c_martin_review(
+        result = await self.ollama_service.get_robert_c_martin_review(
             code=request.code,
             language=request.language,
-            description=request.description
+            description=request.description,
+            progress=progress,
+            use_cache=request.useCache,
+            priority=request.priority,
+            prior_reviews=prior_reviews
         )
         
         print(f"[RobertCMartinExpert] Review result: {result['rating']}/5")
         
         # Create response
-        response = CodeReviewResponse(
+        return CodeReviewResponse(
             review=result["review"],
             suggestions=result["suggestions"],
-            rating=result["rating"]
+            rating=result["rating"],
+            model=result.get("model")
         )
+    
+    def find_review(self, request: CodeReviewRequest) -> Optional[CodeReviewResponse]:
+        """
+        Find a stored review of identical code by this expert and the current model
         
-        # Store in knowledge graph if requested
-        if request.storeInGraph:
-            self._store_review_in_graph(request, response)
+        Args:
+            request: The code review request; nothing is returned if it
+                does not allow cached reviews
         
-        return response
+        Returns:
+            The stored review, or None if the code has to be reviewed
+        """
+        if not request.useCache:
+            return None
+        return find_stored_review(self.knowledge_graph, request, self.name, self.ollama_service.model)
     
-    def _store_review_in_graph(self, request: CodeReviewRequest, response: CodeReviewResponse) -> None:
+    def store_review(self, code_name: str, response: CodeReviewResponse) -> str:
         """
-        Store a code review in the knowledge graph
+        Store a code review in the knowledge graph and link it to its code snippet
         
         Args:
-            request: The code review request
+            code_name: Name of the stored CodeSnippet node that was reviewed
             response: The code review response
-        """
-        # Create code node
-        code_name = f"code-{len(self.knowledge_graph.nodes) + 1}"
-        self.knowledge_graph.add_node(
-            code_name,
-            "CodeSnippet",
-            {
-                "code": request.code,
-                "description": request.description,
-                "language": request.language,
-            }
-        )
         
-        # Create review node
-        review_name = f"bob-review-{len(self.knowledge_graph.nodes) + 1}"
-        self.knowledge_graph.add_node(
-            review_name,
-            "CodeReview",
-            {
-                "review": response.review,
-                "suggestions": response.suggestions,
-                "rating": response.rating,
-                "reviewer": self.name,
-            }
-        )
-        
-        # Ensure expert exists
-        expert_name = self.name
-        expert_node = self.knowledge_graph.get_node(expert_name)
-        if not expert_node:
+        Returns:
+            Name of the CodeReview node
+        """
+        # Persist all nodes and edges of the review with a single write,
+        # or none of them if anything fails
+        with self.knowledge_graph.batch():
+            # Create review node
+            review_name = f"bob-review-{len(self.knowledge_graph.nodes) + 1}"
             self.knowledge_graph.add_node(
-                expert_name,
-                "Expert",
+                review_name,
+                "CodeReview",
                 {
-                    "expertise": "Clean Code",
-                    "description": self.description
+                    "review": response.review,
+                    "suggestions": response.suggestions,
+                    "rating": response.rating,
+                    "reviewer": self.name,
+                    "model": response.model,
                 }
             )
         
-        # Add relationships
-        self.knowledge_graph.add_edge(
-            review_name, code_name, "reviews"
-        )
-        self.knowledge_graph.add_edge(
-            expert_name, review_name, "authored"
-        ) 
\ No newline at end of file
+            # Ensure expert exists
+            expert_name = self.name
+            expert_node = self.knowledge_graph.get_node(expert_name)
+            if not expert_node:
+                self.knowledge_graph.add_node(
+                    expert_name,
+                    "Expert",
+                    {
+                        "expertise": "Clean Code",
+                        "description": self.description
+                    }
+                )
+        
+            # Add relationships
+            self.knowledge_graph.add_edge(
+                review_name, code_name, "reviews"
+            )
+            self.knowledge_graph.add_edge(
+                expert_name, review_name, "authored"
+            )
+        
+        return review_name
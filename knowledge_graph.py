@@ -1,16 +1,246 @@
 """Knowledge Graph implementation for MCP Code Expert System.
 
 This module provides a simple graph database for storing code reviews,
-code snippets, and relationships between them.
+code snippets, and relationships between them. Graphs are stored either in
+a JSON file (KnowledgeGraph) or in a SQLite database (SQLiteKnowledgeGraph);
+open_knowledge_graph() picks the backend from the storage location.
 """
 
+import bisect
+import heapq
 import json
 import os
-from typing import Dict, List, Optional, Any, Set, Tuple, Union
+import re
+import sqlite3
+from collections.abc import Mapping, Sequence
+from contextlib import contextmanager, suppress
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Any, Set, Tuple, Union
 import datetime
 from uuid import uuid4
 from pathlib import Path
 
+from code_metrics import FINGERPRINT_VERSION, code_fingerprint
+from code_similarity import (
+    DEFAULT_SIMILARITY_THRESHOLD,
+    decode_signature,
+    encode_signature,
+    estimate_similarity,
+    lsh_keys,
+    minhash_signature,
+    signature_from_text,
+    signature_to_text,
+)
+from metrics import REGISTRY
+from tracing import span
+
+# Node property holding the code fingerprint that nodes are indexed by
+FINGERPRINT_PROPERTY = "fingerprint"
+
+# Type of the nodes whose code is indexed for near-duplicate search
+CODE_NODE_TYPE = "CodeSnippet"
+
+# Persistence modes supported by KnowledgeGraph
+PERSISTENCE_SNAPSHOT = "snapshot"
+PERSISTENCE_WAL = "wal"
+PERSISTENCE_MODES = (PERSISTENCE_SNAPSHOT, PERSISTENCE_WAL)
+
+# Number of log records after which the write-ahead log is compacted
+DEFAULT_COMPACT_THRESHOLD = 1000
+
+# Locations that select the SQLite storage backend
+SQLITE_URL_PREFIX = "sqlite:///"
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+# Pattern used to split node text into search terms
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Time spent writing changes to storage, exported at /metrics
+PERSIST_SECONDS = REGISTRY.histogram(
+    "knowledge_graph_persist_seconds",
+    "Duration of knowledge graph writes per backend and operation",
+    ["backend", "operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+
+
+@contextmanager
+def _persisting(backend: str, operation: str) -> Iterator[None]:
+    """Time a write to storage, for /metrics and the trace of the current request.
+
+    Args:
+        backend: Storage backend, 'json' or 'sqlite'
+        operation: Kind of write, e.g. 'snapshot' or 'commit'
+    """
+    with span("knowledge_graph.persist", backend=backend, operation=operation):
+        with PERSIST_SECONDS.time(backend=backend, operation=operation):
+            yield
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase search terms.
+    
+    Args:
+        text: Text to tokenize
+        
+    Returns:
+        List of terms in the order they appear
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def node_search_terms(name: str, node: Dict[str, Any]) -> Set[str]:
+    """Collect the search terms of a node.
+    
+    Args:
+        name: Node name
+        node: Node data
+        
+    Returns:
+        Terms from the node name and its string (or list of string) properties
+    """
+    terms = set(tokenize(name))
+    for value in node.get('properties', {}).values():
+        if isinstance(value, str):
+            terms.update(tokenize(value))
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, str):
+                    terms.update(tokenize(item))
+    return terms
+
+
+def parse_cursor(cursor: Optional[str]) -> int:
+    """Decode a pagination cursor into a node position.
+    
+    Args:
+        cursor: Cursor returned as next_cursor by a previous page, or None
+            for the first page
+        
+    Returns:
+        Position of the first node to return
+    """
+    if cursor is None or cursor == "":
+        return 0
+    try:
+        position = int(cursor)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if position < 0:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return position
+
+
+def parse_limit(limit: Optional[int]) -> Optional[int]:
+    """Validate the maximum number of nodes in a page.
+    
+    Args:
+        limit: Requested page size, or None for no limit
+        
+    Returns:
+        The page size
+        
+    Raises:
+        ValueError: If the limit is below 1, which would return empty pages
+            whose cursor never advances
+    """
+    if limit is not None and limit < 1:
+        raise ValueError(f"Invalid limit: {limit} (must be at least 1)")
+    return limit
+
+
+def project_node(node: Dict[str, Any], fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Keep only the requested fields of a node.
+    
+    Fields are top-level keys ('type', 'created_at', 'properties', ...) or
+    individual properties written as 'properties.<key>'. The node name is
+    always kept.
+    
+    Args:
+        node: Node data including its name
+        fields: Fields to keep, or None to keep everything
+        
+    Returns:
+        Projected node
+    """
+    if not fields:
+        return node
+        
+    projected = {'name': node.get('name')}
+    for field in fields:
+        if field.startswith('properties.'):
+            key = field[len('properties.'):]
+            properties = node.get('properties', {})
+            if key in properties:
+                projected.setdefault('properties', {})[key] = properties[key]
+        elif field in node:
+            projected[field] = node[field]
+    return projected
+
+
+def code_signature(node: Dict[str, Any]) -> Optional[List[int]]:
+    """Compute the MinHash signature of a code snippet node.
+    
+    Args:
+        node: Node data
+        
+    Returns:
+        The signature, or None if the node is not a code snippet with code
+    """
+    if node.get('type') != CODE_NODE_TYPE:
+        return None
+    properties = node.get('properties', {})
+    code = properties.get('code')
+    if not isinstance(code, str):
+        return None
+    return minhash_signature(code, properties.get('language'))
+
+
+def snippet_fingerprint(node: Dict[str, Any]) -> Optional[str]:
+    """Compute the fingerprint of a code snippet node.
+    
+    Args:
+        node: Node data
+        
+    Returns:
+        The fingerprint, or None if the node is not a code snippet with code
+    """
+    if node.get('type') != CODE_NODE_TYPE:
+        return None
+    properties = node.get('properties', {})
+    code = properties.get('code')
+    if not isinstance(code, str):
+        return None
+    return code_fingerprint(code, properties.get('language'))
+
+
+def rank_similar(
+    candidates: Iterator[Tuple[Dict[str, Any], List[int]]],
+    signature: List[int],
+    threshold: float,
+    limit: Optional[int]
+) -> List[Dict[str, Any]]:
+    """Keep the candidates similar enough to a signature, most similar first.
+    
+    Args:
+        candidates: Named nodes with their signatures, in insertion order
+        signature: Signature of the code searched for
+        threshold: Minimum estimated similarity
+        limit: Optional maximum number of results
+        
+    Returns:
+        Matching nodes with their estimated 'similarity'
+    """
+    matches = []
+    for node, candidate_signature in candidates:
+        similarity = estimate_similarity(signature, candidate_signature)
+        if similarity >= threshold:
+            matches.append({**node, 'similarity': round(similarity, 3)})
+            
+    # The sort is stable, so equally similar nodes stay in insertion order
+    matches.sort(key=lambda node: node['similarity'], reverse=True)
+    return matches[:limit] if limit is not None else matches
+
 
 class Entity:
     def __init__(
@@ -192,24 +422,87 @@ class KnowledgeGraphManager:
 
 
 class KnowledgeGraph:
-    """Simple in-memory graph database with JSON persistence."""
+    """Simple in-memory graph database with JSON persistence.
+
+    Two persistence modes are supported:
+
+    - ``snapshot``: every mutation rewrites the whole JSON file.
+    - ``wal``: every mutation appends a single JSON record to a write-ahead
+      log next to the JSON file (``<file_path>.log``). The log is compacted
+      into the JSON snapshot once it holds ``compact_threshold`` records.
+      On load the snapshot is read and the log tail is replayed on top of it.
+    """
 
-    def __init__(self, file_path: str = "data/knowledge_graph.json"):
+    def __init__(
+        self,
+        file_path: str = "data/knowledge_graph.json",
+        persistence: str = PERSISTENCE_SNAPSHOT,
+        compact_threshold: int = DEFAULT_COMPACT_THRESHOLD
+    ):
         """Initialize the knowledge graph.
         
         Args:
             file_path: Path to the JSON file for persistence
+            persistence: Persistence mode, either 'snapshot' or 'wal'
+            compact_threshold: Number of log records after which the
+                write-ahead log is compacted into the snapshot
         """
+        if persistence not in PERSISTENCE_MODES:
+            raise ValueError(
+                f"Unknown persistence mode: {persistence} "
+                f"(expected one of {', '.join(PERSISTENCE_MODES)})"
+            )
+            
         self.file_path = file_path
+        self.log_path = f"{file_path}.log"
+        self.persistence = persistence
+        self.compact_threshold = max(1, compact_threshold)
         self.nodes: Dict[str, Dict[str, Any]] = {}
         self.edges: List[Dict[str, Any]] = []
+        # Adjacency indexes: node name -> edge type -> positions in self.edges
+        self._outgoing: Dict[str, Dict[str, List[int]]] = {}
+        self._incoming: Dict[str, Dict[str, List[int]]] = {}
+        # Inverted full-text index: term -> node names (dict used as ordered set)
+        self._search_index: Dict[str, Dict[str, None]] = {}
+        # Node order: position -> name, name -> position, and the sorted
+        # positions of each node type. Positions are used as page cursors.
+        self._order: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._by_type: Dict[str, List[int]] = {}
+        # Fingerprint index: code fingerprint -> node names (dict used as ordered set)
+        self._by_fingerprint: Dict[str, Dict[str, None]] = {}
+        # Near-duplicate index: MinHash signature of each code snippet, and
+        # LSH bucket key -> snippet names (dict used as ordered set)
+        self._signatures: Dict[str, List[int]] = {}
+        self._lsh_buckets: Dict[int, Dict[str, None]] = {}
+        # Sequence number of the last applied mutation, used to skip log
+        # records that are already contained in the snapshot
+        self._seq = 0
+        self._log_records = 0
+        # Batch state: nesting depth, pending log records, and undo
+        # information (node name -> previous node, edge count at start)
+        self._batch_depth = 0
+        self._batch_records: List[Dict[str, Any]] = []
+        self._batch_undo: List[Tuple[str, Optional[Dict[str, Any]]]] = []
+        self._batch_edge_count = 0
         self.load()
 
     def load(self) -> None:
-        """Load the knowledge graph from the JSON file."""
+        """Load the knowledge graph from the JSON snapshot and replay the log."""
         # Create directory if it doesn't exist
         os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
         
+        self.nodes = {}
+        self.edges = []
+        self._search_index = {}
+        self._order = []
+        self._positions = {}
+        self._by_type = {}
+        self._signatures = {}
+        self._seq = 0
+        self._log_records = 0
+        fingerprint_version = 0
+        
         # Load the graph if the file exists
         if os.path.exists(self.file_path):
             try:
@@ -217,26 +510,489 @@ class KnowledgeGraph:
                     data = json.load(f)
                     self.nodes = data.get('nodes', {})
                     self.edges = data.get('edges', [])
+                    self._seq = data.get('seq', 0)
+                    fingerprint_version = data.get('fingerprint_version', 0)
+                    
+                    # Snapshots written before the index existed are indexed now
+                    if 'search_index' in data:
+                        self._search_index = {
+                            term: dict.fromkeys(names)
+                            for term, names in data['search_index'].items()
+                        }
+                    else:
+                        self._rebuild_search_index()
+                        
+                    # Likewise for the signatures of the near-duplicate index
+                    if 'signatures' in data:
+                        self._signatures = {
+                            name: signature_from_text(text)
+                            for name, text in data['signatures'].items()
+                        }
+                    else:
+                        self._compute_signatures()
             except (json.JSONDecodeError, IOError) as e:
                 print(f"Error loading knowledge graph: {e}")
                 # Initialize with empty graph on error
                 self.nodes = {}
                 self.edges = []
+                self._search_index = {}
+                self._signatures = {}
+                self._seq = 0
+                
+        # The node indexes must cover the snapshot before the log is
+        # replayed, since replayed mutations update them incrementally
+        self._rebuild_node_order()
+        self._rebuild_fingerprint_index()
+        self._rebuild_lsh_index()
+        
+        # Replay mutations that were logged after the last snapshot
+        replayed = True
+        if os.path.exists(self.log_path):
+            replayed = self._replay_log()
+            
+        self._rebuild_indexes()
+        
+        # Snippets stored with an older fingerprint scheme (or before there
+        # were fingerprints) are fingerprinted again; as this is not logged,
+        # a new snapshot is written
+        write_snapshot = False
+        if fingerprint_version < FINGERPRINT_VERSION and self.nodes:
+            self._backfill_fingerprints()
+            write_snapshot = True
+            
+        # A snapshot-mode graph never keeps a log around, and a torn log
+        # tail must be dropped before new records are appended after it
+        if os.path.exists(self.log_path):
+            if self.persistence == PERSISTENCE_SNAPSHOT or not replayed:
+                write_snapshot = True
+                
+        if write_snapshot:
+            self.save()
+
+    def _rebuild_indexes(self) -> None:
+        """Rebuild the adjacency indexes from the edge list."""
+        self._outgoing = {}
+        self._incoming = {}
+        for position, edge in enumerate(self.edges):
+            self._index_edge(position, edge)
+
+    def _rebuild_node_order(self) -> None:
+        """Rebuild the node position and type indexes from the nodes."""
+        self._order = []
+        self._positions = {}
+        self._by_type = {}
+        for name, node in self.nodes.items():
+            self._track_node(name, node)
+
+    def _rebuild_fingerprint_index(self) -> None:
+        """Rebuild the fingerprint index from the nodes."""
+        self._by_fingerprint = {}
+        for name, node in self.nodes.items():
+            self._index_fingerprint(name, node)
+
+    def _backfill_fingerprints(self) -> None:
+        """Fingerprint the code snippets with the current fingerprint scheme."""
+        for name, node in list(self.nodes.items()):
+            fingerprint = snippet_fingerprint(node)
+            properties = node.get('properties', {})
+            if fingerprint is not None and properties.get(FINGERPRINT_PROPERTY) != fingerprint:
+                self._set_node(name, {**node, 'properties': {**properties, FINGERPRINT_PROPERTY: fingerprint}})
+
+    def _index_fingerprint(self, name: str, node: Dict[str, Any]) -> None:
+        """Add a node to the fingerprint index if it has a fingerprint.
+        
+        Args:
+            name: Node name
+            node: Node data
+        """
+        fingerprint = node.get('properties', {}).get(FINGERPRINT_PROPERTY)
+        if fingerprint:
+            self._by_fingerprint.setdefault(fingerprint, {})[name] = None
+
+    def _unindex_fingerprint(self, name: str, node: Dict[str, Any]) -> None:
+        """Remove a node from the fingerprint index.
+        
+        Args:
+            name: Node name
+            node: Node data as it was indexed
+        """
+        fingerprint = node.get('properties', {}).get(FINGERPRINT_PROPERTY)
+        names = self._by_fingerprint.get(fingerprint)
+        if names is None:
+            return
+        names.pop(name, None)
+        if not names:
+            del self._by_fingerprint[fingerprint]
+
+    def _compute_signatures(self) -> None:
+        """Compute the MinHash signatures of all code snippets."""
+        self._signatures = {}
+        for name, node in self.nodes.items():
+            signature = code_signature(node)
+            if signature is not None:
+                self._signatures[name] = signature
+
+    def _rebuild_lsh_index(self) -> None:
+        """Rebuild the LSH buckets from the signatures."""
+        self._lsh_buckets = {}
+        for name in self._order:
+            signature = self._signatures.get(name)
+            if signature is not None:
+                for key in lsh_keys(signature):
+                    self._lsh_buckets.setdefault(key, {})[name] = None
+
+    def _index_code(self, name: str, node: Dict[str, Any]) -> None:
+        """Add a code snippet to the near-duplicate index.
+        
+        Args:
+            name: Node name
+            node: Node data; nodes that are no code snippets are ignored
+        """
+        signature = code_signature(node)
+        if signature is None:
+            return
+        self._signatures[name] = signature
+        for key in lsh_keys(signature):
+            self._lsh_buckets.setdefault(key, {})[name] = None
+
+    def _unindex_code(self, name: str) -> None:
+        """Remove a node from the near-duplicate index.
+        
+        Args:
+            name: Node name
+        """
+        signature = self._signatures.pop(name, None)
+        if signature is None:
+            return
+        for key in lsh_keys(signature):
+            names = self._lsh_buckets.get(key)
+            if names is None:
+                continue
+            names.pop(name, None)
+            if not names:
+                del self._lsh_buckets[key]
+
+    def _track_node(self, name: str, node: Dict[str, Any]) -> None:
+        """Give a new node the next position in the node order.
+        
+        Args:
+            name: Node name
+            node: Node data
+        """
+        position = len(self._order)
+        self._order.append(name)
+        self._positions[name] = position
+        self._by_type.setdefault(node.get('type'), []).append(position)
+
+    def _remove_node(self, name: str) -> None:
+        """Remove the most recently added node and its index entries.
+        
+        Args:
+            name: Node name, which must be the last one in the node order
+        """
+        node = self.nodes.pop(name)
+        self._unindex_node(name, node)
+        self._unindex_fingerprint(name, node)
+        self._unindex_code(name)
+        position = self._positions.pop(name)
+        self._order.pop()
+        positions = self._by_type.get(node.get('type'), [])
+        if positions and positions[-1] == position:
+            positions.pop()
+
+    def _rebuild_search_index(self) -> None:
+        """Rebuild the inverted full-text index from the nodes."""
+        self._search_index = {}
+        for name, node in self.nodes.items():
+            self._index_node(name, node)
+
+    def _set_node(self, name: str, node: Dict[str, Any]) -> None:
+        """Store a node and keep the full-text, fingerprint and code indexes in sync.
+        
+        Args:
+            name: Node name
+            node: Node data
+        """
+        previous = self.nodes.get(name)
+        if previous is not None:
+            self._unindex_node(name, previous)
+            self._unindex_fingerprint(name, previous)
+            self._unindex_code(name)
+            
+            # Re-added nodes keep their position but may change type
+            if previous.get('type') != node.get('type'):
+                position = self._positions[name]
+                self._by_type[previous.get('type')].remove(position)
+                bisect.insort(self._by_type.setdefault(node.get('type'), []), position)
+        else:
+            self._track_node(name, node)
+            
+        self.nodes[name] = node
+        self._index_node(name, node)
+        self._index_fingerprint(name, node)
+        self._index_code(name, node)
+
+    def _index_node(self, name: str, node: Dict[str, Any]) -> None:
+        """Add a node to the full-text index.
+        
+        Args:
+            name: Node name
+            node: Node data
+        """
+        for term in node_search_terms(name, node):
+            self._search_index.setdefault(term, {})[name] = None
+
+    def _unindex_node(self, name: str, node: Dict[str, Any]) -> None:
+        """Remove a node from the full-text index.
+        
+        Args:
+            name: Node name
+            node: Node data as it was indexed
+        """
+        for term in node_search_terms(name, node):
+            postings = self._search_index.get(term)
+            if postings is None:
+                continue
+            postings.pop(name, None)
+            if not postings:
+                del self._search_index[term]
+
+    def _index_edge(self, position: int, edge: Dict[str, Any]) -> None:
+        """Add an edge to the adjacency indexes.
+        
+        Args:
+            position: Position of the edge in self.edges
+            edge: Edge data
+        """
+        self._outgoing.setdefault(edge['source'], {}).setdefault(edge['type'], []).append(position)
+        self._incoming.setdefault(edge['target'], {}).setdefault(edge['type'], []).append(position)
+
+    def _unindex_edge(self, position: int, edge: Dict[str, Any]) -> None:
+        """Remove an edge from the adjacency indexes.
+        
+        Args:
+            position: Position the edge had in self.edges
+            edge: Edge data
+        """
+        for index, node_name in ((self._outgoing, edge['source']), (self._incoming, edge['target'])):
+            by_type = index.get(node_name, {})
+            positions = by_type.get(edge['type'], [])
+            if position in positions:
+                positions.remove(position)
+            if not positions:
+                by_type.pop(edge['type'], None)
+            if not by_type:
+                index.pop(node_name, None)
+
+    def _replay_log(self) -> bool:
+        """Apply the write-ahead log records on top of the loaded snapshot.
+        
+        Returns:
+            True if the whole log was replayed, False if it ended in a
+            truncated record
+        """
+        try:
+            with open(self.log_path, 'r') as f:
+                for line_number, line in enumerate(f, start=1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn write can only happen at the tail of the log
+                        print(f"Ignoring truncated knowledge graph log record at line {line_number}")
+                        return False
+                        
+                    self._log_records += 1
+                    if record.get('seq', 0) <= self._seq:
+                        continue
+                    self._apply(record)
+                    self._seq = record['seq']
+        except IOError as e:
+            print(f"Error replaying knowledge graph log: {e}")
+            
+        return True
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        """Apply a single mutation record to the in-memory graph.
+        
+        Args:
+            record: Mutation record as written to the log
+        """
+        op = record.get('op')
+        if op == 'add_node':
+            self._set_node(record['name'], record['node'])
+        elif op == 'add_edge':
+            self.edges.append(record['edge'])
+        elif op == 'clear':
+            self.nodes = {}
+            self.edges = []
+            self._search_index = {}
+            self._order = []
+            self._positions = {}
+            self._by_type = {}
+            self._by_fingerprint = {}
+            self._signatures = {}
+            self._lsh_buckets = {}
+        else:
+            print(f"Ignoring unknown knowledge graph log operation: {op}")
+
+    def _persist(self, record: Dict[str, Any]) -> None:
+        """Queue a mutation that has already been applied in memory.
+        
+        Mutations are always made inside a batch (single ones in a batch of
+        their own), and the record is written when the outermost batch exits.
+        
+        Args:
+            record: Mutation record describing the change
+        """
+        self._seq += 1
+        record['seq'] = self._seq
+        self._batch_records.append(record)
+
+    def _append_log(self, records: List[Dict[str, Any]]) -> None:
+        """Append mutation records to the write-ahead log.
+        
+        Args:
+            records: Mutation records to append
+            
+        Raises:
+            IOError: If the records could not be written; the log is left
+                as it was before
+        """
+        with _persisting(backend="json", operation="log"), open(self.log_path, 'a') as f:
+            offset = f.tell()
+            try:
+                f.write(''.join(json.dumps(record) + '\n' for record in records))
+                f.flush()
+            except IOError:
+                # Records appended after a torn one would never be replayed
+                with suppress(IOError):
+                    f.truncate(offset)
+                raise
+            
+        self._log_records += len(records)
+        if self._log_records >= self.compact_threshold:
+            try:
+                self.compact()
+            except IOError as e:
+                # The records are safe in the log, compaction is retried later
+                print(f"Error compacting knowledge graph log: {e}")
+
+    @contextmanager
+    def batch(self) -> Iterator['KnowledgeGraph']:
+        """Group several mutations into a single all-or-nothing write.
+        
+        Inside the block add_node and add_edge only change the in-memory
+        graph. When the outermost block exits normally the changes are
+        persisted with a single write; when it exits with an exception, or
+        the write fails, they are rolled back and the exception is raised.
+        Nested blocks join the outermost one.
+        
+        Example:
+            with knowledge_graph.batch():
+                knowledge_graph.add_node(...)
+                knowledge_graph.add_edge(...)
+        
+        Yields:
+            The knowledge graph itself
+        """
+        if self._batch_depth:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+            return
+            
+        self._batch_depth = 1
+        self._batch_records = []
+        self._batch_undo = []
+        self._batch_edge_count = len(self.edges)
+        try:
+            yield self
+            self._commit_batch()
+        except BaseException:
+            self._rollback_batch()
+            raise
+        finally:
+            self._batch_depth = 0
+            self._batch_records = []
+            self._batch_undo = []
+
+    def _commit_batch(self) -> None:
+        """Persist the mutations queued by the current batch."""
+        if not self._batch_records:
+            return
+            
+        if self.persistence == PERSISTENCE_WAL:
+            self._append_log(self._batch_records)
+        else:
+            self.save()
+
+    def _rollback_batch(self) -> None:
+        """Undo the in-memory mutations made by the current batch."""
+        # Edges were only appended, so drop them from the end
+        while len(self.edges) > self._batch_edge_count:
+            self._unindex_edge(len(self.edges) - 1, self.edges.pop())
+            
+        # Restore nodes in reverse order of modification
+        for name, previous in reversed(self._batch_undo):
+            if previous is None:
+                self._remove_node(name)
+            else:
+                self._set_node(name, previous)
+                
+        self._seq -= len(self._batch_records)
+
+    def compact(self) -> None:
+        """Fold the write-ahead log into the JSON snapshot."""
+        self.save()
 
     def save(self) -> None:
-        """Save the knowledge graph to the JSON file."""
+        """Save the knowledge graph to the JSON file and truncate the log."""
+        with _persisting(backend="json", operation="snapshot"):
+            self._save_snapshot()
+            
+    def _save_snapshot(self) -> None:
+        """Write the JSON snapshot and remove the log it contains.
+        
+        Raises:
+            IOError: If the snapshot could not be written; the previous
+                snapshot and log are left in place
+        """
+        # Ensure directory exists
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        
+        # Write to a temporary file first so a crash never leaves a
+        # half-written snapshot behind
+        tmp_path = f"{self.file_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'nodes': self.nodes,
+                'edges': self.edges,
+                'search_index': {
+                    term: list(names)
+                    for term, names in self._search_index.items()
+                },
+                'signatures': {
+                    name: signature_to_text(signature)
+                    for name, signature in self._signatures.items()
+                },
+                'seq': self._seq,
+                'fingerprint_version': FINGERPRINT_VERSION
+            }, f, indent=2)
+        os.replace(tmp_path, self.file_path)
+        
+        # Everything in the log is now part of the snapshot. A log that
+        # cannot be removed is harmless, as its records are skipped on load.
+        self._log_records = 0
         try:
-            # Ensure directory exists
-            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
-            
-            # Save to file
-            with open(self.file_path, 'w') as f:
-                json.dump({
-                    'nodes': self.nodes,
-                    'edges': self.edges
-                }, f, indent=2)
+            if os.path.exists(self.log_path):
+                os.remove(self.log_path)
         except IOError as e:
-            print(f"Error saving knowledge graph: {e}")
+            print(f"Error removing knowledge graph log: {e}")
 
     def add_node(self, name: str, node_type: str, properties: Dict[str, Any]) -> str:
         """Add a node to the graph.
@@ -250,12 +1006,15 @@ class KnowledgeGraph:
             Node name (identifier)
         """
         # Create node with metadata
-        self.nodes[name] = {
+        node = {
             'type': node_type,
-            'created_at': datetime.now().isoformat(),
+            'created_at': datetime.datetime.now().isoformat(),
             'properties': properties
         }
-        self.save()
+        with self.batch():
+            self._batch_undo.append((name, self.nodes.get(name)))
+            self._set_node(name, node)
+            self._persist({'op': 'add_node', 'name': name, 'node': node})
         return name
 
     def add_edge(self, source: str, target: str, edge_type: str, properties: Dict[str, Any] = None) -> None:
@@ -275,14 +1034,17 @@ class KnowledgeGraph:
             raise ValueError(f"Cannot create edge between non-existent nodes: {source} -> {target}")
             
         # Create edge with metadata
-        self.edges.append({
+        edge = {
             'source': source,
             'target': target,
             'type': edge_type,
-            'created_at': datetime.now().isoformat(),
+            'created_at': datetime.datetime.now().isoformat(),
             'properties': properties
-        })
-        self.save()
+        }
+        with self.batch():
+            self.edges.append(edge)
+            self._index_edge(len(self.edges) - 1, edge)
+            self._persist({'op': 'add_edge', 'edge': edge})
 
     def get_node(self, name: str) -> Optional[Dict[str, Any]]:
         """Get a node by name.
@@ -305,82 +1067,260 @@ class KnowledgeGraph:
             List of nodes
         """
         return [
-            {'name': name, **data}
-            for name, data in self.nodes.items()
-            if data.get('type') == node_type
+            {'name': self._order[position], **self.nodes[self._order[position]]}
+            for position in self._by_type.get(node_type, [])
+        ]
+
+    def get_nodes_by_fingerprint(self, fingerprint: str) -> List[Dict[str, Any]]:
+        """Get all nodes whose fingerprint property matches.
+        
+        Args:
+            fingerprint: Code fingerprint, see code_metrics.code_fingerprint
+            
+        Returns:
+            List of nodes, in the order they were added
+        """
+        names = self._by_fingerprint.get(fingerprint, {})
+        return [
+            {'name': name, **self.nodes[name]}
+            for name in sorted(names, key=self._positions.__getitem__)
         ]
 
-    def search_nodes(self, query: str) -> List[Dict[str, Any]]:
-        """Search for nodes by text in their properties.
+    def find_similar_nodes(
+        self,
+        code: str,
+        language: Optional[str] = None,
+        threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Find code snippets that are near-duplicates of some code.
+        
+        Only snippets sharing an LSH bucket with the code are compared, so
+        the cost depends on the number of similar snippets rather than on
+        the total number of snippets.
+        
+        Args:
+            code: Code to find similar snippets for
+            language: Programming language of the code
+            threshold: Minimum estimated Jaccard similarity of the token
+                shingles, between 0 and 1
+            limit: Optional maximum number of results
+            
+        Returns:
+            Matching CodeSnippet nodes with their estimated 'similarity',
+            most similar first
+            
+        Raises:
+            ValueError: If the limit is below 1
+        """
+        limit = parse_limit(limit)
+        signature = minhash_signature(code, language)
+        if signature is None:
+            return []
+            
+        names: Dict[str, None] = {}
+        for key in lsh_keys(signature):
+            names.update(self._lsh_buckets.get(key, {}))
+            
+        candidates = (
+            ({'name': name, **self.nodes[name]}, self._signatures[name])
+            for name in sorted(names, key=self._positions.__getitem__)
+        )
+        return rank_similar(candidates, signature, threshold, limit)
+
+    def search_nodes(self, query: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Search for nodes by text in their name and properties.
+        
+        The query is split into terms and a node matches when it contains
+        every term (AND semantics). Lookups go through the inverted index,
+        so the cost depends on the size of the matching posting lists rather
+        than on the amount of stored text.
         
         Args:
             query: Text to search for
+            limit: Optional maximum number of results
             
         Returns:
             List of matching nodes
         """
-        results = []
-        query = query.lower()
+        return self.get_nodes_page(query=query, limit=limit)[0]
+
+    def get_nodes_page(
+        self,
+        query: Optional[str] = None,
+        node_types: Optional[List[str]] = None,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Get a page of nodes in insertion order.
         
-        for name, data in self.nodes.items():
-            # Search in name
-            if query in name.lower():
-                results.append({'name': name, **data})
-                continue
+        Args:
+            query: Optional search query; nodes must contain every term.
+                None or "" does not filter, a query without terms matches
+                no node
+            node_types: Optional list of node types to keep
+            cursor: Cursor returned by the previous page, or None to start
+            limit: Optional maximum number of nodes in the page, at least 1
+            
+        Returns:
+            Tuple of the nodes in the page and the cursor of the next page
+            (None when there are no more nodes)
+            
+        Raises:
+            ValueError: If the cursor or the limit is invalid
+        """
+        limit = parse_limit(limit)
+        start = parse_cursor(cursor)
+        
+        page = []
+        for position in self._matching_positions(query, node_types, start):
+            if limit is not None and len(page) >= limit:
+                return page, str(position)
+            name = self._order[position]
+            page.append({'name': name, **self.nodes[name]})
+            
+        return page, None
+
+    def _matching_positions(
+        self,
+        query: Optional[str],
+        node_types: Optional[List[str]],
+        start: int
+    ) -> Iterator[int]:
+        """Iterate, in order, over the positions of nodes matching the filters.
+        
+        Args:
+            query: Optional search query
+            node_types: Optional list of node types to keep
+            start: First position to consider
+            
+        Returns:
+            Iterator of node positions
+        """
+        terms = set(tokenize(query)) if query else set()
+        
+        # A query without any term (e.g. only punctuation) matches nothing
+        if query and not terms:
+            return iter(())
+            
+        if terms:
+            postings = []
+            for term in terms:
+                term_postings = self._search_index.get(term)
+                if not term_postings:
+                    return iter(())
+                postings.append(term_postings)
                 
-            # Search in properties
-            props = data.get('properties', {})
-            for prop_value in props.values():
-                if isinstance(prop_value, str) and query in prop_value.lower():
-                    results.append({'name': name, **data})
-                    break
-                    
-        return results
+            # Drive the intersection from the shortest posting list
+            postings.sort(key=len)
+            shortest, others = postings[0], postings[1:]
+            positions = sorted(
+                self._positions[name] for name in shortest
+                if all(name in other for other in others)
+            )
+            if node_types:
+                types = set(node_types)
+                positions = [
+                    position for position in positions
+                    if self.nodes[self._order[position]].get('type') in types
+                ]
+            return iter(positions[bisect.bisect_left(positions, start):])
+            
+        if node_types:
+            # Merge the per-type position lists, each starting at the cursor
+            return heapq.merge(*(
+                islice(positions, bisect.bisect_left(positions, start), None)
+                for positions in (self._by_type.get(node_type, []) for node_type in set(node_types))
+            ))
+            
+        return iter(range(start, len(self._order)))
 
-    def get_related_nodes(self, node_name: str, edge_type: Optional[str] = None) -> List[Dict[str, Any]]:
+    def get_outgoing_edges(self, names: List[str]) -> List[Dict[str, Any]]:
+        """Get the edges leaving any of the given nodes, in insertion order.
+        
+        Args:
+            names: Node names
+            
+        Returns:
+            List of edges
+        """
+        positions = sorted(
+            position
+            for name in set(names)
+            for positions in self._outgoing.get(name, {}).values()
+            for position in positions
+        )
+        return [self.edges[position] for position in positions]
+
+    def get_related_nodes(
+        self,
+        node_name: str,
+        edge_type: Optional[str] = None,
+        direction: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
         """Get nodes related to a specific node.
         
+        Uses the adjacency indexes, so the cost is proportional to the
+        node's degree rather than to the total number of edges.
+        
         Args:
             node_name: Name of the node
             edge_type: Optional filter for edge type
+            direction: Optional filter, either 'outgoing' or 'incoming'
             
         Returns:
             List of related nodes
         """
+        positions: Set[int] = set()
+        if direction in (None, 'outgoing'):
+            positions.update(self._edge_positions(self._outgoing, node_name, edge_type))
+        if direction in (None, 'incoming'):
+            positions.update(self._edge_positions(self._incoming, node_name, edge_type))
+            
         related = []
         
-        # Find edges where the node is source or target
-        for edge in self.edges:
-            if edge['source'] == node_name:
-                if edge_type is None or edge['type'] == edge_type:
-                    target = edge['target']
-                    if target in self.nodes:
-                        related.append({
-                            'name': target, 
-                            **self.nodes[target],
-                            'relation': {
-                                'type': edge['type'],
-                                'direction': 'outgoing',
-                                'properties': edge.get('properties', {})
-                            }
-                        })
-                        
-            elif edge['target'] == node_name:
-                if edge_type is None or edge['type'] == edge_type:
-                    source = edge['source']
-                    if source in self.nodes:
-                        related.append({
-                            'name': source, 
-                            **self.nodes[source],
-                            'relation': {
-                                'type': edge['type'],
-                                'direction': 'incoming',
-                                'properties': edge.get('properties', {})
-                            }
-                        })
-                        
+        # Walk the matching edges in insertion order
+        for position in sorted(positions):
+            edge = self.edges[position]
+            if edge['source'] == node_name and direction != 'incoming':
+                other, edge_direction = edge['target'], 'outgoing'
+            else:
+                other, edge_direction = edge['source'], 'incoming'
+                
+            if other in self.nodes:
+                related.append({
+                    'name': other,
+                    **self.nodes[other],
+                    'relation': {
+                        'type': edge['type'],
+                        'direction': edge_direction,
+                        'properties': edge.get('properties', {})
+                    }
+                })
+                
         return related
 
+    def _edge_positions(
+        self,
+        index: Dict[str, Dict[str, List[int]]],
+        node_name: str,
+        edge_type: Optional[str] = None
+    ) -> List[int]:
+        """Look up edge positions for a node in an adjacency index.
+        
+        Args:
+            index: Outgoing or incoming adjacency index
+            node_name: Name of the node
+            edge_type: Optional filter for edge type
+            
+        Returns:
+            Positions of the matching edges in self.edges
+        """
+        by_type = index.get(node_name, {})
+        if edge_type is not None:
+            return by_type.get(edge_type, [])
+        return [position for positions in by_type.values() for position in positions]
+
     def get_all(self) -> Dict[str, Union[Dict[str, Any], List[Dict[str, Any]]]]:
         """Get the entire graph.
         
@@ -400,6 +1340,659 @@ class KnowledgeGraph:
 
     def clear(self) -> None:
         """Clear the graph."""
+        if self._batch_depth:
+            raise RuntimeError("Cannot clear the knowledge graph inside a batch")
+            
         self.nodes = {}
         self.edges = []
-        self.save() 
\ No newline at end of file
+        self._search_index = {}
+        self._order = []
+        self._positions = {}
+        self._by_type = {}
+        self._by_fingerprint = {}
+        self._signatures = {}
+        self._lsh_buckets = {}
+        self._outgoing = {}
+        self._incoming = {}
+        self._seq += 1
+        try:
+            self.save()
+        except IOError:
+            # Nothing was written, so the graph on disk is the one before
+            self.load()
+            raise
+
+
+class _SQLiteNodeView(Mapping):
+    """Read-only mapping of node name -> node data backed by SQLite."""
+
+    def __init__(self, graph: 'SQLiteKnowledgeGraph'):
+        self._graph = graph
+
+    def __getitem__(self, name: str) -> Dict[str, Any]:
+        node = self._graph.get_node(name)
+        if node is None:
+            raise KeyError(name)
+        return node
+
+    def __contains__(self, name: object) -> bool:
+        row = self._graph._conn.execute(
+            "SELECT 1 FROM nodes WHERE name = ?", (name,)
+        ).fetchone()
+        return row is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for (name,) in self._graph._conn.execute("SELECT name FROM nodes ORDER BY seq"):
+            yield name
+
+    def __len__(self) -> int:
+        return self._graph._conn.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+
+
+class _SQLiteEdgeView(Sequence):
+    """Read-only sequence of edges backed by SQLite."""
+
+    def __init__(self, graph: 'SQLiteKnowledgeGraph'):
+        self._graph = graph
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += len(self)
+        row = self._graph._conn.execute(
+            f"SELECT {SQLiteKnowledgeGraph.EDGE_COLUMNS} FROM edges ORDER BY seq LIMIT 1 OFFSET ?",
+            (index,)
+        ).fetchone()
+        if row is None:
+            raise IndexError(index)
+        return SQLiteKnowledgeGraph._edge_from_row(row)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        rows = self._graph._conn.execute(
+            f"SELECT {SQLiteKnowledgeGraph.EDGE_COLUMNS} FROM edges ORDER BY seq"
+        )
+        for row in rows:
+            yield SQLiteKnowledgeGraph._edge_from_row(row)
+
+    def __len__(self) -> int:
+        return self._graph._conn.execute("SELECT COUNT(*) FROM edges").fetchone()[0]
+
+
+class SQLiteKnowledgeGraph:
+    """Graph database stored in SQLite, with the same API as KnowledgeGraph.
+    
+    Nodes and edges live in indexed tables and are never loaded into memory
+    as a whole. Every mutation is an incremental write, and search_nodes is
+    served by an FTS5 index that uses the same tokenization as the JSON
+    backend. ``nodes`` and ``edges`` are read-only views over the tables.
+    """
+
+    NODE_COLUMNS = "name, type, created_at, properties"
+    EDGE_COLUMNS = "source, target, type, created_at, properties"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS nodes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            type TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            properties TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_nodes_type ON nodes (type, seq);
+        CREATE INDEX IF NOT EXISTS idx_nodes_fingerprint
+            ON nodes (json_extract(properties, '$.fingerprint'), seq)
+            WHERE json_extract(properties, '$.fingerprint') IS NOT NULL;
+        CREATE TABLE IF NOT EXISTS edges (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT NOT NULL,
+            target TEXT NOT NULL,
+            type TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            properties TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_edges_source ON edges (source, type, seq);
+        CREATE INDEX IF NOT EXISTS idx_edges_target ON edges (target, type, seq);
+        CREATE VIRTUAL TABLE IF NOT EXISTS nodes_fts USING fts5 (
+            terms, tokenize = "unicode61 tokenchars '_'"
+        );
+        CREATE TABLE IF NOT EXISTS code_signatures (
+            node_seq INTEGER PRIMARY KEY,
+            signature BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS code_lsh (
+            bucket INTEGER NOT NULL,
+            node_seq INTEGER NOT NULL,
+            PRIMARY KEY (bucket, node_seq)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_code_lsh_node ON code_lsh (node_seq);
+    """
+
+    def __init__(self, db_path: str = "data/knowledge_graph.db"):
+        """Initialize the knowledge graph.
+        
+        Args:
+            db_path: Path to the SQLite database file
+        """
+        self.db_path = db_path
+        self._batch_depth = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self.load()
+
+    @property
+    def nodes(self) -> Mapping:
+        """Read-only mapping of node name -> node data."""
+        return _SQLiteNodeView(self)
+
+    @property
+    def edges(self) -> Sequence:
+        """Read-only sequence of edges in insertion order."""
+        return _SQLiteEdgeView(self)
+
+    def load(self) -> None:
+        """Open the database and create the schema if needed."""
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            
+        if self._conn is not None:
+            self._conn.close()
+            
+        # Transactions are managed explicitly in batch()
+        self._conn = sqlite3.connect(self.db_path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._index_unsigned_code()
+        self._backfill_fingerprints()
+
+    def _index_unsigned_code(self) -> None:
+        """Add code snippets stored before the near-duplicate index existed to it."""
+        rows = self._conn.execute(
+            f"SELECT seq, {self.NODE_COLUMNS} FROM nodes WHERE type = ? "
+            "AND seq NOT IN (SELECT node_seq FROM code_signatures)",
+            (CODE_NODE_TYPE,)
+        ).fetchall()
+        if not rows:
+            return
+            
+        with self.batch():
+            for seq, *row in rows:
+                self._index_code(seq, self._node_from_row(row)[1])
+
+    def _backfill_fingerprints(self) -> None:
+        """Fingerprint code snippets stored with an older fingerprint scheme again.
+        
+        The fingerprint version of the stored snippets is kept in the
+        user_version of the database.
+        """
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] >= FINGERPRINT_VERSION:
+            return
+            
+        rows = self._conn.execute(
+            f"SELECT seq, {self.NODE_COLUMNS} FROM nodes WHERE type = ?", (CODE_NODE_TYPE,)
+        ).fetchall()
+        with self.batch():
+            for seq, *row in rows:
+                name, node = self._node_from_row(row)
+                fingerprint = snippet_fingerprint(node)
+                if fingerprint is None or node['properties'].get(FINGERPRINT_PROPERTY) == fingerprint:
+                    continue
+                node['properties'][FINGERPRINT_PROPERTY] = fingerprint
+                self._conn.execute(
+                    "UPDATE nodes SET properties = ? WHERE seq = ?",
+                    (json.dumps(node['properties']), seq)
+                )
+                self._index_terms(seq, name, node)
+            self._conn.execute(f"PRAGMA user_version = {FINGERPRINT_VERSION}")
+
+    def _index_terms(self, seq: int, name: str, node: Dict[str, Any]) -> None:
+        """Replace the full-text index entry of a node.
+        
+        Args:
+            seq: Sequence number of the node row
+            name: Node name
+            node: Node data
+        """
+        self._conn.execute("DELETE FROM nodes_fts WHERE rowid = ?", (seq,))
+        self._conn.execute(
+            "INSERT INTO nodes_fts (rowid, terms) VALUES (?, ?)",
+            (seq, ' '.join(sorted(node_search_terms(name, node))))
+        )
+
+    def _index_code(self, seq: int, node: Dict[str, Any]) -> None:
+        """Replace the near-duplicate index entries of a node.
+        
+        Args:
+            seq: Sequence number of the node row
+            node: Node data; nodes that are no code snippets are only removed
+        """
+        self._conn.execute("DELETE FROM code_signatures WHERE node_seq = ?", (seq,))
+        self._conn.execute("DELETE FROM code_lsh WHERE node_seq = ?", (seq,))
+        signature = code_signature(node)
+        if signature is None:
+            return
+        self._conn.execute(
+            "INSERT INTO code_signatures (node_seq, signature) VALUES (?, ?)",
+            (seq, encode_signature(signature))
+        )
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO code_lsh (bucket, node_seq) VALUES (?, ?)",
+            [(key, seq) for key in lsh_keys(signature)]
+        )
+
+    def save(self) -> None:
+        """Flush the database write-ahead log into the main database file."""
+        if not self._batch_depth:
+            with _persisting(backend="sqlite", operation="checkpoint"):
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def compact(self) -> None:
+        """Fold the database write-ahead log into the main database file."""
+        self.save()
+
+    def close(self) -> None:
+        """Close the database connection."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    @contextmanager
+    def batch(self) -> Iterator['SQLiteKnowledgeGraph']:
+        """Group several mutations into a single all-or-nothing transaction.
+        
+        Nested blocks join the outermost one, which commits on normal exit
+        and rolls back if an exception is raised.
+        
+        Yields:
+            The knowledge graph itself
+        """
+        if self._batch_depth:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+            return
+            
+        self._batch_depth = 1
+        self._conn.execute("BEGIN")
+        try:
+            yield self
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        else:
+            with _persisting(backend="sqlite", operation="commit"):
+                self._conn.execute("COMMIT")
+        finally:
+            self._batch_depth = 0
+
+    def add_node(self, name: str, node_type: str, properties: Dict[str, Any]) -> str:
+        """Add a node to the graph.
+        
+        Args:
+            name: Node name (unique identifier)
+            node_type: Type of node (e.g., 'code', 'review')
+            properties: Node properties
+            
+        Returns:
+            Node name (identifier)
+        """
+        node = {
+            'type': node_type,
+            'created_at': datetime.datetime.now().isoformat(),
+            'properties': properties
+        }
+        
+        with self.batch():
+            # Re-adding a node keeps its original position, like the JSON backend
+            self._conn.execute(
+                "INSERT INTO nodes (name, type, created_at, properties) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET type = excluded.type, "
+                "created_at = excluded.created_at, properties = excluded.properties",
+                (name, node_type, node['created_at'], json.dumps(properties))
+            )
+            seq = self._conn.execute("SELECT seq FROM nodes WHERE name = ?", (name,)).fetchone()[0]
+            self._index_terms(seq, name, node)
+            self._index_code(seq, node)
+        return name
+
+    def add_edge(self, source: str, target: str, edge_type: str, properties: Dict[str, Any] = None) -> None:
+        """Add an edge between two nodes.
+        
+        Args:
+            source: Source node name
+            target: Target node name
+            edge_type: Type of edge (e.g., 'reviewed_by')
+            properties: Edge properties
+        """
+        if properties is None:
+            properties = {}
+            
+        with self.batch():
+            # Check if nodes exist
+            if source not in self.nodes or target not in self.nodes:
+                raise ValueError(f"Cannot create edge between non-existent nodes: {source} -> {target}")
+                
+            self._conn.execute(
+                "INSERT INTO edges (source, target, type, created_at, properties) VALUES (?, ?, ?, ?, ?)",
+                (source, target, edge_type, datetime.datetime.now().isoformat(), json.dumps(properties))
+            )
+
+    def get_node(self, name: str) -> Optional[Dict[str, Any]]:
+        """Get a node by name.
+        
+        Args:
+            name: Node name
+            
+        Returns:
+            Node data or None if not found
+        """
+        row = self._conn.execute(
+            f"SELECT {self.NODE_COLUMNS} FROM nodes WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            return None
+        return self._node_from_row(row)[1]
+
+    def get_nodes_by_type(self, node_type: str) -> List[Dict[str, Any]]:
+        """Get all nodes of a specific type.
+        
+        Args:
+            node_type: Type of nodes to get
+            
+        Returns:
+            List of nodes
+        """
+        rows = self._conn.execute(
+            f"SELECT {self.NODE_COLUMNS} FROM nodes WHERE type = ? ORDER BY seq", (node_type,)
+        )
+        return [self._named_node_from_row(row) for row in rows]
+
+    def get_nodes_by_fingerprint(self, fingerprint: str) -> List[Dict[str, Any]]:
+        """Get all nodes whose fingerprint property matches.
+        
+        Args:
+            fingerprint: Code fingerprint, see code_metrics.code_fingerprint
+            
+        Returns:
+            List of nodes, in the order they were added
+        """
+        rows = self._conn.execute(
+            f"SELECT {self.NODE_COLUMNS} FROM nodes "
+            f"WHERE json_extract(properties, '$.{FINGERPRINT_PROPERTY}') = ? ORDER BY seq",
+            (fingerprint,)
+        )
+        return [self._named_node_from_row(row) for row in rows]
+
+    def find_similar_nodes(
+        self,
+        code: str,
+        language: Optional[str] = None,
+        threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Find code snippets that are near-duplicates of some code.
+        
+        Only snippets sharing an LSH bucket with the code are compared, so
+        the cost depends on the number of similar snippets rather than on
+        the total number of snippets.
+        
+        Args:
+            code: Code to find similar snippets for
+            language: Programming language of the code
+            threshold: Minimum estimated Jaccard similarity of the token
+                shingles, between 0 and 1
+            limit: Optional maximum number of results
+            
+        Returns:
+            Matching CodeSnippet nodes with their estimated 'similarity',
+            most similar first
+            
+        Raises:
+            ValueError: If the limit is below 1
+        """
+        limit = parse_limit(limit)
+        signature = minhash_signature(code, language)
+        if signature is None:
+            return []
+            
+        keys = lsh_keys(signature)
+        rows = self._conn.execute(
+            f"SELECT {self.NODE_COLUMNS}, signature FROM code_signatures "
+            "JOIN nodes ON nodes.seq = code_signatures.node_seq "
+            "WHERE node_seq IN (SELECT node_seq FROM code_lsh "
+            f"WHERE bucket IN ({', '.join('?' * len(keys))})) ORDER BY node_seq",
+            keys
+        )
+        candidates = (
+            (self._named_node_from_row(row[:-1]), decode_signature(row[-1]))
+            for row in rows
+        )
+        return rank_similar(candidates, signature, threshold, limit)
+
+    def search_nodes(self, query: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Search for nodes by text in their name and properties.
+        
+        A node matches when it contains every term of the query.
+        
+        Args:
+            query: Text to search for
+            limit: Optional maximum number of results
+            
+        Returns:
+            List of matching nodes
+        """
+        return self.get_nodes_page(query=query, limit=limit)[0]
+
+    def get_nodes_page(
+        self,
+        query: Optional[str] = None,
+        node_types: Optional[List[str]] = None,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Get a page of nodes in insertion order.
+        
+        Args:
+            query: Optional search query; nodes must contain every term.
+                None or "" does not filter, a query without terms matches
+                no node
+            node_types: Optional list of node types to keep
+            cursor: Cursor returned by the previous page, or None to start
+            limit: Optional maximum number of nodes in the page, at least 1
+            
+        Returns:
+            Tuple of the nodes in the page and the cursor of the next page
+            (None when there are no more nodes)
+            
+        Raises:
+            ValueError: If the cursor or the limit is invalid
+        """
+        limit = parse_limit(limit)
+        tables = "nodes n"
+        conditions = ["n.seq >= ?"]
+        params: List[Any] = [parse_cursor(cursor)]
+        
+        terms = sorted(set(tokenize(query))) if query else []
+        # A query without any term (e.g. only punctuation) matches nothing
+        if query and not terms:
+            return [], None
+        if terms:
+            tables = "nodes_fts JOIN nodes n ON n.seq = nodes_fts.rowid"
+            conditions.append("nodes_fts MATCH ?")
+            params.append(' '.join(f'"{term}"' for term in terms))
+            
+        if node_types:
+            conditions.append(f"n.type IN ({', '.join('?' for _ in node_types)})")
+            params.extend(node_types)
+            
+        # Fetch one extra row to find the cursor of the next page
+        params.append(-1 if limit is None else limit + 1)
+        rows = self._conn.execute(
+            "SELECT n.seq, n.name, n.type, n.created_at, n.properties "
+            f"FROM {tables} WHERE {' AND '.join(conditions)} ORDER BY n.seq LIMIT ?",
+            params
+        ).fetchall()
+        
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            next_cursor = str(rows[limit][0])
+            rows = rows[:limit]
+        return [self._named_node_from_row(row[1:]) for row in rows], next_cursor
+
+    def get_outgoing_edges(self, names: List[str]) -> List[Dict[str, Any]]:
+        """Get the edges leaving any of the given nodes, in insertion order.
+        
+        Args:
+            names: Node names
+            
+        Returns:
+            List of edges
+        """
+        names = list(set(names))
+        rows = []
+        # Stay below SQLite's limit on bound parameters
+        for offset in range(0, len(names), 500):
+            chunk = names[offset:offset + 500]
+            rows.extend(self._conn.execute(
+                f"SELECT seq, {self.EDGE_COLUMNS} FROM edges "
+                f"WHERE source IN ({', '.join('?' for _ in chunk)})",
+                chunk
+            ))
+        rows.sort(key=lambda row: row[0])
+        return [self._edge_from_row(row[1:]) for row in rows]
+
+    def get_related_nodes(
+        self,
+        node_name: str,
+        edge_type: Optional[str] = None,
+        direction: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Get nodes related to a specific node.
+        
+        Args:
+            node_name: Name of the node
+            edge_type: Optional filter for edge type
+            direction: Optional filter, either 'outgoing' or 'incoming'
+            
+        Returns:
+            List of related nodes
+        """
+        type_filter = "" if edge_type is None else " AND e.type = :edge_type"
+        queries = []
+        if direction in (None, 'outgoing'):
+            queries.append(
+                "SELECT e.seq, 'outgoing', e.type, e.properties, "
+                "n.name, n.type, n.created_at, n.properties "
+                "FROM edges e JOIN nodes n ON n.name = e.target "
+                f"WHERE e.source = :node{type_filter}"
+            )
+        if direction in (None, 'incoming'):
+            # Self-loops are reported once, as outgoing, unless only
+            # incoming edges were requested
+            loop_filter = "" if direction == 'incoming' else " AND e.source != :node"
+            queries.append(
+                "SELECT e.seq, 'incoming', e.type, e.properties, "
+                "n.name, n.type, n.created_at, n.properties "
+                "FROM edges e JOIN nodes n ON n.name = e.source "
+                f"WHERE e.target = :node{type_filter}{loop_filter}"
+            )
+        if not queries:
+            return []
+            
+        rows = self._conn.execute(
+            " UNION ALL ".join(queries) + " ORDER BY 1",
+            {'node': node_name, 'edge_type': edge_type}
+        )
+        
+        related = []
+        for _, edge_direction, relation_type, relation_properties, *node_row in rows:
+            related.append({
+                **self._named_node_from_row(node_row),
+                'relation': {
+                    'type': relation_type,
+                    'direction': edge_direction,
+                    'properties': json.loads(relation_properties)
+                }
+            })
+        return related
+
+    def get_all(self) -> Dict[str, Union[Dict[str, Any], List[Dict[str, Any]]]]:
+        """Get the entire graph.
+        
+        Returns:
+            Dictionary containing all nodes and edges
+        """
+        rows = self._conn.execute(f"SELECT {self.NODE_COLUMNS} FROM nodes ORDER BY seq")
+        return {
+            'nodes': [self._named_node_from_row(row) for row in rows],
+            'edges': list(self.edges)
+        }
+
+    def clear(self) -> None:
+        """Clear the graph."""
+        if self._batch_depth:
+            raise RuntimeError("Cannot clear the knowledge graph inside a batch")
+            
+        with self.batch():
+            self._conn.execute("DELETE FROM nodes")
+            self._conn.execute("DELETE FROM edges")
+            self._conn.execute("DELETE FROM nodes_fts")
+            self._conn.execute("DELETE FROM code_signatures")
+            self._conn.execute("DELETE FROM code_lsh")
+
+    @staticmethod
+    def _node_from_row(row: Sequence[Any]) -> Tuple[str, Dict[str, Any]]:
+        """Convert a (name, type, created_at, properties) row into node data."""
+        name, node_type, created_at, properties = row
+        return name, {
+            'type': node_type,
+            'created_at': created_at,
+            'properties': json.loads(properties)
+        }
+
+    @classmethod
+    def _named_node_from_row(cls, row: Sequence[Any]) -> Dict[str, Any]:
+        """Convert a node row into node data that includes the node name."""
+        name, data = cls._node_from_row(row)
+        return {'name': name, **data}
+
+    @staticmethod
+    def _edge_from_row(row: Sequence[Any]) -> Dict[str, Any]:
+        """Convert a (source, target, type, created_at, properties) row into edge data."""
+        source, target, edge_type, created_at, properties = row
+        return {
+            'source': source,
+            'target': target,
+            'type': edge_type,
+            'created_at': created_at,
+            'properties': json.loads(properties)
+        }
+
+
+def open_knowledge_graph(
+    location: str,
+    persistence: str = PERSISTENCE_SNAPSHOT,
+    compact_threshold: int = DEFAULT_COMPACT_THRESHOLD
+) -> Union[KnowledgeGraph, SQLiteKnowledgeGraph]:
+    """Open a knowledge graph with the storage backend implied by its location.
+    
+    ``sqlite:///relative/path.db`` and ``sqlite:////absolute/path.db`` URLs,
+    as well as plain paths ending in one of SQLITE_EXTENSIONS, select the
+    SQLite backend. Anything else is treated as a JSON file path.
+    
+    Args:
+        location: Storage URL or file path
+        persistence: Persistence mode for the JSON backend
+        compact_threshold: Log compaction threshold for the JSON backend
+        
+    Returns:
+        Knowledge graph instance
+    """
+    if location.startswith(SQLITE_URL_PREFIX):
+        return SQLiteKnowledgeGraph(location[len(SQLITE_URL_PREFIX):])
+    if location.lower().endswith(SQLITE_EXTENSIONS):
+        return SQLiteKnowledgeGraph(location)
+    return KnowledgeGraph(location, persistence=persistence, compact_threshold=compact_threshold)
@@ -4,13 +4,30 @@ This module provides a simple client for generating code reviews
 using Ollama's REST API.
 """
 
+import hashlib
 import json
+import math
 import os
 import random
-import requests
-from typing import Dict, Any, Optional, List, Union
+import sqlite3
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import anyio
+import httpx
+import numpy as np
+from typing import Dict, Any, Optional, List, Union, Callable, Awaitable
 from dotenv import load_dotenv
 
+from code_chunker import CodeChunk, split_code
+from code_metrics import (
+    COMPLEXITY_THRESHOLD, LENGTH_THRESHOLD, NESTING_THRESHOLD, PARAMETER_THRESHOLD,
+    get_code_metrics, hotspots, metrics_cache_stats, summarize_metrics
+)
+from metrics import REGISTRY
+from tracing import record_span, set_attribute, span
+
 # Load environment variables
 load_dotenv()
 
@@ -22,129 +39,1844 @@ DEFAULT_OLLAMA_MODEL = "llama3:8b"
 OLLAMA_HOST = os.environ.get("OLLAMA_HOST", DEFAULT_OLLAMA_HOST)
 OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", DEFAULT_OLLAMA_MODEL)
 
+# Comma-separated pool of Ollama hosts to balance generations across
+OLLAMA_HOSTS = [
+    host.strip()
+    for host in os.environ.get("OLLAMA_HOSTS", OLLAMA_HOST).split(",")
+    if host.strip()
+]
+
+# HTTP client configuration (timeouts in seconds)
+OLLAMA_TIMEOUT = float(os.environ.get("OLLAMA_TIMEOUT", "300"))
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_MAX_CONNECTIONS = int(os.environ.get("OLLAMA_MAX_CONNECTIONS", "10"))
+OLLAMA_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("OLLAMA_MAX_KEEPALIVE_CONNECTIONS", "5"))
+
+# Whether to consume Ollama's token stream instead of waiting for the full response
+OLLAMA_STREAM = os.environ.get("OLLAMA_STREAM", "true").lower() in ("1", "true", "yes")
+
+# Response cache configuration ("" disables the on-disk cache)
+OLLAMA_CACHE_PATH = os.environ.get("OLLAMA_CACHE_PATH", "data/ollama_cache.db")
+OLLAMA_CACHE_MAX_ENTRIES = int(os.environ.get("OLLAMA_CACHE_MAX_ENTRIES", "1000"))
+OLLAMA_CACHE_MAX_BYTES = int(os.environ.get("OLLAMA_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+OLLAMA_CACHE_TTL = float(os.environ.get("OLLAMA_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Health checking: probe timeout, re-probe interval while healthy and while
+# unhealthy (all in seconds), and consecutive failures that open the circuit
+OLLAMA_HEALTH_TIMEOUT = float(os.environ.get("OLLAMA_HEALTH_TIMEOUT", "2"))
+OLLAMA_HEALTH_INTERVAL = float(os.environ.get("OLLAMA_HEALTH_INTERVAL", "30"))
+OLLAMA_RETRY_INTERVAL = float(os.environ.get("OLLAMA_RETRY_INTERVAL", "5"))
+OLLAMA_FAILURE_THRESHOLD = int(os.environ.get("OLLAMA_FAILURE_THRESHOLD", "3"))
+
+# Hedged requests: when a generation has not produced its first token within
+# the given percentile of recent time-to-first-token, a duplicate is sent to
+# another host and the slower of the two is cancelled
+OLLAMA_HEDGE = os.environ.get("OLLAMA_HEDGE", "false").lower() in ("1", "true", "yes")
+OLLAMA_HEDGE_PERCENTILE = float(os.environ.get("OLLAMA_HEDGE_PERCENTILE", "95"))
+
+# Number of recent time-to-first-token samples kept, and needed before hedging
+TTFT_WINDOW = 200
+HEDGE_MIN_SAMPLES = 10
+
+# How long Ollama keeps the model, and with it the evaluated prompt prefix
+# cache, loaded after a request (Ollama duration string, e.g. "30m")
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+
+# Code larger than this many characters is split at function and class
+# boundaries and the parts are reviewed concurrently (0 disables chunking)
+OLLAMA_CHUNK_CHARS = int(os.environ.get("OLLAMA_CHUNK_CHARS", "12000"))
+
+# Embedding model and number of texts sent to Ollama's embed endpoint at once
+OLLAMA_EMBED_MODEL = os.environ.get("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+OLLAMA_EMBED_BATCH_SIZE = int(os.environ.get("OLLAMA_EMBED_BATCH_SIZE", "32"))
+
+# Maximum number of embeddings kept in memory by content hash
+EMBEDDING_CACHE_SIZE = 4096
+
+# Maximum length of an earlier review quoted in an expert prompt
+PRIOR_REVIEW_CHARS = 600
+
+# Generation scheduling: maximum concurrent requests sent to each Ollama host
+# (the pool admits as many as its available hosts can take) and maximum
+# number of requests waiting for a slot
+OLLAMA_MAX_IN_FLIGHT = int(os.environ.get("OLLAMA_MAX_IN_FLIGHT", "2"))
+OLLAMA_MAX_QUEUE_DEPTH = int(os.environ.get("OLLAMA_MAX_QUEUE_DEPTH", "32"))
+
+# Request priorities, highest first
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BATCH)
+
+# Expert identifiers used in cache keys
+EXPERT_MARTIN_FOWLER = "martin_fowler"
+EXPERT_ROBERT_C_MARTIN = "robert_c_martin"
+
+# Generation options
+TEMPERATURE = 0.7
+MAX_TOKENS = 1024
+
+# Callback receiving (progress, total) while a review is being generated
+ProgressCallback = Callable[[float, Optional[float]], Awaitable[None]]
+
+# Generation metrics, exported at /metrics
+GENERATION_SECONDS = REGISTRY.histogram(
+    "ollama_generation_seconds",
+    "Duration of generations per Ollama host and outcome",
+    ["host", "outcome"],
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+)
+TIME_TO_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "ollama_time_to_first_token_seconds",
+    "Time until Ollama returned the first token of a generation",
+    ["host"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+)
+GENERATED_TOKENS = REGISTRY.counter(
+    "ollama_generated_tokens_total",
+    "Tokens generated per Ollama host",
+    ["host"]
+)
+TOKENS_PER_SECOND = REGISTRY.histogram(
+    "ollama_tokens_per_second",
+    "Generation speed after the first token per Ollama host",
+    ["host"],
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200)
+)
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "ollama_queue_wait_seconds",
+    "Time requests waited for a generation slot",
+    ["priority"],
+    buckets=(0, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120)
+)
+
+
+class _JsonObjectScanner:
+    """Incrementally detect when a streamed text contains a complete JSON object."""
+
+    def __init__(self):
+        self.buffer: List[str] = []
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.start: Optional[int] = None
+        self.length = 0
+
+    def feed(self, text: str) -> List[str]:
+        """Consume a chunk of text.
+        
+        Args:
+            text: Next chunk of generated text
+            
+        Returns:
+            Top-level JSON objects completed by this chunk
+        """
+        self.buffer.append(text)
+        completed = []
+        for char in text:
+            position = self.length
+            self.length += 1
+            
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"' and self.depth > 0:
+                self.in_string = True
+            elif char == '{':
+                if self.depth == 0:
+                    self.start = position
+                self.depth += 1
+            elif char == '}' and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    completed.append(''.join(self.buffer)[self.start:position + 1])
+        return completed
+
+
+class ResponseCache:
+    """Cache of parsed reviews keyed by (model, expert, prompt hash).
+    
+    Entries live in an in-memory LRU and, when a path is given, in a SQLite
+    file that survives restarts. Both levels expire entries after ``ttl``
+    seconds; the disk level evicts least recently used entries once it
+    holds more than ``max_bytes`` of data.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = OLLAMA_CACHE_PATH,
+        max_entries: int = OLLAMA_CACHE_MAX_ENTRIES,
+        max_bytes: int = OLLAMA_CACHE_MAX_BYTES,
+        ttl: float = OLLAMA_CACHE_TTL
+    ):
+        """Initialize the cache.
+        
+        Args:
+            path: SQLite file for the on-disk cache, or None/"" for memory only
+            max_entries: Maximum number of entries kept in memory
+            max_bytes: Maximum size of the cached values on disk
+            ttl: Time to live of an entry, in seconds
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        
+        # The SQLite file is opened on first use, so that creating the
+        # service (e.g. when importing the server) does not touch the disk
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._opened = not path
+        self._disk_bytes = 0
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """Open the on-disk cache the first time it is needed.
+        
+        Returns:
+            Connection to the SQLite file, or None if the cache is memory only
+            or the file could not be opened
+        """
+        if self._opened:
+            return self._conn
+        self._opened = True
+        
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access);
+            """)
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+            self._disk_bytes = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+        except (sqlite3.Error, OSError) as e:
+            print(f"Response cache disabled on disk: {e}")
+            self._conn = None
+        return self._conn
+
+    @staticmethod
+    def make_key(model: str, expert: str, prompt: str) -> str:
+        """Build the cache key of a generation.
+        
+        Args:
+            model: Model name
+            expert: Expert identifier
+            prompt: Full prompt sent to the model
+            
+        Returns:
+            Cache key
+        """
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return f"{model}:{expert}:{prompt_hash}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached review.
+        
+        Args:
+            key: Cache key
+            
+        Returns:
+            Cached review or None on a miss
+        """
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            created_at, value = entry
+            if now - created_at < self.ttl:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return value
+            del self._memory[key]
+            
+        if self._connect() is not None:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] < self.ttl:
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                value = json.loads(row[0])
+                self._remember(key, row[1], value)
+                self.disk_hits += 1
+                return value
+                
+        self.misses += 1
+        return None
+
+    def contains(self, key: str) -> bool:
+        """Check whether a review is cached, without counting a hit or miss.
+        
+        Args:
+            key: Cache key
+            
+        Returns:
+            True if a fresh review is cached
+        """
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None and now - entry[0] < self.ttl:
+            return True
+            
+        if self._connect() is not None:
+            row = self._conn.execute(
+                "SELECT created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            return row is not None and now - row[0] < self.ttl
+            
+        return False
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store a review.
+        
+        Args:
+            key: Cache key
+            value: Parsed review
+        """
+        now = time.time()
+        self._remember(key, now, value)
+        
+        if self._connect() is None:
+            return
+            
+        data = json.dumps(value)
+        try:
+            previous = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now)
+            )
+            self._disk_bytes += len(data) - (previous[0] if previous else 0)
+            self._evict_disk()
+        except sqlite3.Error as e:
+            print(f"Error writing response cache: {e}")
+
+    def _remember(self, key: str, created_at: float, value: Dict[str, Any]) -> None:
+        """Insert an entry into the in-memory LRU."""
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self) -> None:
+        """Drop least recently used entries until the disk cache fits max_bytes."""
+        while self._disk_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT 100"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                return
+            for key, size in rows:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._disk_bytes -= size
+                if self._disk_bytes <= self.max_bytes:
+                    return
+
+    def clear(self) -> None:
+        """Remove every cached entry."""
+        self._memory.clear()
+        if self._connect() is not None:
+            self._conn.execute("DELETE FROM responses")
+        self._disk_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and cache sizes.
+        
+        Returns:
+            Dictionary of cache statistics
+        """
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_bytes": self._disk_bytes
+        }
+
+
+class OllamaHost:
+    """Health state of an Ollama host, tracked as a circuit breaker.
+    
+    The host starts in the 'unknown' state and is used optimistically until
+    the first probe answers. Failed probes, or ``failure_threshold``
+    consecutive failed generations, mark it 'unhealthy' (circuit open):
+    requests then skip it, except for one trial request per
+    ``retry_interval`` in case no background probe is running. A successful
+    probe or generation marks it 'healthy' again.
+    
+    The number of outstanding requests and a moving average of generation
+    latency are tracked for load balancing across hosts, and at most
+    ``max_in_flight`` requests are sent to the host at once.
+    """
+
+    STATE_UNKNOWN = "unknown"
+    STATE_HEALTHY = "healthy"
+    STATE_UNHEALTHY = "unhealthy"
+    
+    # Weight of the newest sample in the latency moving average
+    LATENCY_SMOOTHING = 0.3
+
+    def __init__(
+        self,
+        url: str,
+        failure_threshold: int = OLLAMA_FAILURE_THRESHOLD,
+        retry_interval: float = OLLAMA_RETRY_INTERVAL,
+        max_in_flight: int = OLLAMA_MAX_IN_FLIGHT
+    ):
+        """Initialize the host state.
+        
+        Args:
+            url: Base URL of the Ollama API
+            failure_threshold: Consecutive generation failures that open the circuit
+            retry_interval: Seconds after which an open circuit lets a trial
+                request through
+            max_in_flight: Maximum number of requests sent to the host at once
+        """
+        self.url = url
+        self.max_in_flight = max(1, max_in_flight)
+        self.failure_threshold = max(1, failure_threshold)
+        self.retry_interval = retry_interval
+        self.state = self.STATE_UNKNOWN
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self.last_checked: Optional[float] = None
+        self.outstanding = 0
+        self.latency: Optional[float] = None
+        self.requests = 0
+        self.failures = 0
+        self._opened_at = 0.0
+
+    @property
+    def is_available(self) -> bool:
+        """Whether requests may currently be sent to this host."""
+        if self.state != self.STATE_UNHEALTHY:
+            return True
+        # Half-open: let a trial request through
+        return time.monotonic() - self._opened_at >= self.retry_interval
+
+    @property
+    def has_capacity(self) -> bool:
+        """Whether the host can take another request without exceeding its limit."""
+        return self.outstanding < self.max_in_flight
+
+    def start_request(self) -> None:
+        """Record that a generation was sent to this host."""
+        self.outstanding += 1
+        self.requests += 1
+        if self.state == self.STATE_UNHEALTHY:
+            # The trial request uses up the retry interval
+            self._opened_at = time.monotonic()
+
+    def finish_request(self) -> None:
+        """Record that a generation sent to this host has ended."""
+        self.outstanding -= 1
+
+    def record_success(self, latency: Optional[float] = None) -> None:
+        """Record a successful probe or generation.
+        
+        Args:
+            latency: Duration of the generation in seconds, if any
+        """
+        if self.state != self.STATE_HEALTHY:
+            print(f"Ollama service available at {self.url}")
+        self.state = self.STATE_HEALTHY
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.last_checked = time.time()
+        if latency is not None:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.LATENCY_SMOOTHING * (latency - self.latency)
+
+    def record_failure(self, error: BaseException, probe: bool = False) -> None:
+        """Record a failed probe or generation.
+        
+        Args:
+            error: The error that occurred
+            probe: Whether the failure comes from a health probe, which
+                opens the circuit immediately
+        """
+        self.consecutive_failures += 1
+        if not probe:
+            self.failures += 1
+        self.last_error = str(error) or type(error).__name__
+        self.last_checked = time.time()
+        if probe or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.STATE_UNHEALTHY:
+                print(f"Ollama service not available at {self.url}: {self.last_error}")
+            self.state = self.STATE_UNHEALTHY
+            self._opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the health state of the host.
+        
+        Returns:
+            Dictionary describing the host state
+        """
+        return {
+            "url": self.url,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "last_checked": self.last_checked,
+            "outstanding": self.outstanding,
+            "max_in_flight": self.max_in_flight,
+            "latency": self.latency,
+            "requests": self.requests,
+            "failures": self.failures
+        }
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the generation queue is full; the request can be retried later."""
+
+    retryable = True
+
+
+class EmbeddingError(RuntimeError):
+    """Raised when texts cannot be embedded because no Ollama host answers."""
+
+    retryable = True
+
+
+class GenerationScheduler:
+    """Admission control in front of Ollama generations.
+    
+    At most ``max_in_flight`` generations run at once, or fewer when the
+    ``capacity`` of the Ollama hosts that are currently available is lower,
+    so losing a host does not pile its share onto the others. Further
+    requests wait in one FIFO queue per priority, and interactive requests are always
+    served before batch ones. When ``max_queue_depth`` requests are already
+    waiting, new ones are rejected immediately with QueueFullError instead
+    of piling up inside Ollama.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = OLLAMA_MAX_IN_FLIGHT,
+        max_queue_depth: int = OLLAMA_MAX_QUEUE_DEPTH,
+        capacity: Optional[Callable[[], int]] = None
+    ):
+        """Initialize the scheduler.
+        
+        Args:
+            max_in_flight: Maximum number of concurrent generations
+            max_queue_depth: Maximum number of waiting requests
+            capacity: Optional function returning how many generations the
+                available Ollama hosts can take right now
+        """
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue_depth = max(0, max_queue_depth)
+        self.capacity = capacity
+        self.in_flight = 0
+        self._queues: Dict[str, deque] = {priority: deque() for priority in PRIORITIES}
+        self.admitted = 0
+        self.rejected = 0
+        self._waits: Dict[str, Dict[str, float]] = {
+            priority: {"count": 0, "total": 0.0, "max": 0.0} for priority in PRIORITIES
+        }
+
+    @property
+    def limit(self) -> int:
+        """Number of generations that may currently run at once.
+        
+        It never drops below one, so a request still reaches a host that is
+        only open for a trial request, or the fallback review.
+        """
+        if self.capacity is None:
+            return self.max_in_flight
+        return max(1, min(self.max_in_flight, self.capacity()))
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of requests waiting for a slot."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    @asynccontextmanager
+    async def slot(self, priority: str = PRIORITY_INTERACTIVE):
+        """Hold a generation slot for the duration of the block.
+        
+        Args:
+            priority: Request priority, one of PRIORITIES
+            
+        Raises:
+            QueueFullError: If the queue is full
+        """
+        with span("ollama.queue_wait", priority=priority):
+            await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority: str = PRIORITY_INTERACTIVE) -> None:
+        """Wait for a generation slot.
+        
+        Args:
+            priority: Request priority, one of PRIORITIES
+            
+        Raises:
+            QueueFullError: If the queue is full
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority: {priority} (expected one of {', '.join(PRIORITIES)})")
+            
+        started = time.monotonic()
+        if self.in_flight < self.limit and not self.queue_depth:
+            self.in_flight += 1
+            self._record_admission(priority, 0.0)
+            return
+            
+        if self.queue_depth >= self.max_queue_depth:
+            self.rejected += 1
+            raise QueueFullError(
+                f"Review queue is full ({self.queue_depth} requests waiting), retry later"
+            )
+            
+        granted = anyio.Event()
+        self._queues[priority].append(granted)
+        try:
+            await granted.wait()
+        except BaseException:
+            if granted.is_set():
+                # The slot was handed over just before cancellation
+                self.release()
+            else:
+                self._queues[priority].remove(granted)
+            raise
+            
+        self._record_admission(priority, time.monotonic() - started)
+
+    def try_acquire(self) -> bool:
+        """Take a generation slot only if one is free right now.
+        
+        Returns:
+            True if a slot was taken and must be released
+        """
+        if self.in_flight < self.limit and not self.queue_depth:
+            self.in_flight += 1
+            return True
+        return False
+
+    def release(self) -> None:
+        """Release a slot and admit as many waiting requests as the limit allows.
+        
+        The limit is checked again rather than handing the slot over, as it
+        shrinks and grows with the number of available hosts.
+        """
+        self.in_flight -= 1
+        while self.in_flight < self.limit:
+            queue = next((self._queues[p] for p in PRIORITIES if self._queues[p]), None)
+            if queue is None:
+                return
+            queue.popleft().set()
+            self.in_flight += 1
+
+    def _record_admission(self, priority: str, waited: float) -> None:
+        """Update the admission and wait time counters."""
+        self.admitted += 1
+        QUEUE_WAIT_SECONDS.observe(waited, priority=priority)
+        waits = self._waits[priority]
+        waits["count"] += 1
+        waits["total"] += waited
+        waits["max"] = max(waits["max"], waited)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get queue depth, wait time and admission counters.
+        
+        Returns:
+            Dictionary of scheduler statistics
+        """
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.limit,
+            "queue_depth": {priority: len(queue) for priority, queue in self._queues.items()},
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_seconds": {
+                priority: {
+                    "count": waits["count"],
+                    "avg": waits["total"] / waits["count"] if waits["count"] else 0.0,
+                    "max": waits["max"]
+                }
+                for priority, waits in self._waits.items()
+            }
+        }
+
+
+class _Flight:
+    """A generation in progress that concurrent identical requests can wait for."""
+
+    def __init__(self):
+        self.done = anyio.Event()
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+
+
+class _PrefixGroup:
+    """Reviews of the same code by several experts, sharing their prompt prefix."""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        # Set once a review took on priming the prefix, then when it is done
+        self.claimed = False
+        self.primed = anyio.Event()
+        # Host that evaluated the prefix, None if priming failed
+        self.host: Optional["OllamaHost"] = None
+
+
+# Prompt prefix shared by the reviews started in this context
+_prefix_group: ContextVar[Optional[_PrefixGroup]] = ContextVar("prefix_group", default=None)
+
 
 class OllamaService:
     """Client for interacting with Ollama API."""
 
-    def __init__(self, host: str = OLLAMA_HOST, model: str = OLLAMA_MODEL):
-        """Initialize the Ollama service.
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        model: str = OLLAMA_MODEL,
+        timeout: float = OLLAMA_TIMEOUT,
+        connect_timeout: float = OLLAMA_CONNECT_TIMEOUT,
+        max_connections: int = OLLAMA_MAX_CONNECTIONS,
+        max_keepalive_connections: int = OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+        stream: bool = OLLAMA_STREAM,
+        cache: Optional[ResponseCache] = None,
+        scheduler: Optional[GenerationScheduler] = None,
+        health_timeout: float = OLLAMA_HEALTH_TIMEOUT,
+        health_interval: float = OLLAMA_HEALTH_INTERVAL,
+        hosts: Optional[List[str]] = None,
+        max_in_flight: int = OLLAMA_MAX_IN_FLIGHT,
+        hedge: bool = OLLAMA_HEDGE,
+        hedge_percentile: float = OLLAMA_HEDGE_PERCENTILE,
+        chunk_chars: int = OLLAMA_CHUNK_CHARS,
+        keep_alive: str = OLLAMA_KEEP_ALIVE,
+        embed_model: str = OLLAMA_EMBED_MODEL,
+        embed_batch_size: int = OLLAMA_EMBED_BATCH_SIZE
+    ):
+        """Initialize the Ollama service.
+        
+        Args:
+            host: Ollama API host, used when hosts is not given
+            model: Model to use for generation
+            timeout: Timeout for reading a generation, in seconds
+            connect_timeout: Timeout for connecting to Ollama, in seconds
+            max_connections: Maximum number of concurrent connections
+            max_keepalive_connections: Maximum number of idle connections
+                kept open for reuse
+            stream: Whether to consume the generation as a token stream
+            cache: Response cache, created from the OLLAMA_CACHE_* settings
+                when not given
+            scheduler: Generation scheduler, created from the
+                OLLAMA_MAX_IN_FLIGHT/OLLAMA_MAX_QUEUE_DEPTH settings when
+                not given
+            health_timeout: Timeout of a health probe, in seconds
+            health_interval: Seconds between probes of a healthy host
+            hosts: Pool of Ollama API hosts to balance generations across;
+                defaults to the OLLAMA_HOSTS setting when neither host nor
+                hosts is given
+            max_in_flight: Maximum number of concurrent requests sent to
+                each host
+            hedge: Whether to hedge slow generations on a second host
+            hedge_percentile: Percentile of recent time-to-first-token after
+                which a generation is hedged
+            chunk_chars: Size in characters above which code is reviewed in
+                chunks, or 0 to always review it at once
+            keep_alive: How long Ollama keeps the model loaded after a request
+            embed_model: Model to use for embeddings
+            embed_batch_size: Number of texts embedded per request
+        """
+        if hosts is None:
+            hosts = [host] if host else OLLAMA_HOSTS
+        if not hosts:
+            raise ValueError("At least one Ollama host is required")
+        self.hosts = [OllamaHost(url.rstrip("/"), max_in_flight=max_in_flight) for url in hosts]
+        self.host = self.hosts[0].url
+        self.model = model
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        )
+        self.stream = stream
+        self.cache = cache if cache is not None else ResponseCache()
+        self.scheduler = scheduler if scheduler is not None else GenerationScheduler(
+            max_in_flight=max_in_flight * len(self.hosts),
+            capacity=self._available_capacity
+        )
+        # Set (and replaced) whenever a request to a host ends
+        self._host_freed = anyio.Event()
+        # In-flight generations by request key, for single-flight coalescing
+        self._flights: Dict[str, _Flight] = {}
+        self.coalesced_requests = 0
+        self.health_timeout = health_timeout
+        self.health_interval = health_interval
+        self._health_wakeups = {h.url: anyio.Event() for h in self.hosts}
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedged_requests = 0
+        self.hedge_wins = 0
+        # Recent times to first token (or to the full response when not
+        # streaming), in seconds
+        self._ttft_samples: deque = deque(maxlen=TTFT_WINDOW)
+        self.chunk_chars = chunk_chars
+        self.keep_alive = keep_alive
+        self.primed_prefixes = 0
+        self.embed_model = embed_model
+        self.embed_batch_size = max(1, embed_batch_size)
+        # Embeddings by hash of model and text, least recently used first
+        self._embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._embedding_stats = {"requests": 0, "embedded": 0, "hits": 0}
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def is_available(self) -> bool:
+        """Whether generations are currently sent to Ollama."""
+        return any(h.is_available for h in self.hosts)
+
+    def _available_capacity(self) -> int:
+        """Number of requests the currently available hosts can take at once."""
+        return sum(h.max_in_flight for h in self.hosts if h.is_available)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared HTTP client whose connection pool is reused across requests."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    async def aclose(self) -> None:
+        """Close the shared HTTP client and its pooled connections."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _check_availability(self, host: OllamaHost) -> bool:
+        """Probe an Ollama host and update its health state.
+        
+        Args:
+            host: Host to probe
+            
+        Returns:
+            True if the host is available, False otherwise
+        """
+        try:
+            response = await self.client.get(f"{host.url}/api/tags", timeout=self.health_timeout)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            host.record_failure(e, probe=True)
+            return False
+            
+        host.record_success()
+        return True
+
+    async def run_health_checks(self) -> None:
+        """Probe all Ollama hosts in the background for as long as the task runs.
+        
+        Healthy hosts are re-probed every health_interval seconds, unhealthy
+        ones every retry_interval seconds, and a failed generation triggers
+        an immediate re-probe of its host.
+        """
+        async with anyio.create_task_group() as tg:
+            for host in self.hosts:
+                tg.start_soon(self._monitor_host, host)
+
+    async def _monitor_host(self, host: OllamaHost) -> None:
+        """Probe one Ollama host periodically.
+        
+        Args:
+            host: Host to probe
+        """
+        while True:
+            healthy = await self._check_availability(host)
+            interval = self.health_interval if healthy else host.retry_interval
+            with anyio.move_on_after(interval):
+                await self._health_wakeups[host.url].wait()
+            self._health_wakeups[host.url] = anyio.Event()
+
+    def request_health_check(self, host: Optional[OllamaHost] = None) -> None:
+        """Ask the background health check to probe right away.
+        
+        Args:
+            host: Host to probe; all hosts when not given
+        """
+        for h in [host] if host is not None else self.hosts:
+            self._health_wakeups[h.url].set()
+
+    def _select_host(
+        self,
+        exclude: Optional[List[OllamaHost]] = None,
+        preferred: Optional[OllamaHost] = None
+    ) -> Optional[OllamaHost]:
+        """Pick the host for the next generation.
+        
+        Hosts already running their maximum number of requests are skipped.
+        Healthy hosts are preferred over ones only open for a trial request,
+        then the host with the fewest outstanding requests wins, with ties
+        broken by the lowest recent latency.
+        
+        Args:
+            exclude: Hosts that must not be used, e.g. ones that already failed
+            preferred: Host to use whenever it is available and not excluded,
+                e.g. the one holding the prompt prefix in its cache
+            
+        Returns:
+            The selected host, or None if no host is available or has capacity
+        """
+        candidates = [h for h in self._available_hosts(exclude) if h.has_capacity]
+        if not candidates:
+            return None
+        if preferred in candidates:
+            return preferred
+        return min(
+            candidates,
+            key=lambda h: (
+                h.state == OllamaHost.STATE_UNHEALTHY,
+                h.outstanding,
+                h.latency if h.latency is not None else 0.0
+            )
+        )
+
+    def _available_hosts(self, exclude: Optional[List[OllamaHost]] = None) -> List[OllamaHost]:
+        """Get the hosts requests may be sent to, whether or not they are busy."""
+        return [h for h in self.hosts if h.is_available and (exclude is None or h not in exclude)]
+
+    async def _wait_for_host(
+        self,
+        exclude: Optional[List[OllamaHost]] = None,
+        preferred: Optional[OllamaHost] = None
+    ) -> Optional[OllamaHost]:
+        """Pick the host for the next request, waiting while every available host is full.
+        
+        The scheduler keeps the requests within the capacity of the available
+        hosts, so this only waits when hosts fail while requests are running.
+        
+        Args:
+            exclude: Hosts that must not be used, e.g. ones that already failed
+            preferred: Host to use whenever it is available and has capacity
+            
+        Returns:
+            The selected host, or None if no host is available
+        """
+        while True:
+            host = self._select_host(exclude=exclude, preferred=preferred)
+            if host is not None or not self._available_hosts(exclude):
+                return host
+            await self._host_freed.wait()
+
+    def _finish_request(self, host: OllamaHost) -> None:
+        """Record that a request to a host has ended and wake requests waiting for one."""
+        host.finish_request()
+        self._host_freed.set()
+        self._host_freed = anyio.Event()
+
+    async def get_martin_fowler_review(
+        self, 
+        code: str, 
+        language: Optional[str] = None,
+        description: Optional[str] = None,
+        progress: Optional[ProgressCallback] = None,
+        use_cache: bool = True,
+        priority: str = PRIORITY_INTERACTIVE,
+        prior_reviews: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """Get a code review from Martin Fowler's perspective.
+        
+        Args:
+            code: Code to review
+            language: Programming language
+            description: Description of the code
+            progress: Optional callback notified as tokens are generated
+            use_cache: Whether a cached review may be returned; when False a
+                fresh review is generated and replaces the cached one
+            priority: Scheduling priority, 'interactive' or 'batch'
+            prior_reviews: Optional earlier reviews of similar code, added
+                to the prompt as context
+            
+        Returns:
+            Dictionary with review, suggestions, and rating
+            
+        Raises:
+            QueueFullError: If too many generations are already waiting
+        """
+        async def review(code: str, description: Optional[str], progress: Optional[ProgressCallback]) -> Dict[str, Any]:
+            # Prepare prompt
+            with span("prepare_prompt"):
+                prompt = self._prepare_martin_fowler_prompt(code, language, description, prior_reviews)
+            
+            return await self._get_review(
+                EXPERT_MARTIN_FOWLER,
+                prompt,
+                lambda: self._mock_martin_fowler_review(code, language),
+                progress,
+                use_cache,
+                priority,
+                flight_key=self._flight_key(EXPERT_MARTIN_FOWLER, code, language, description)
+            )
+            
+        return await self._review_in_chunks(code, language, description, progress, review)
+
+    async def get_robert_c_martin_review(
+        self, 
+        code: str, 
+        language: Optional[str] = None,
+        description: Optional[str] = None,
+        progress: Optional[ProgressCallback] = None,
+        use_cache: bool = True,
+        priority: str = PRIORITY_INTERACTIVE,
+        prior_reviews: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """Get a code review from Robert C. Martin's perspective.
+        
+        Args:
+            code: Code to review
+            language: Programming language
+            description: Description of the code
+            progress: Optional callback notified as tokens are generated
+            use_cache: Whether a cached review may be returned; when False a
+                fresh review is generated and replaces the cached one
+            priority: Scheduling priority, 'interactive' or 'batch'
+            prior_reviews: Optional earlier reviews of similar code, added
+                to the prompt as context
+            
+        Returns:
+            Dictionary with review, suggestions, and rating
+            
+        Raises:
+            QueueFullError: If too many generations are already waiting
+        """
+        async def review(code: str, description: Optional[str], progress: Optional[ProgressCallback]) -> Dict[str, Any]:
+            # Prepare prompt
+            with span("prepare_prompt"):
+                prompt = self._prepare_robert_c_martin_prompt(code, language, description, prior_reviews)
+            
+            return await self._get_review(
+                EXPERT_ROBERT_C_MARTIN,
+                prompt,
+                lambda: self._mock_robert_c_martin_review(code, language),
+                progress,
+                use_cache,
+                priority,
+                flight_key=self._flight_key(EXPERT_ROBERT_C_MARTIN, code, language, description)
+            )
+            
+        return await self._review_in_chunks(code, language, description, progress, review)
+
+    @asynccontextmanager
+    async def share_prompt_prefix(
+        self,
+        code: str,
+        language: Optional[str] = None,
+        description: Optional[str] = None
+    ):
+        """Let the expert reviews started in the block share the evaluation of the code.
+        
+        Every expert prompt starts with the same code prefix. The first review
+        in the block that is not served from the cache has Ollama evaluate
+        the prefix once; the others wait for it and are sent to the same
+        host, so they find the prefix in its prompt cache and only pay for
+        their persona suffix. Priming is best effort: if it fails, the
+        reviews run as they would without it. Reviews of code split into
+        chunks do not share the prefix.
+        
+        Args:
+            code: Code to review
+            language: Programming language
+            description: Description of the code
+        """
+        token = _prefix_group.set(_PrefixGroup(self._prepare_code_prefix(code, language, description)))
+        try:
+            yield
+        finally:
+            _prefix_group.reset(token)
+
+    async def _prime_prefix_group(self, group: _PrefixGroup, priority: str) -> Optional[OllamaHost]:
+        """Have Ollama evaluate the prefix of a group of reviews, once.
+        
+        Args:
+            group: Reviews sharing the prefix
+            priority: Scheduling priority, 'interactive' or 'batch'
+            
+        Returns:
+            The host that evaluated the prefix, or None if priming failed
+        """
+        if group.claimed:
+            await group.primed.wait()
+            return group.host
+        group.claimed = True
+        
+        data = {
+            "model": self.model,
+            "prompt": group.prefix,
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": {
+                "num_predict": 1
+            }
+        }
+        
+        try:
+            with span("prime_prompt_prefix"):
+                async with self.scheduler.slot(priority):
+                    host = await self._wait_for_host()
+                    if host is not None:
+                        host.start_request()
+                        try:
+                            response = await self.client.post(f"{host.url}/api/generate", json=data)
+                        finally:
+                            self._finish_request(host)
+                        response.raise_for_status()
+                        group.host = host
+                        self.primed_prefixes += 1
+        except Exception as e:
+            # The reviews do not depend on priming, so they go ahead anyway
+            print(f"Error priming prompt prefix: {e}")
+        finally:
+            group.primed.set()
+        return group.host
+
+    async def _review_in_chunks(
+        self,
+        code: str,
+        language: Optional[str],
+        description: Optional[str],
+        progress: Optional[ProgressCallback],
+        review: Callable[[str, Optional[str], Optional[ProgressCallback]], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """Review code at once, or in chunks if it is too large.
+        
+        Large code is split at function and class boundaries and the chunks
+        are reviewed concurrently, at most as many at once as the scheduler
+        admits so a large file does not fill the queue. The chunk reviews are
+        then reduced into one review.
+        
+        Args:
+            code: Code to review
+            language: Programming language
+            description: Description of the code
+            progress: Optional callback notified with the combined progress
+                of all chunks
+            review: Reviews one piece of code given its description and
+                progress callback
+            
+        Returns:
+            Dictionary with review, suggestions, and rating
+        """
+        chunks = split_code(code, language, self.chunk_chars) if self.chunk_chars > 0 else []
+        if len(chunks) < 2:
+            return await review(code, description, progress)
+            
+        reviews: List[Optional[Dict[str, Any]]] = [None] * len(chunks)
+        completed = [0.0] * len(chunks)
+        totals = [0.0] * len(chunks)
+        limiter = anyio.CapacityLimiter(self.scheduler.limit)
+        
+        def chunk_progress(index: int) -> Optional[ProgressCallback]:
+            if progress is None:
+                return None
+                
+            async def report(value: float, total: Optional[float] = None) -> None:
+                completed[index] = value
+                totals[index] = total or 0.0
+                await progress(sum(completed), sum(totals) or None)
+                
+            return report
+            
+        async def review_chunk(index: int, chunk: CodeChunk) -> None:
+            part = f"Part {index + 1} of {len(chunks)} (lines {chunk.start_line}-{chunk.end_line}) of a larger file"
+            chunk_description = f"{description} ({part})" if description else part
+            async with limiter:
+                with span("review_chunk", start_line=chunk.start_line, end_line=chunk.end_line):
+                    reviews[index] = await review(chunk.code, chunk_description, chunk_progress(index))
+                
+        async with anyio.create_task_group() as tg:
+            for index, chunk in enumerate(chunks):
+                tg.start_soon(review_chunk, index, chunk)
+                
+        return self._reduce_reviews(chunks, reviews)
+
+    @staticmethod
+    def _reduce_reviews(chunks: List[CodeChunk], reviews: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Combine the reviews of the chunks of a file into one review.
+        
+        Suggestions are deduplicated ignoring case, whitespace and trailing
+        punctuation, and the rating is the average of the chunk ratings
+        weighted by chunk size. The model is only kept when every chunk was
+        generated by it.
+        
+        Args:
+            chunks: The reviewed chunks
+            reviews: The review of each chunk
+            
+        Returns:
+            Dictionary with review, suggestions, rating, and model
+        """
+        suggestions: List[str] = []
+        seen = set()
+        for review in reviews:
+            for suggestion in review["suggestions"]:
+                key = " ".join(str(suggestion).lower().split()).rstrip(".!;:")
+                if key not in seen:
+                    seen.add(key)
+                    suggestions.append(suggestion)
+                    
+        models = {review.get("model") for review in reviews}
+        weights = [len(chunk.code) for chunk in chunks]
+        rating = sum(review["rating"] * weight for review, weight in zip(reviews, weights)) / sum(weights)
+        
+        return {
+            "review": "\n\n".join(
+                f"Lines {chunk.start_line}-{chunk.end_line}: {review['review']}"
+                for chunk, review in zip(chunks, reviews)
+            ),
+            "suggestions": suggestions,
+            "rating": min(5, max(1, round(rating))),
+            "model": models.pop() if len(models) == 1 else None
+        }
+
+    async def _get_review(
+        self,
+        expert: str,
+        prompt: str,
+        fallback: Callable[[], Dict[str, Any]],
+        progress: Optional[ProgressCallback] = None,
+        use_cache: bool = True,
+        priority: str = PRIORITY_INTERACTIVE,
+        flight_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Get a review for a prepared prompt, going through the response cache.
+        
+        Concurrent calls with the same flight key share a single generation.
         
         Args:
-            host: Ollama API host
-            model: Model to use for generation
+            expert: Expert identifier
+            prompt: Prepared prompt
+            fallback: Produces a mock review when Ollama cannot be used
+            progress: Optional callback notified as tokens are generated
+            use_cache: Whether a cached review may be returned
+            priority: Scheduling priority, 'interactive' or 'batch'
+            flight_key: Key identifying identical requests, defaults to the
+                cache key
+            
+        Returns:
+            Dictionary with review, suggestions, and rating
         """
-        self.host = host
-        self.model = model
-        self.api_url = f"{host}/api/generate"
-        self.is_available = self._check_availability()
+        cache_key = ResponseCache.make_key(self.model, expert, prompt)
+        if use_cache:
+            with span("cache_lookup"):
+                cached = self.cache.get(cache_key)
+                set_attribute("hit", cached is not None)
+            if cached is not None:
+                return cached
+                
+        return await self._single_flight(
+            flight_key or cache_key,
+            lambda: self._generate_review(cache_key, prompt, fallback, progress, priority)
+        )
 
-    def _check_availability(self) -> bool:
-        """Check if Ollama is available.
+    async def _single_flight(
+        self,
+        key: str,
+        generate: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """Run a generation once for all concurrent callers with the same key.
         
+        The first caller runs the generation; callers arriving while it is in
+        flight wait for it and share its result (or its error). If the first
+        caller is cancelled, a waiting caller takes over.
+        
+        Args:
+            key: Key identifying identical requests
+            generate: Coroutine function performing the generation
+            
         Returns:
-            True if Ollama is available, False otherwise
+            Dictionary with review, suggestions, and rating
         """
+        while key in self._flights:
+            flight = self._flights[key]
+            self.coalesced_requests += 1
+            with span("coalesced_wait"):
+                await flight.done.wait()
+            if flight.error is None:
+                return flight.result
+            if not isinstance(flight.error, anyio.get_cancelled_exc_class()):
+                raise flight.error
+                
+        flight = _Flight()
+        self._flights[key] = flight
         try:
-            response = requests.get(f"{self.host}/api/tags")
-            return response.status_code == 200
-        except requests.RequestException:
-            print(f"Ollama service not available at {self.host}")
-            return False
+            flight.result = await generate()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            del self._flights[key]
+            flight.done.set()
 
-    def get_martin_fowler_review(
-        self, 
-        code: str, 
-        language: Optional[str] = None,
-        description: Optional[str] = None
-    ) -> Dict[str, Any]:
-        """Get a code review from Martin Fowler's perspective.
+    @staticmethod
+    def _flight_key(
+        expert: str,
+        code: str,
+        language: Optional[str],
+        description: Optional[str]
+    ) -> str:
+        """Build the key under which identical review requests are coalesced.
+        
+        Line endings and trailing whitespace are normalized so that requests
+        differing only in formatting noise share a generation.
         
         Args:
+            expert: Expert identifier
             code: Code to review
             language: Programming language
             description: Description of the code
             
         Returns:
-            Dictionary with review, suggestions, and rating
+            Request key
+        """
+        normalized = "\n".join(line.rstrip() for line in code.strip().splitlines())
+        payload = json.dumps([expert, normalized, language, description])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def _generate_review(
+        self,
+        cache_key: str,
+        prompt: str,
+        fallback: Callable[[], Dict[str, Any]],
+        progress: Optional[ProgressCallback] = None,
+        priority: str = PRIORITY_INTERACTIVE
+    ) -> Dict[str, Any]:
+        """Generate a review with Ollama and cache it.
+        
+        Args:
+            cache_key: Response cache key of the prompt
+            prompt: Prepared prompt
+            fallback: Produces a mock review when Ollama cannot be used
+            progress: Optional callback notified as tokens are generated
+            priority: Scheduling priority, 'interactive' or 'batch'
+            
+        Returns:
+            Dictionary with review, suggestions, rating, and the model that
+            generated the review
+            
+        Raises:
+            QueueFullError: If too many generations are already waiting
         """
         if not self.is_available:
-            return self._mock_martin_fowler_review(code, language)
+            with span("fallback_review"):
+                return fallback()
+            
+        # Reviews sharing a prompt prefix run on the host that evaluated it
+        preferred = None
+        group = _prefix_group.get()
+        if group is not None and prompt.startswith(group.prefix):
+            preferred = await self._prime_prefix_group(group, priority)
             
-        # Prepare prompt
-        prompt = self._prepare_martin_fowler_prompt(code, language, description)
+        # Rejections are surfaced to the caller so it can retry later
+        async with self.scheduler.slot(priority):
+            # Fail over to the remaining hosts when a generation errors
+            failed: List[OllamaHost] = []
+            while True:
+                host = await self._wait_for_host(exclude=failed, preferred=preferred)
+                if host is None:
+                    with span("fallback_review"):
+                        return fallback()
+                    
+                try:
+                    response = await self._call_hedged(host, prompt, progress)
+                    break
+                except Exception as e:
+                    print(f"Error getting review from Ollama at {host.url}: {e}")
+                    failed.append(host)
+                    
+        # Parse response; the model is only recorded for real generations,
+        # so mock reviews are never mistaken for reusable ones
+        with span("parse_review"):
+            review = self._parse_review_response(response)
+        review["model"] = self.model
         
-        try:
-            # Call Ollama API
-            response = self._call_ollama(prompt)
+        # Only real generations are cached, never the mock fallback
+        self.cache.set(cache_key, review)
+        return review
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get service statistics.
+        
+        Returns:
+            Dictionary with host health, response cache, scheduler and
+            request coalescing statistics
+        """
+        return {
+            "hosts": [h.stats() for h in self.hosts],
+            "cache": self.cache.stats(),
+            "scheduler": self.scheduler.stats(),
+            "single_flight": {
+                "in_flight": len(self._flights),
+                "coalesced": self.coalesced_requests
+            },
+            "primed_prefixes": self.primed_prefixes,
+            "metrics_cache": metrics_cache_stats(),
+            "embeddings": {
+                "model": self.embed_model,
+                "cached": len(self._embeddings),
+                **self._embedding_stats
+            },
+            "hedging": {
+                "enabled": self.hedge,
+                "delay": self._hedge_delay(),
+                "hedged": self.hedged_requests,
+                "hedge_wins": self.hedge_wins
+            }
+        }
+
+    async def embed(self, texts: List[str], priority: str = PRIORITY_INTERACTIVE) -> np.ndarray:
+        """Embed texts with Ollama.
+        
+        Texts embedded before are served from an in-memory cache keyed by a
+        hash of the model and the text. The others are deduplicated and sent
+        in batches of embed_batch_size texts, at most as many at once as the
+        scheduler runs, so a large backfill does not fill its queue.
+        
+        Args:
+            texts: Texts to embed
+            priority: Scheduling priority, 'interactive' or 'batch'
             
-            # Parse response
-            return self._parse_review_response(response)
-        except Exception as e:
-            print(f"Error getting review from Ollama: {e}")
-            return self._mock_martin_fowler_review(code, language)
+        Returns:
+            float32 matrix with one embedding per text, in order
+            
+        Raises:
+            EmbeddingError: If no Ollama host can embed the texts
+            QueueFullError: If too many requests are already waiting
+        """
+        keys = [
+            hashlib.sha256(f"{self.embed_model}\0{text}".encode("utf-8")).hexdigest()
+            for text in texts
+        ]
+        vectors: Dict[str, np.ndarray] = {}
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            cached = self._embeddings.get(key)
+            if cached is not None:
+                self._embeddings.move_to_end(key)
+                self._embedding_stats["hits"] += 1
+                vectors[key] = cached
+            else:
+                missing[key] = text
+                
+        pending = list(missing.items())
+        limiter = anyio.CapacityLimiter(self.scheduler.limit)
+        
+        async def embed_batch(batch: List[Any]) -> None:
+            async with limiter:
+                with span("ollama.embed", texts=len(batch)):
+                    embeddings = await self._embed_batch([text for _, text in batch], priority)
+            for (key, _), vector in zip(batch, embeddings):
+                vectors[key] = vector
+                self._embeddings[key] = vector
+                if len(self._embeddings) > EMBEDDING_CACHE_SIZE:
+                    self._embeddings.popitem(last=False)
+                    
+        async with anyio.create_task_group() as tg:
+            for start in range(0, len(pending), self.embed_batch_size):
+                tg.start_soon(embed_batch, pending[start:start + self.embed_batch_size])
+                
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([vectors[key] for key in keys])
 
-    def get_robert_c_martin_review(
-        self, 
-        code: str, 
-        language: Optional[str] = None,
-        description: Optional[str] = None
-    ) -> Dict[str, Any]:
-        """Get a code review from Robert C. Martin's perspective.
+    async def _embed_batch(self, texts: List[str], priority: str) -> np.ndarray:
+        """Embed one batch of texts, failing over between hosts.
         
         Args:
-            code: Code to review
-            language: Programming language
-            description: Description of the code
+            texts: Texts to embed
+            priority: Scheduling priority, 'interactive' or 'batch'
             
         Returns:
-            Dictionary with review, suggestions, and rating
+            float32 matrix with one embedding per text
+            
+        Raises:
+            EmbeddingError: If no Ollama host can embed the texts
         """
         if not self.is_available:
-            return self._mock_robert_c_martin_review(code, language)
+            raise EmbeddingError("Ollama is not available for embeddings")
             
-        # Prepare prompt
-        prompt = self._prepare_robert_c_martin_prompt(code, language, description)
+        data = {
+            "model": self.embed_model,
+            "input": texts,
+            "keep_alive": self.keep_alive
+        }
         
-        try:
-            # Call Ollama API
-            response = self._call_ollama(prompt)
+        async with self.scheduler.slot(priority):
+            failed: List[OllamaHost] = []
+            while True:
+                host = await self._wait_for_host(exclude=failed)
+                if host is None:
+                    raise EmbeddingError(f"No Ollama host could embed {len(texts)} texts")
+                    
+                host.start_request()
+                start = time.monotonic()
+                try:
+                    response = await self.client.post(f"{host.url}/api/embed", json=data)
+                    response.raise_for_status()
+                    embeddings = np.asarray(response.json()["embeddings"], dtype=np.float32)
+                except httpx.HTTPStatusError as e:
+                    # A missing embedding model is not the host's fault, so
+                    # it must not take the host out of the generation pool
+                    if e.response.status_code < 500:
+                        raise ValueError(
+                            f"Ollama at {host.url} cannot embed with {self.embed_model}: {e.response.text}"
+                        ) from e
+                    print(f"Error embedding {len(texts)} texts with Ollama at {host.url}: {e}")
+                    host.record_failure(e)
+                    self.request_health_check(host)
+                    failed.append(host)
+                    continue
+                except (httpx.HTTPError, KeyError, ValueError) as e:
+                    print(f"Error embedding {len(texts)} texts with Ollama at {host.url}: {e}")
+                    host.record_failure(e)
+                    self.request_health_check(host)
+                    failed.append(host)
+                    continue
+                finally:
+                    self._finish_request(host)
+                    
+                host.record_success(time.monotonic() - start)
+                break
+                
+        if embeddings.shape[0] != len(texts):
+            raise EmbeddingError(f"Ollama returned {embeddings.shape[0]} embeddings for {len(texts)} texts")
+            
+        self._embedding_stats["requests"] += 1
+        self._embedding_stats["embedded"] += len(texts)
+        return embeddings
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Get the time after which a generation without output is hedged.
+        
+        Returns:
+            The configured percentile of recent time-to-first-token in
+            seconds, or None while hedging is disabled, impossible with a
+            single host or not enough samples were collected
+        """
+        if not self.hedge or len(self.hosts) < 2 or len(self._ttft_samples) < HEDGE_MIN_SAMPLES:
+            return None
+        samples = sorted(self._ttft_samples)
+        index = math.ceil(len(samples) * self.hedge_percentile / 100) - 1
+        return samples[min(max(index, 0), len(samples) - 1)]
+
+    async def _call_hedged(
+        self,
+        host: OllamaHost,
+        prompt: str,
+        progress: Optional[ProgressCallback] = None
+    ) -> str:
+        """Generate text on a host, hedging on a second host when it is slow.
+        
+        If the host has not produced a token within the hedge delay, the
+        same generation is sent to another host, provided the scheduler has
+        a free slot for it and that host is below its own limit. The first response wins and the other
+        generation is cancelled, which closes its connection and stops
+        Ollama from generating further.
+        
+        Args:
+            host: Host to send the generation to
+            prompt: Prompt for the model
+            progress: Optional callback notified as tokens are generated
+            
+        Returns:
+            Generated text
+        """
+        delay = self._hedge_delay()
+        if delay is None:
+            return await self._call_host(host, prompt, progress)
+            
+        responses: List[str] = []
+        errors: List[Exception] = []
+        # Set by the first token of any attempt, or when the primary ends
+        started = anyio.Event()
+        reported = 0.0
+        
+        async def forward(value: float, total: Optional[float]) -> None:
+            nonlocal reported
+            started.set()
+            # Only report progress beyond what the other attempt reported
+            if progress and value > reported:
+                reported = value
+                await progress(value, total)
+                
+        async def attempt(target: OllamaHost, is_hedge: bool) -> None:
+            try:
+                responses.append(await self._call_host(target, prompt, forward))
+                if is_hedge:
+                    self.hedge_wins += 1
+                tg.cancel_scope.cancel()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                started.set()
+                if is_hedge:
+                    self.scheduler.release()
+                    
+        async def watchdog() -> None:
+            with anyio.move_on_after(delay):
+                await started.wait()
+            if started.is_set():
+                return
+                
+            backup = self._select_host(exclude=[host])
+            # Hedges never wait for a slot, so they only use spare capacity
+            if backup is not None and self.scheduler.try_acquire():
+                self.hedged_requests += 1
+                await attempt(backup, True)
+                
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(watchdog)
+            # The primary runs in this task so its host is marked busy
+            # before other requests pick a host
+            await attempt(host, False)
+            
+        if responses:
+            return responses[0]
+        raise errors[0]
+
+    async def _call_host(
+        self,
+        host: OllamaHost,
+        prompt: str,
+        progress: Optional[ProgressCallback] = None
+    ) -> str:
+        """Generate text on a host and record the outcome in its health state.
+        
+        Args:
+            host: Host to send the generation to
+            prompt: Prompt for the model
+            progress: Optional callback notified as tokens are generated
             
-            # Parse response
-            return self._parse_review_response(response)
+        Returns:
+            Generated text
+        """
+        host.start_request()
+        start = time.monotonic()
+        start_ns = time.time_ns()
+        first_token: Optional[float] = None
+        tokens = 0
+        
+        async def on_progress(value: float, total: Optional[float]) -> None:
+            nonlocal first_token, tokens
+            if first_token is None:
+                first_token = time.monotonic() - start
+            tokens = int(value)
+            if progress:
+                await progress(value, total)
+                
+        try:
+            with span("ollama.generate", host=host.url):
+                response = await self._call_ollama(host.url, prompt, on_progress)
+                set_attribute("tokens", tokens)
+                # The stream shows when prefill ended and token generation began
+                if self.stream and first_token is not None:
+                    first_token_ns = start_ns + int(first_token * 1e9)
+                    record_span("ollama.prefill", start_ns, first_token_ns)
+                    record_span("ollama.decode", first_token_ns, time.time_ns(), tokens=tokens)
+        except anyio.get_cancelled_exc_class():
+            # Hedged generations that lost the race are cancelled
+            GENERATION_SECONDS.observe(time.monotonic() - start, host=host.url, outcome="cancelled")
+            raise
         except Exception as e:
-            print(f"Error getting review from Ollama: {e}")
-            return self._mock_robert_c_martin_review(code, language)
+            GENERATION_SECONDS.observe(time.monotonic() - start, host=host.url, outcome="error")
+            host.record_failure(e)
+            self.request_health_check(host)
+            raise
+        finally:
+            self._finish_request(host)
+            
+        latency = time.monotonic() - start
+        self._ttft_samples.append(first_token if first_token is not None else latency)
+        host.record_success(latency)
+        self._record_generation(host, latency, first_token, tokens)
+        return response
+        
+    def _record_generation(
+        self,
+        host: OllamaHost,
+        latency: float,
+        first_token: Optional[float],
+        tokens: int
+    ) -> None:
+        """Record the metrics of a successful generation.
+        
+        Args:
+            host: Host that generated the text
+            latency: Duration of the generation in seconds
+            first_token: Time until the first token in seconds, if known
+            tokens: Number of generated tokens
+        """
+        GENERATION_SECONDS.observe(latency, host=host.url, outcome="success")
+        if first_token is not None:
+            TIME_TO_FIRST_TOKEN_SECONDS.observe(first_token, host=host.url)
+        if not tokens:
+            return
+            
+        GENERATED_TOKENS.inc(tokens, host=host.url)
+        # Without a token stream all tokens arrive at once, so the speed
+        # can only be measured over the whole generation
+        decode_time = latency
+        if self.stream and first_token is not None and tokens > 1:
+            decode_time = latency - first_token
+        if decode_time > 0:
+            TOKENS_PER_SECOND.observe(tokens / decode_time, host=host.url)
 
-    def _call_ollama(self, prompt: str) -> str:
+    async def _call_ollama(
+        self,
+        host_url: str,
+        prompt: str,
+        progress: Optional[ProgressCallback] = None
+    ) -> str:
         """Call Ollama API to generate text.
         
         Args:
+            host_url: Base URL of the Ollama host
             prompt: Prompt for the model
+            progress: Optional callback notified as tokens are generated
             
         Returns:
             Generated text
         """
+        if self.stream:
+            return await self._stream_ollama(host_url, prompt, progress)
+            
         data = {
             "model": self.model,
             "prompt": prompt,
             "stream": False,
-            "temperature": 0.7,
-            "max_tokens": 1024
+            "keep_alive": self.keep_alive,
+            "options": {
+                "temperature": TEMPERATURE,
+                "num_predict": MAX_TOKENS
+            }
         }
         
-        response = requests.post(self.api_url, json=data)
+        response = await self.client.post(f"{host_url}/api/generate", json=data)
         response.raise_for_status()
         
         result = response.json()
+        if progress and result.get("eval_count"):
+            await progress(result["eval_count"], MAX_TOKENS)
         return result.get("response", "")
 
-    def _prepare_martin_fowler_prompt(
-        self, 
-        code: str, 
+    async def _stream_ollama(
+        self,
+        host_url: str,
+        prompt: str,
+        progress: Optional[ProgressCallback] = None
+    ) -> str:
+        """Call Ollama API and consume its NDJSON token stream.
+        
+        Generation stops as soon as the output contains a complete JSON
+        object with a review, instead of waiting for the model to finish.
+        
+        Args:
+            host_url: Base URL of the Ollama host
+            prompt: Prompt for the model
+            progress: Optional callback notified with the number of tokens
+                generated so far
+            
+        Returns:
+            Generated text
+        """
+        data = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": self.keep_alive,
+            "options": {
+                "temperature": TEMPERATURE,
+                "num_predict": MAX_TOKENS
+            }
+        }
+        
+        chunks: List[str] = []
+        scanner = _JsonObjectScanner()
+        async with self.client.stream("POST", f"{host_url}/api/generate", json=data) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                    
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise RuntimeError(f"Ollama error: {chunk['error']}")
+                    
+                token = chunk.get("response", "")
+                if token:
+                    chunks.append(token)
+                    if progress:
+                        await progress(len(chunks), MAX_TOKENS)
+                        
+                    # Closing the stream early aborts the rest of the generation.
+                    # Objects without the review fields (e.g. braces in prose)
+                    # are skipped.
+                    for candidate in scanner.feed(token):
+                        if self._is_complete_review(candidate):
+                            return candidate
+                        
+                if chunk.get("done"):
+                    break
+                    
+        return "".join(chunks)
+
+    def _is_complete_review(self, text: str) -> bool:
+        """Check whether text is a JSON object with all review fields.
+        
+        Args:
+            text: Candidate JSON text
+            
+        Returns:
+            True if the text can be parsed as a review
+        """
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            return False
+        return isinstance(data, dict) and all(key in data for key in ['review', 'suggestions', 'rating'])
+
+    def _prepare_code_prefix(
+        self,
+        code: str,
         language: Optional[str] = None,
         description: Optional[str] = None
     ) -> str:
-        """Prepare a prompt for Martin Fowler's review.
+        """Prepare the part of the prompt shared by all experts.
+        
+        The code comes first so that every expert's prompt for the same
+        snippet starts with identical text, and Ollama can reuse the
+        evaluated prefix from its cache instead of processing the code
+        again for each expert. It is followed by a summary of the static
+        metrics of the code, which points the model at the hotspots.
         
         Args:
             code: Code to review
@@ -152,14 +1884,72 @@ class OllamaService:
             description: Description of the code
             
         Returns:
-            Formatted prompt
+            Prompt prefix ending after the code and its metrics
         """
         lang_info = f" in {language}" if language else ""
         desc_info = f"\nDescription: {description}" if description else ""
+        summary = summarize_metrics(get_code_metrics(code, language))
+        metrics_info = f"STATIC METRICS:\n{summary}\n\n" if summary else ""
+        
+        return f"""CODE TO REVIEW{lang_info}:{desc_info}
+```
+{code}
+```
+
+{metrics_info}"""
+
+    @staticmethod
+    def _prepare_prior_reviews(prior_reviews: Optional[List[Dict[str, Any]]]) -> str:
+        """Prepare the part of an expert prompt with earlier reviews of similar code.
+        
+        It follows the expert's persona rather than the shared code prefix,
+        as each expert gets its own earlier reviews.
         
-        return f"""You are Martin Fowler, a renowned software architect and author who specializes in refactoring, patterns, and software design.
+        Args:
+            prior_reviews: Earlier reviews with their similarity, rating,
+                review text and suggestions
+            
+        Returns:
+            Prompt text ending with a blank line, or an empty string
+        """
+        if not prior_reviews:
+            return ""
+            
+        lines = [
+            "These are your earlier reviews of similar code. Stay consistent with them "
+            "where they apply, but review the code above on its own merits:"
+        ]
+        for prior in prior_reviews:
+            review = " ".join(str(prior.get("review", "")).split())
+            if len(review) > PRIOR_REVIEW_CHARS:
+                review = review[:PRIOR_REVIEW_CHARS].rstrip() + "..."
+            lines.append(f"- Code {prior['similarity']:.0%} similar, rated {prior.get('rating')}/5: {review}")
+            suggestions = prior.get("suggestions") or []
+            if suggestions:
+                lines.append(f"  Suggestions: {'; '.join(str(s) for s in suggestions[:5])}")
+        return "\n".join(lines) + "\n\n"
+
+    def _prepare_martin_fowler_prompt(
+        self, 
+        code: str, 
+        language: Optional[str] = None,
+        description: Optional[str] = None,
+        prior_reviews: Optional[List[Dict[str, Any]]] = None
+    ) -> str:
+        """Prepare a prompt for Martin Fowler's review.
         
-Review the following code{lang_info}{desc_info}. Provide a detailed review focusing on:
+        Args:
+            code: Code to review
+            language: Programming language
+            description: Description of the code
+            prior_reviews: Optional earlier reviews of similar code
+            
+        Returns:
+            Formatted prompt
+        """
+        return self._prepare_code_prefix(code, language, description) + """You are Martin Fowler, a renowned software architect and author who specializes in refactoring, patterns, and software design.
+
+""" + self._prepare_prior_reviews(prior_reviews) + """Review the code above. Provide a detailed review focusing on:
 
 1. Code structure and organization
 2. Potential code smells
@@ -171,11 +1961,6 @@ Format your response as JSON with these fields:
 - "suggestions": An array of specific refactoring suggestions
 - "rating": A numerical score from 1-5 (1=poor, 5=excellent)
 
-CODE TO REVIEW:
-```
-{code}
-```
-
 JSON RESPONSE:
 """
 
@@ -183,7 +1968,8 @@ JSON RESPONSE:
         self, 
         code: str, 
         language: Optional[str] = None,
-        description: Optional[str] = None
+        description: Optional[str] = None,
+        prior_reviews: Optional[List[Dict[str, Any]]] = None
     ) -> str:
         """Prepare a prompt for Robert C. Martin's review.
         
@@ -191,16 +1977,14 @@ JSON RESPONSE:
             code: Code to review
             language: Programming language
             description: Description of the code
+            prior_reviews: Optional earlier reviews of similar code
             
         Returns:
             Formatted prompt
         """
-        lang_info = f" in {language}" if language else ""
-        desc_info = f"\nDescription: {description}" if description else ""
-        
-        return f"""You are Robert C. Martin (Uncle Bob), a renowned software engineer and advocate for clean code principles.
-        
-Review the following code{lang_info}{desc_info}. Provide a detailed review focusing on:
+        return self._prepare_code_prefix(code, language, description) + """You are Robert C. Martin (Uncle Bob), a renowned software engineer and advocate for clean code principles.
+
+""" + self._prepare_prior_reviews(prior_reviews) + """Review the code above. Provide a detailed review focusing on:
 
 1. Clean code principles
 2. SOLID principles
@@ -212,11 +1996,6 @@ Format your response as JSON with these fields:
 - "suggestions": An array of specific clean code improvements
 - "rating": A numerical score from 1-5 (1=poor, 5=excellent)
 
-CODE TO REVIEW:
-```
-{code}
-```
-
 JSON RESPONSE:
 """
 
@@ -311,81 +2090,175 @@ JSON RESPONSE:
         return review
 
     def _mock_martin_fowler_review(
-        self, 
-        code: str, 
+        self,
+        code: str,
         language: Optional[str] = None
     ) -> Dict[str, Any]:
         """Generate a mock review from Martin Fowler's perspective.
-        
+
+        The review is based on the static metrics of the code, so it points
+        at concrete hotspots even without Ollama.
+
         Args:
             code: Code to review
             language: Programming language
-            
+
         Returns:
             Mock review dictionary
         """
+        metrics = get_code_metrics(code, language)
         lang_text = language if language else "this code"
-        code_length = len(code.strip().split('\n'))
-        
-        # Determine complexity heuristic
-        complexity = "simple" if code_length < 10 else "moderately complex" if code_length < 30 else "complex"
-        rating = 4 if code_length < 10 else 3 if code_length < 30 else 2
-        
-        review = f"""I've reviewed the {complexity} {lang_text} snippet. The code appears functional but has room for improvement in terms of structure and design. There are several refactoring opportunities that could make it more maintainable and aligned with good software design principles."""
-        
-        suggestions = [
+        complexity = self._describe_complexity(metrics)
+
+        review = f"""I've reviewed the {complexity} {lang_text} snippet. {self._describe_metrics(metrics)}The code appears functional but has room for improvement in terms of structure and design. There are several refactoring opportunities that could make it more maintainable and aligned with good software design principles."""
+
+        suggestions = []
+        for function in hotspots(metrics):
+            name = function["name"]
+            if function["complexity"] > COMPLEXITY_THRESHOLD or function["length"] > LENGTH_THRESHOLD:
+                suggestions.append(f"Apply Extract Method to {name} ({', '.join(function['issues'])}) so each piece has one clear responsibility")
+            if function["nesting"] > NESTING_THRESHOLD:
+                suggestions.append(f"Replace Nested Conditional with Guard Clauses in {name} (nesting depth {function['nesting']})")
+            if function["parameters"] > PARAMETER_THRESHOLD:
+                suggestions.append(f"Introduce Parameter Object for {name}, which takes {function['parameters']} parameters")
+
+        suggestions.extend([
             "Extract smaller, focused methods with clear responsibilities",
             "Consider introducing appropriate design patterns",
             "Improve variable and method naming for clarity",
             "Reduce duplication and increase code reuse"
-        ]
-        
+        ])
+
         if complexity == "complex":
             suggestions.append("Break down complex logic into smaller, testable units")
             suggestions.append("Consider separating concerns with appropriate abstractions")
-            
+
         return {
             "review": review,
             "suggestions": suggestions,
-            "rating": rating
+            "rating": self._rate_metrics(metrics)
         }
 
     def _mock_robert_c_martin_review(
-        self, 
-        code: str, 
+        self,
+        code: str,
         language: Optional[str] = None
     ) -> Dict[str, Any]:
         """Generate a mock review from Robert C. Martin's perspective.
-        
+
+        The review is based on the static metrics of the code, so it points
+        at concrete hotspots even without Ollama.
+
         Args:
             code: Code to review
             language: Programming language
-            
+
         Returns:
             Mock review dictionary
         """
+        metrics = get_code_metrics(code, language)
         lang_text = language if language else "this code"
-        code_length = len(code.strip().split('\n'))
-        
-        # Determine complexity heuristic
-        complexity = "simple" if code_length < 10 else "moderately complex" if code_length < 30 else "complex"
-        rating = 4 if code_length < 10 else 3 if code_length < 30 else 2
-        
-        review = f"""I've examined the {complexity} {lang_text} snippet through the lens of Clean Code principles. The code has several areas where it could better adhere to SOLID principles and clean code practices. Function naming and responsibility could be improved to enhance readability and maintainability."""
-        
-        suggestions = [
+        complexity = self._describe_complexity(metrics)
+
+        review = f"""I've examined the {complexity} {lang_text} snippet through the lens of Clean Code principles. {self._describe_metrics(metrics)}The code has several areas where it could better adhere to SOLID principles and clean code practices. Function naming and responsibility could be improved to enhance readability and maintainability."""
+
+        suggestions = []
+        for function in hotspots(metrics):
+            name = function["name"]
+            if function["complexity"] > COMPLEXITY_THRESHOLD:
+                suggestions.append(f"Split {name} into functions that each do one thing (cyclomatic complexity {function['complexity']})")
+            if function["length"] > LENGTH_THRESHOLD:
+                suggestions.append(f"Keep {name} small: at {function['length']} lines it should be broken into several short functions")
+            if function["nesting"] > NESTING_THRESHOLD:
+                suggestions.append(f"Flatten {name}: nesting depth {function['nesting']} hides its intent, so extract the inner blocks")
+            if function["parameters"] > PARAMETER_THRESHOLD:
+                suggestions.append(f"Reduce the {function['parameters']} parameters of {name} by grouping related ones into an object")
+
+        suggestions.extend([
             "Use more descriptive names for variables and functions",
             "Ensure each function does one thing well",
             "Keep functions small and focused on a single responsibility",
             "Add meaningful comments explaining 'why' not 'what'"
-        ]
-        
+        ])
+
         if complexity == "complex":
             suggestions.append("Apply the Single Responsibility Principle more rigorously")
             suggestions.append("Reduce function parameter counts for simpler interfaces")
-            
+
         return {
             "review": review,
             "suggestions": suggestions,
-            "rating": rating
-        } 
\ No newline at end of file
+            "rating": self._rate_metrics(metrics)
+        }
+
+    @staticmethod
+    def _describe_complexity(metrics: Dict[str, Any]) -> str:
+        """Describe how complex code is, from its metrics.
+
+        Args:
+            metrics: Static metrics of the code
+
+        Returns:
+            'simple', 'moderately complex' or 'complex'
+        """
+        if metrics["functions"]:
+            worst = max(metrics["max_complexity"], metrics["max_length"] // 5)
+            return "simple" if worst <= 5 else "moderately complex" if worst <= 10 else "complex"
+
+        # Without functions to measure, fall back to the size of the code
+        code_length = metrics["code_lines"]
+        return "simple" if code_length < 10 else "moderately complex" if code_length < 30 else "complex"
+
+    @staticmethod
+    def _describe_metrics(metrics: Dict[str, Any]) -> str:
+        """Describe the static metrics of code in a sentence or two.
+
+        Args:
+            metrics: Static metrics of the code
+
+        Returns:
+            Description ending with a space, or an empty string if no
+            functions were found
+        """
+        functions = metrics["functions"]
+        if not functions:
+            return ""
+
+        worst = max(functions, key=lambda f: f["complexity"])
+        text = (
+            f"It defines {len(functions)} function{'s' if len(functions) != 1 else ''} with an average "
+            f"cyclomatic complexity of {metrics['average_complexity']} (highest: {worst['name']} at {worst['complexity']}); "
+            f"the longest is {metrics['max_length']} lines and the deepest nesting is {metrics['max_nesting']} levels. "
+        )
+        found = hotspots(metrics)
+        if found:
+            text += f"The main hotspots are {', '.join(f['name'] for f in found)}. "
+        return text
+
+    @staticmethod
+    def _rate_metrics(metrics: Dict[str, Any]) -> int:
+        """Rate code from 1 to 5 based on its static metrics.
+
+        Args:
+            metrics: Static metrics of the code
+
+        Returns:
+            Rating, lower for complex, long or deeply nested functions and
+            functions with many parameters
+        """
+        if not metrics["functions"]:
+            code_length = metrics["code_lines"]
+            return 4 if code_length < 10 else 3 if code_length < 30 else 2
+
+        rating = 5
+        if metrics["max_complexity"] > COMPLEXITY_THRESHOLD:
+            rating -= 1
+        if metrics["max_complexity"] > 2 * COMPLEXITY_THRESHOLD:
+            rating -= 1
+        if metrics["max_length"] > LENGTH_THRESHOLD:
+            rating -= 1
+        if metrics["max_nesting"] > NESTING_THRESHOLD:
+            rating -= 1
+        if metrics["max_parameters"] > PARAMETER_THRESHOLD:
+            rating -= 1
+        return max(1, rating)
@@ -0,0 +1,190 @@
+"""
+Semantic Search
+
+Embeds the code reviews stored in the knowledge graph with Ollama and finds
+them by meaning rather than by their literal words, using the vector index.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import anyio
+
+from knowledge_graph import project_node
+from ollama_service import PRIORITY_BATCH, PRIORITY_INTERACTIVE, ProgressCallback
+from vector_index import VectorIndex
+
+# Types of the nodes that are embedded
+SEMANTIC_NODE_TYPES = ["CodeReview"]
+
+# Number of nodes read from the graph and embedded per step
+DEFAULT_INDEX_BATCH_SIZE = 128
+
+# Number of new reviews a search reads and embeds before it runs; any
+# further reviews are left to backfill_embeddings
+SEARCH_CATCH_UP_SIZE = 32
+
+
+def review_text(node: Dict[str, Any]) -> str:
+    """Get the text of a review node that is embedded.
+
+    Args:
+        node: Review node
+
+    Returns:
+        The review followed by its suggestions
+    """
+    properties = node.get("properties", {})
+    text = str(properties.get("review") or "")
+    suggestions = properties.get("suggestions") or []
+    if suggestions:
+        text += "\n\nSuggestions:\n" + "\n".join(f"- {suggestion}" for suggestion in suggestions)
+    return text
+
+
+class SemanticSearch:
+    """Semantic search over the reviews in a knowledge graph.
+
+    Reviews are embedded page by page in insertion order. The vector index
+    remembers the page where indexing stopped, so indexing new reviews only
+    reads the graph from there on.
+    """
+
+    def __init__(self, knowledge_graph, ollama_service, vector_index: VectorIndex):
+        """Initialize semantic search.
+
+        Args:
+            knowledge_graph: The knowledge graph instance
+            ollama_service: The Ollama service instance, used for embeddings
+            vector_index: The vector index holding the embeddings
+        """
+        self.knowledge_graph = knowledge_graph
+        self.ollama_service = ollama_service
+        self.vector_index = vector_index
+        # Only one indexing run at a time, so no page is embedded twice
+        self._indexing = anyio.Lock()
+
+    async def index_new_nodes(
+        self,
+        batch_size: int = DEFAULT_INDEX_BATCH_SIZE,
+        priority: str = PRIORITY_INTERACTIVE,
+        progress: Optional[ProgressCallback] = None,
+        max_steps: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Embed the reviews that are not in the vector index yet.
+
+        Args:
+            batch_size: Number of reviews read and embedded per step
+            priority: Scheduling priority of the embedding requests
+            progress: Optional callback notified with the number of reviews
+                read so far
+            max_steps: Optional maximum number of steps; the next run
+                continues where this one stopped
+
+        Returns:
+            Number of reviews embedded by this run and in the index overall
+
+        Raises:
+            EmbeddingError: If Ollama cannot embed the reviews
+        """
+        async with self._indexing:
+            # Vectors of another model cannot be compared with new ones
+            if self.vector_index.model not in (None, self.ollama_service.embed_model):
+                print(f"Embedding model changed to {self.ollama_service.embed_model}, re-indexing reviews")
+                self.vector_index.clear()
+
+            cursor = self.vector_index.cursor
+            embedded = 0
+            read = 0
+            steps = 0
+            while max_steps is None or steps < max_steps:
+                steps += 1
+                page, next_cursor = self.knowledge_graph.get_nodes_page(
+                    node_types=SEMANTIC_NODE_TYPES,
+                    cursor=cursor,
+                    limit=max(1, batch_size)
+                )
+                # The last page is read again next time, as it may still grow
+                step_cursor = cursor if next_cursor is None else next_cursor
+                new_nodes = [node for node in page if node["name"] not in self.vector_index]
+                if new_nodes:
+                    vectors = await self.ollama_service.embed([review_text(node) for node in new_nodes], priority)
+                    # The vectors and the cursor are saved with one metadata write
+                    self.vector_index.add(
+                        [node["name"] for node in new_nodes],
+                        vectors,
+                        self.ollama_service.embed_model,
+                        cursor=step_cursor
+                    )
+                    embedded += len(new_nodes)
+                else:
+                    self.vector_index.set_cursor(step_cursor)
+
+                read += len(page)
+                if progress:
+                    await progress(read, None)
+
+                if next_cursor is None:
+                    break
+                cursor = next_cursor
+
+            return {"embedded": embedded, "indexed": len(self.vector_index)}
+
+    async def backfill(
+        self,
+        batch_size: int = DEFAULT_INDEX_BATCH_SIZE,
+        rebuild: bool = False,
+        progress: Optional[ProgressCallback] = None
+    ) -> Dict[str, Any]:
+        """Embed all existing reviews in batches.
+
+        Args:
+            batch_size: Number of reviews read and embedded per step
+            rebuild: Whether to discard the index and embed every review again
+            progress: Optional callback notified with the number of reviews
+                read so far
+
+        Returns:
+            Number of reviews embedded by this run and in the index overall
+        """
+        if rebuild:
+            self.vector_index.clear()
+        return await self.index_new_nodes(batch_size, PRIORITY_BATCH, progress)
+
+    async def search(
+        self,
+        query: str,
+        limit: int = 5,
+        fields: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Find the reviews closest in meaning to a query.
+
+        Up to SEARCH_CATCH_UP_SIZE reviews that are not indexed yet are
+        embedded first, unless indexing is already running (e.g. a backfill).
+        The search only covers the reviews indexed at that point.
+
+        Args:
+            query: Text describing what to look for
+            limit: Maximum number of reviews
+            fields: Optional node fields to keep, as in project_node
+
+        Returns:
+            The reviews with their cosine similarity 'score', best first
+
+        Raises:
+            EmbeddingError: If Ollama cannot embed the query or new reviews
+        """
+        if not self._indexing.locked():
+            await self.index_new_nodes(SEARCH_CATCH_UP_SIZE, max_steps=1)
+        vector = (await self.ollama_service.embed([query]))[0]
+
+        results = []
+        for name, score in self.vector_index.search(vector, limit):
+            node = self.knowledge_graph.get_node(name)
+            if node is None:
+                continue
+            results.append({**project_node({"name": name, **node}, fields), "score": round(score, 4)})
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the statistics of the vector index."""
+        return self.vector_index.stats()
@@ -8,31 +8,152 @@ using the Model Context Protocol (MCP).
 import os
 import anyio
 import click
+import contextlib
 import json
-from typing import Dict, List, Any
+import time
+from typing import Dict, List, Any, Optional
 
 import mcp.types as types
 from mcp.server.lowlevel import Server
 from dotenv import load_dotenv
 
-from knowledge_graph import KnowledgeGraph
-from ollama_service import OllamaService
-from experts import get_all_experts
+from code_similarity import DEFAULT_SIMILARITY_THRESHOLD
+from knowledge_graph import SQLITE_URL_PREFIX, open_knowledge_graph, parse_cursor, parse_limit, project_node
+from metrics import CONTENT_TYPE, REGISTRY
+from tracing import TRACER, span, trace_request
+from ollama_service import OllamaService, ProgressCallback
+from semantic_search import DEFAULT_INDEX_BATCH_SIZE, SemanticSearch
+from vector_index import VectorIndex
+from experts import BatchReviewer, ExpertPanel, find_similar_snippets, get_all_experts
+from experts.batch import DEFAULT_BATCH_CONCURRENCY, ResultCallback
 
 # Load environment variables
 load_dotenv()
 
 # Initialize knowledge graph
 STORAGE_PATH = os.environ.get("KNOWLEDGE_GRAPH_PATH", "data/knowledge_graph.json")
-os.makedirs(os.path.dirname(STORAGE_PATH), exist_ok=True)
-knowledge_graph = KnowledgeGraph(STORAGE_PATH)
+PERSISTENCE_MODE = os.environ.get("KNOWLEDGE_GRAPH_PERSISTENCE", "wal")
+COMPACT_THRESHOLD = int(os.environ.get("KNOWLEDGE_GRAPH_COMPACT_THRESHOLD", "1000"))
+knowledge_graph = open_knowledge_graph(
+    STORAGE_PATH,
+    persistence=PERSISTENCE_MODE,
+    compact_threshold=COMPACT_THRESHOLD
+)
 
 # Initialize Ollama service
 ollama_service = OllamaService()
 
+# Initialize the review embeddings, stored next to the graph by default
+VECTOR_INDEX_PATH = os.environ.get("VECTOR_INDEX_PATH") or os.path.splitext(
+    STORAGE_PATH[len(SQLITE_URL_PREFIX):] if STORAGE_PATH.startswith(SQLITE_URL_PREFIX) else STORAGE_PATH
+)[0] + ".vectors"
+semantic_search = SemanticSearch(knowledge_graph, ollama_service, VectorIndex(VECTOR_INDEX_PATH))
+
 # Initialize experts with shared resources
 experts = list(get_all_experts(knowledge_graph, ollama_service))
 experts_by_tool = {expert.tool_name: expert for expert in experts}
+panel = ExpertPanel(experts, knowledge_graph, ollama_service)
+batch_reviewers_by_tool = {
+    reviewer.tool_name: reviewer
+    for reviewer in (BatchReviewer(expert, knowledge_graph) for expert in experts)
+}
+
+# Minimum interval between two progress notifications for one request, in seconds
+PROGRESS_INTERVAL = 0.25
+
+# MCP log levels by increasing severity; clients can raise the minimum level
+LOG_LEVELS = ["debug", "info", "notice", "warning", "error", "critical", "alert", "emergency"]
+
+# Input schema properties shared by the paginated knowledge graph tools
+PAGINATION_PROPERTIES = {
+    "cursor": {
+        "type": "string",
+        "description": "Cursor returned as next_cursor by the previous page"
+    },
+    "limit": {
+        "type": "integer",
+        "minimum": 1,
+        "description": "Maximum number of nodes to return"
+    },
+    "types": {
+        "type": "array",
+        "items": {"type": "string"},
+        "description": "Only return nodes of these types (e.g. 'CodeReview')"
+    },
+    "fields": {
+        "type": "array",
+        "items": {"type": "string"},
+        "description": "Only return these node fields, e.g. ['type', 'properties.rating']; the name is always included"
+    }
+}
+
+# Tool call metrics, exported at /metrics on the SSE transport
+TOOL_CALLS = REGISTRY.counter(
+    "mcp_tool_calls_total",
+    "Tool calls per tool and outcome",
+    ["tool", "outcome"]
+)
+TOOL_DURATION_SECONDS = REGISTRY.histogram(
+    "mcp_tool_duration_seconds",
+    "Duration of tool calls",
+    ["tool"],
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+
+# Service state copied into gauges on every scrape
+QUEUE_DEPTH = REGISTRY.gauge("ollama_queue_depth", "Requests waiting for a generation slot", ["priority"])
+IN_FLIGHT = REGISTRY.gauge("ollama_in_flight", "Generations currently sent to Ollama")
+MAX_IN_FLIGHT = REGISTRY.gauge("ollama_max_in_flight", "Maximum number of concurrent generations")
+QUEUE_REJECTED = REGISTRY.counter("ollama_queue_rejected_total", "Requests rejected because the queue was full")
+HOST_HEALTHY = REGISTRY.gauge("ollama_host_healthy", "Whether an Ollama host is healthy (1) or not (0)", ["host"])
+HOST_OUTSTANDING = REGISTRY.gauge("ollama_host_outstanding", "Requests outstanding per Ollama host", ["host"])
+CACHE_HITS = REGISTRY.counter("ollama_cache_hits_total", "Review response cache hits")
+CACHE_MISSES = REGISTRY.counter("ollama_cache_misses_total", "Review response cache misses")
+CACHE_HIT_RATIO = REGISTRY.gauge("ollama_cache_hit_ratio", "Fraction of review lookups served from the response cache")
+GRAPH_NODES = REGISTRY.gauge("knowledge_graph_nodes", "Nodes in the knowledge graph")
+GRAPH_EDGES = REGISTRY.gauge("knowledge_graph_edges", "Edges in the knowledge graph")
+INDEXED_VECTORS = REGISTRY.gauge("vector_index_vectors", "Reviews embedded for semantic search")
+
+def collect_service_metrics() -> None:
+    """Copy the current service statistics into their gauges and counters."""
+    stats = ollama_service.get_stats()
+    scheduler = stats["scheduler"]
+    for priority, depth in scheduler["queue_depth"].items():
+        QUEUE_DEPTH.set(depth, priority=priority)
+    IN_FLIGHT.set(scheduler["in_flight"])
+    MAX_IN_FLIGHT.set(scheduler["max_in_flight"])
+    QUEUE_REJECTED.set(scheduler["rejected"])
+    for host in stats["hosts"]:
+        HOST_HEALTHY.set(1 if host["state"] == "healthy" else 0, host=host["url"])
+        HOST_OUTSTANDING.set(host["outstanding"], host=host["url"])
+    CACHE_HITS.set(stats["cache"]["hits"])
+    CACHE_MISSES.set(stats["cache"]["misses"])
+    CACHE_HIT_RATIO.set(stats["cache"]["hit_rate"])
+    GRAPH_NODES.set(len(knowledge_graph.nodes))
+    GRAPH_EDGES.set(len(knowledge_graph.edges))
+    INDEXED_VECTORS.set(len(semantic_search.vector_index))
+
+REGISTRY.add_collector(collect_service_metrics)
+
+def paginated(nodes: List[Dict[str, Any]], next_cursor: Any, arguments: Dict[str, Any]) -> Any:
+    """Wrap a page of nodes in a {nodes, next_cursor} envelope when paging was requested.
+    
+    Without a cursor or limit the plain list of nodes is returned, as before
+    pagination was introduced.
+    """
+    if arguments.get("cursor") is None and arguments.get("limit") is None:
+        return nodes
+    return {"nodes": nodes, "next_cursor": next_cursor}
+
+def is_retryable(error: BaseException) -> bool:
+    """Check whether a failed tool call can be retried later.
+    
+    Errors raised inside an anyio task group arrive wrapped in an exception
+    group, so the retryable flag is also looked up on the grouped errors.
+    """
+    if getattr(error, "retryable", False):
+        return True
+    return any(is_retryable(sub_error) for sub_error in getattr(error, "exceptions", ()))
 
 @click.command()
 @click.option("--port", default=8000, help="Port to listen on for SSE")
@@ -47,7 +168,7 @@ def main(port: int, transport: str) -> int:
     
     print(f"Starting MCP Code Expert System")
     print(f"Transport: {transport}")
-    print(f"Ollama service available: {ollama_service.is_available}")
+    print(f"Ollama hosts: {', '.join(h.url for h in ollama_service.hosts)} (availability is probed in the background)")
     print(f"Experts loaded: {', '.join(expert.name for expert in experts)}")
     
     # Create server
@@ -67,15 +188,37 @@ def main(port: int, transport: str) -> int:
                     inputSchema=expert.input_schema
                 )
             )
+        tools.append(
+            types.Tool(
+                name=panel.tool_name,
+                description=panel.tool_description,
+                inputSchema=panel.input_schema
+            )
+        )
+        for reviewer in batch_reviewers_by_tool.values():
+            tools.append(
+                types.Tool(
+                    name=reviewer.tool_name,
+                    description=reviewer.tool_description,
+                    inputSchema=reviewer.input_schema
+                )
+            )
         
         # Add knowledge graph tools
         tools.extend([
             types.Tool(
                 name="read_graph",
-                description="Read the entire knowledge graph",
+                description="Read the knowledge graph, optionally one page of nodes (with their outgoing edges) at a time",
                 inputSchema={
                     "type": "object",
-                    "properties": {}
+                    "properties": {
+                        **PAGINATION_PROPERTIES,
+                        "include_edges": {
+                            "type": "boolean",
+                            "description": "Whether to include the edges leaving the returned nodes",
+                            "default": True
+                        }
+                    }
                 }
             ),
             types.Tool(
@@ -87,8 +230,9 @@ def main(port: int, transport: str) -> int:
                     "properties": {
                         "query": {
                             "type": "string",
-                            "description": "The search query"
-                        }
+                            "description": "The search query (nodes must contain every word)"
+                        },
+                        **PAGINATION_PROPERTIES
                     }
                 }
             ),
@@ -103,6 +247,127 @@ def main(port: int, transport: str) -> int:
                             "type": "array",
                             "items": {"type": "string"},
                             "description": "List of node names to open"
+                        },
+                        **PAGINATION_PROPERTIES
+                    }
+                }
+            ),
+            types.Tool(
+                name="get_slow_requests",
+                description="Get the slowest recent tool calls with the time spent in each stage (validation, queueing, Ollama prefill and generation, parsing, graph writes)",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "limit": {
+                            "type": "integer",
+                            "description": "Maximum number of requests to return",
+                            "default": 10
+                        },
+                        "tool": {
+                            "type": "string",
+                            "description": "Only include calls of this tool, e.g. 'ask_bob'"
+                        }
+                    }
+                }
+            ),
+            types.Tool(
+                name="get_service_stats",
+                description="Get statistics of the review service, such as response cache hits and misses",
+                inputSchema={
+                    "type": "object",
+                    "properties": {}
+                }
+            ),
+            types.Tool(
+                name="get_related_nodes",
+                description="Get the nodes connected to a node in the knowledge graph",
+                inputSchema={
+                    "type": "object",
+                    "required": ["name"],
+                    "properties": {
+                        "name": {
+                            "type": "string",
+                            "description": "Name of the node"
+                        },
+                        "edge_type": {
+                            "type": "string",
+                            "description": "Only follow edges of this type (e.g. 'authored', 'reviews')"
+                        },
+                        "direction": {
+                            "type": "string",
+                            "enum": ["outgoing", "incoming"],
+                            "description": "Only follow edges in this direction"
+                        }
+                    }
+                }
+            ),
+            types.Tool(
+                name="find_similar_code",
+                description="Find stored code snippets that are near-duplicates of some code, with their reviews",
+                inputSchema={
+                    "type": "object",
+                    "required": ["code"],
+                    "properties": {
+                        "code": {
+                            "type": "string",
+                            "description": "The code to find similar snippets for"
+                        },
+                        "language": {
+                            "type": "string",
+                            "description": "The programming language"
+                        },
+                        "threshold": {
+                            "type": "number",
+                            "minimum": 0,
+                            "maximum": 1,
+                            "description": "Minimum estimated similarity of the token shingles",
+                            "default": DEFAULT_SIMILARITY_THRESHOLD
+                        },
+                        "limit": {
+                            "type": "integer",
+                            "minimum": 1,
+                            "description": "Maximum number of snippets to return",
+                            "default": 5
+                        }
+                    }
+                }
+            ),
+            types.Tool(
+                name="semantic_search",
+                description="Find code reviews by meaning, e.g. 'reviews about god classes', using embeddings",
+                inputSchema={
+                    "type": "object",
+                    "required": ["query"],
+                    "properties": {
+                        "query": {
+                            "type": "string",
+                            "description": "What the reviews should be about"
+                        },
+                        "limit": {
+                            "type": "integer",
+                            "minimum": 1,
+                            "description": "Maximum number of reviews to return",
+                            "default": 5
+                        },
+                        "fields": PAGINATION_PROPERTIES["fields"]
+                    }
+                }
+            ),
+            types.Tool(
+                name="backfill_embeddings",
+                description="Embed the stored code reviews that are not in the semantic search index yet",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "batch_size": {
+                            "type": "integer",
+                            "description": "Number of reviews embedded per step",
+                            "default": DEFAULT_INDEX_BATCH_SIZE
+                        },
+                        "rebuild": {
+                            "type": "boolean",
+                            "description": "Whether to discard the index and embed every review again",
+                            "default": False
                         }
                     }
                 }
@@ -115,45 +380,196 @@ def main(port: int, transport: str) -> int:
         
         return tools
     
+    # Minimum level of log messages sent to clients
+    log_level = "info"
+    
+    @app.set_logging_level()
+    async def set_logging_level(level: types.LoggingLevel) -> None:
+        """Set the minimum level of log messages sent to the client"""
+        nonlocal log_level
+        log_level = level
+    
     @app.call_tool()
-    async def call_tool(name: str, arguments: Dict[str, Any]) -> Any:
+    async def call_tool(name: str, arguments: Dict[str, Any]) -> List[types.TextContent]:
         """Handle tool calls"""
         print(f"Tool call: {name} with arguments: {json.dumps(arguments)[:100]}")
         
-        try:
-            # Handle expert tools
-            if name in experts_by_tool:
-                expert = experts_by_tool[name]
-                from experts import CodeReviewRequest
-                response = await expert.review_code(CodeReviewRequest(**arguments))
-                return response.model_dump()
+        start = time.monotonic()
+        outcome = "success"
+        with trace_request(name, tool=name) as request_span:
+            try:
+                result = await dispatch_tool(name, arguments)
+            except Exception as e:
+                print(f"Error handling tool call {name}: {e}")
+                result = {
+                    "error": str(e),
+                    "success": False
+                }
+                if is_retryable(e):
+                    result["retryable"] = True
+                outcome = "error"
+                request_span.set_error(e)
             
-            # Handle knowledge graph tools
-            elif name == "read_graph":
-                return knowledge_graph.get_all()
-                
-            elif name == "search_nodes":
-                query = arguments.get("query", "")
-                return knowledge_graph.search_nodes(query)
-                
-            elif name == "open_nodes":
-                names = arguments.get("names", [])
-                results = []
-                for name in names:
-                    node = knowledge_graph.get_node(name)
-                    if node:
-                        results.append({"name": name, **node})
-                return results
+        TOOL_DURATION_SECONDS.observe(time.monotonic() - start, tool=name)
+        TOOL_CALLS.inc(tool=name, outcome=outcome)
+        return [types.TextContent(type="text", text=json.dumps(result))]
+    
+    def progress_reporter() -> Optional[ProgressCallback]:
+        """Create a callback that forwards progress to the client of the current request.
+        
+        Returns None when the client did not ask for progress notifications.
+        Notifications are throttled to one per PROGRESS_INTERVAL.
+        """
+        context = app.request_context
+        progress_token = context.meta.progressToken if context.meta else None
+        if progress_token is None:
+            return None
+            
+        last_sent = 0.0
+        
+        async def report(progress: float, total: Optional[float] = None) -> None:
+            nonlocal last_sent
+            now = time.monotonic()
+            if now - last_sent < PROGRESS_INTERVAL:
+                return
+            last_sent = now
+            await context.session.send_progress_notification(progress_token, progress, total)
+            
+        return report
+    
+    def batch_result_reporter(tool_name: str, total: int) -> ResultCallback:
+        """Create a callback that streams batch item results to the client of the current request.
+        
+        Each result is sent as a log message as soon as it is complete, and
+        the number of completed items is reported as progress.
+        """
+        context = app.request_context
+        progress = progress_reporter()
+        completed = 0
+        
+        async def report(result: Dict[str, Any]) -> None:
+            nonlocal completed
+            completed += 1
+            level = "info" if result["success"] else "warning"
+            if LOG_LEVELS.index(level) >= LOG_LEVELS.index(log_level):
+                await context.session.send_log_message(level, result, logger=tool_name)
+            if progress:
+                await progress(completed, total)
                 
-            else:
-                raise ValueError(f"Unknown tool: {name}")
+        return report
+    
+    async def dispatch_tool(name: str, arguments: Dict[str, Any]) -> Any:
+        """Run a tool and return its JSON-serializable result"""
+        # Handle expert tools
+        if name in experts_by_tool:
+            expert = experts_by_tool[name]
+            from experts import CodeReviewRequest
+            with span("validate_request"):
+                request = CodeReviewRequest(**arguments)
+            response = await expert.review_code(request, progress=progress_reporter())
+            return response.model_dump()
             
-        except Exception as e:
-            print(f"Error handling tool call {name}: {e}")
-            return {
-                "error": str(e),
-                "success": False
+        elif name in batch_reviewers_by_tool:
+            reviewer = batch_reviewers_by_tool[name]
+            requests = arguments.get("requests", [])
+            return await reviewer.review_batch(
+                requests,
+                concurrency=arguments.get("concurrency", DEFAULT_BATCH_CONCURRENCY),
+                on_result=batch_result_reporter(name, len(requests))
+            )
+            
+        elif name == panel.tool_name:
+            from experts import CodeReviewRequest
+            with span("validate_request"):
+                request = CodeReviewRequest(**arguments)
+            return await panel.review_code(request, progress=progress_reporter())
+        
+        # Handle knowledge graph tools
+        elif name == "read_graph":
+            if not arguments:
+                return knowledge_graph.get_all()
+                
+            fields = arguments.get("fields")
+            nodes, next_cursor = knowledge_graph.get_nodes_page(
+                node_types=arguments.get("types"),
+                cursor=arguments.get("cursor"),
+                limit=parse_limit(arguments.get("limit"))
+            )
+            page = {
+                "nodes": [project_node(node, fields) for node in nodes],
+                "next_cursor": next_cursor
             }
+            if arguments.get("include_edges", True):
+                page["edges"] = knowledge_graph.get_outgoing_edges([node["name"] for node in nodes])
+            return page
+            
+        elif name == "search_nodes":
+            fields = arguments.get("fields")
+            nodes, next_cursor = knowledge_graph.get_nodes_page(
+                query=arguments.get("query", ""),
+                node_types=arguments.get("types"),
+                cursor=arguments.get("cursor"),
+                limit=parse_limit(arguments.get("limit"))
+            )
+            return paginated([project_node(node, fields) for node in nodes], next_cursor, arguments)
+            
+        elif name == "open_nodes":
+            names = arguments.get("names", [])
+            fields = arguments.get("fields")
+            node_types = arguments.get("types")
+            limit = parse_limit(arguments.get("limit"))
+            
+            # The cursor of open_nodes is an offset into the requested names
+            results = []
+            next_cursor = None
+            for offset in range(parse_cursor(arguments.get("cursor")), len(names)):
+                node = knowledge_graph.get_node(names[offset])
+                if not node or (node_types and node.get("type") not in node_types):
+                    continue
+                if limit is not None and len(results) >= limit:
+                    next_cursor = str(offset)
+                    break
+                results.append(project_node({"name": names[offset], **node}, fields))
+            return paginated(results, next_cursor, arguments)
+            
+        elif name == "get_related_nodes":
+            return knowledge_graph.get_related_nodes(
+                arguments.get("name", ""),
+                edge_type=arguments.get("edge_type"),
+                direction=arguments.get("direction")
+            )
+            
+        elif name == "find_similar_code":
+            return find_similar_snippets(
+                knowledge_graph,
+                arguments.get("code", ""),
+                language=arguments.get("language"),
+                threshold=arguments.get("threshold", DEFAULT_SIMILARITY_THRESHOLD),
+                limit=parse_limit(arguments.get("limit", 5))
+            )
+            
+        elif name == "semantic_search":
+            return await semantic_search.search(
+                arguments.get("query", ""),
+                limit=parse_limit(arguments.get("limit", 5)),
+                fields=arguments.get("fields")
+            )
+            
+        elif name == "backfill_embeddings":
+            return await semantic_search.backfill(
+                batch_size=arguments.get("batch_size", DEFAULT_INDEX_BATCH_SIZE),
+                rebuild=arguments.get("rebuild", False),
+                progress=progress_reporter()
+            )
+            
+        elif name == "get_slow_requests":
+            return TRACER.slowest(arguments.get("limit", 10), name=arguments.get("tool"))
+            
+        elif name == "get_service_stats":
+            return {**ollama_service.get_stats(), "vector_index": semantic_search.stats()}
+            
+        else:
+            raise ValueError(f"Unknown tool: {name}")
     
     # Run with the appropriate transport
     if transport == "sse":
@@ -162,6 +578,7 @@ def main(port: int, transport: str) -> int:
         from starlette.routing import Mount, Route
         from starlette.middleware import Middleware
         from starlette.middleware.cors import CORSMiddleware
+        from starlette.responses import Response
         
         # Create SSE transport
         sse = SseServerTransport("/messages/")
@@ -175,11 +592,24 @@ def main(port: int, transport: str) -> int:
                     streams[0], streams[1], app.create_initialization_options()
                 )
         
+        async def handle_metrics(request):
+            return Response(REGISTRY.render(), headers={"Content-Type": CONTENT_TYPE})
+        
+        @contextlib.asynccontextmanager
+        async def lifespan(app):
+            async with anyio.create_task_group() as tg:
+                tg.start_soon(ollama_service.run_health_checks)
+                yield
+                tg.cancel_scope.cancel()
+            await ollama_service.aclose()
+        
         # Create Starlette app with CORS middleware
         starlette_app = Starlette(
             debug=True,
+            lifespan=lifespan,
             routes=[
                 Route("/sse", endpoint=handle_sse),
+                Route("/metrics", endpoint=handle_metrics),
                 Mount("/messages/", app=sse.handle_post_message),
             ],
             middleware=[
@@ -194,15 +624,22 @@ def main(port: int, transport: str) -> int:
         
         import uvicorn
         print(f"SSE endpoint: http://localhost:{port}/sse")
+        print(f"Metrics endpoint: http://localhost:{port}/metrics")
         uvicorn.run(starlette_app, host="0.0.0.0", port=port)
     else:
         from mcp.server.stdio import stdio_server
         
         async def arun():
-            async with stdio_server() as streams:
-                await app.run(
-                    streams[0], streams[1], app.create_initialization_options()
-                )
+            try:
+                async with anyio.create_task_group() as tg:
+                    tg.start_soon(ollama_service.run_health_checks)
+                    async with stdio_server() as streams:
+                        await app.run(
+                            streams[0], streams[1], app.create_initialization_options()
+                        )
+                    tg.cancel_scope.cancel()
+            finally:
+                await ollama_service.aclose()
         
         anyio.run(arun)
     
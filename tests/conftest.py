@@ -0,0 +1,21 @@
+"""
+Shared test setup
+
+Keeps the modules under test from writing caches, traces and the
+knowledge graph into the working directory, and runs async tests on asyncio.
+"""
+
+import os
+import tempfile
+
+import pytest
+
+# Read by the modules at import time; load_dotenv does not override them
+os.environ["OLLAMA_CACHE_PATH"] = ""
+os.environ["TRACE_PATH"] = ""
+os.environ["KNOWLEDGE_GRAPH_PATH"] = os.path.join(tempfile.mkdtemp(), "knowledge_graph.json")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
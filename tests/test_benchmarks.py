@@ -0,0 +1,150 @@
+"""
+Tests of the load test report and the mock Ollama server
+"""
+
+import json
+import random
+import sys
+from pathlib import Path
+
+import click
+import httpx
+import pytest
+
+from ollama_service import OllamaService, ResponseCache
+
+# The benchmarks are scripts rather than a package, as in load_test.py
+sys.path.insert(0, str(Path(__file__).parent.parent / "benchmarks"))
+
+from mock_ollama import MockOllama, parse_distribution, request_key
+from report import compare, format_report, summarize
+
+
+# Report
+
+
+def sample(latency, ok=True, reviews=1, fallback=0, error=None):
+    return {"latency": latency, "ok": ok, "reviews": reviews, "fallback": fallback, "error": error}
+
+
+def test_summary_has_latency_percentiles_and_throughput():
+    samples = [sample(latency / 100) for latency in range(1, 101)] + [sample(5.0, ok=False, error="timeout")]
+
+    summary = summarize(samples, wall_seconds=10)
+
+    assert (summary["calls"], summary["succeeded"], summary["failed"]) == (101, 100, 1)
+    assert summary["latency_ms"]["p50"] == pytest.approx(505.0)
+    assert summary["latency_ms"]["p99"] == pytest.approx(990.1)
+    assert summary["latency_ms"]["max"] == 1000.0
+    assert (summary["reviews_per_second"], summary["calls_per_second"]) == (10.0, 10.0)
+    assert summary["errors"] == {"timeout": 1}
+
+
+def test_report_notes_failures_and_fallback_reviews():
+    summary = summarize([sample(0.1, fallback=1), sample(0.1, ok=False, error="queue full")], wall_seconds=1)
+
+    report = format_report({"stdio": summary})
+
+    assert report.splitlines()[1].startswith("stdio")
+    assert "stdio: 1 call(s) failed: queue full" in report
+    assert "1 review(s) came from the heuristic fallback" in report
+
+
+def test_regressions_beyond_the_tolerance_are_reported():
+    baseline = {"stdio": summarize([sample(0.1)] * 10, wall_seconds=1), "sse": summarize([sample(0.1)], wall_seconds=1)}
+    results = {
+        "stdio": summarize([sample(0.2)] * 10, wall_seconds=2),
+        "sse": summarize([sample(0.11)], wall_seconds=1),
+        "new": summarize([sample(9.0)], wall_seconds=1)
+    }
+
+    assert compare(results, baseline, max_regression=0.2) == [
+        "stdio: p95 latency 100.0 ms -> 200.0 ms",
+        "stdio: reviews/s 10.00 -> 5.00"
+    ]
+
+
+# Mock Ollama
+
+
+def test_distributions_are_parsed_and_never_negative():
+    rng = random.Random(0)
+
+    assert parse_distribution("0.2")(rng) == 0.2
+    assert 0.1 <= parse_distribution("uniform:0.1,0.5")(rng) <= 0.5
+    assert parse_distribution("normal:-5,0.1")(rng) == 0.0
+    with pytest.raises(click.BadParameter):
+        parse_distribution("normal:1")
+    with pytest.raises(click.BadParameter):
+        parse_distribution("zipf:1")
+
+
+def make_mock(**options):
+    options = {
+        "latency": parse_distribution("0"),
+        "token_rate": parse_distribution("0"),
+        "tokens": parse_distribution("20"),
+        "embed_latency": parse_distribution("0"),
+        "embed_dim": 8,
+        **options
+    }
+    return MockOllama(**options)
+
+
+def mock_client(mock):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=mock.app), base_url="http://mock")
+
+
+@pytest.mark.anyio
+async def test_mock_generates_reviews_as_json_or_streamed_chunks():
+    mock = make_mock()
+    async with mock_client(mock) as client:
+        response = await client.post("/api/generate", json={"model": "m", "prompt": "p", "stream": False})
+        streamed = await client.post("/api/generate", json={"model": "m", "prompt": "p"})
+
+    review = json.loads(response.json()["response"])
+    assert set(review) == {"review", "suggestions", "rating"}
+    chunks = [json.loads(line) for line in streamed.text.splitlines()]
+    assert "".join(chunk["response"] for chunk in chunks) == response.json()["response"]
+    assert chunks[-1]["done"] and chunks[-1]["eval_count"] == len(chunks) - 1
+    assert mock.stats["generate"] == 2
+
+
+@pytest.mark.anyio
+async def test_mock_embeddings_are_deterministic_unit_vectors():
+    mock = make_mock()
+    async with mock_client(mock) as client:
+        first = (await client.post("/api/embed", json={"model": "e", "input": ["a", "b"]})).json()["embeddings"]
+        again = (await client.post("/api/embed", json={"model": "e", "input": "a"})).json()["embeddings"]
+
+    assert len(first) == 2 and len(first[0]) == 8
+    assert again == first[:1]
+    assert sum(value * value for value in first[0]) == pytest.approx(1.0, abs=1e-4)
+
+
+@pytest.mark.anyio
+async def test_mock_replays_recorded_responses(tmp_path):
+    path = tmp_path / "recording.jsonl"
+    recording = {"key": request_key("generate", "m", "p"), "tokens": ['{"review":', ' "Recorded"}'], "ttft": 0, "duration": 0}
+    path.write_text(json.dumps(recording) + "\n")
+    mock = make_mock(replay_path=str(path))
+
+    async with mock_client(mock) as client:
+        replayed = await client.post("/api/generate", json={"model": "m", "prompt": "p", "stream": False})
+        await client.post("/api/generate", json={"model": "m", "prompt": "other", "stream": False})
+
+    assert replayed.json()["response"] == '{"review": "Recorded"}'
+    assert (mock.stats["replayed"], mock.stats["missed"]) == (1, 1)
+
+
+@pytest.mark.anyio
+async def test_service_reviews_against_the_mock():
+    mock = make_mock()
+    service = OllamaService(hosts=["http://mock"], cache=ResponseCache(None), hedge=False)
+    service._client = mock_client(mock)
+
+    review = await service.get_martin_fowler_review("x = 1\n", "python")
+
+    assert review["model"] == service.model
+    assert 1 <= review["rating"] <= 5
+    assert mock.stats["generate"] == 1
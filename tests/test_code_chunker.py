@@ -0,0 +1,65 @@
+"""
+Tests of code chunking
+"""
+
+from code_chunker import CodeChunk, split_code
+
+
+def python_module(functions, body_lines=10):
+    return "\n\n".join(
+        f"def f{index}():\n" + "".join(f"    x{line} = {line}\n" for line in range(body_lines))
+        for index in range(functions)
+    )
+
+
+def test_small_code_is_a_single_chunk():
+    assert split_code("x = 1\ny = 2\n", "python", max_chars=100) == [CodeChunk(1, 2, "x = 1\ny = 2\n")]
+
+
+def test_chunks_cover_the_code_in_order():
+    code = python_module(6)
+
+    chunks = split_code(code, "python", max_chars=400)
+
+    assert len(chunks) > 1
+    assert "".join(chunk.code for chunk in chunks).strip() == code.strip()
+    assert all(len(chunk.code) <= 400 for chunk in chunks)
+    assert [chunk.start_line for chunk in chunks] == sorted(chunk.start_line for chunk in chunks)
+
+
+def test_python_is_split_at_function_boundaries():
+    chunks = split_code(python_module(4), "python", max_chars=200)
+
+    assert all(chunk.code.startswith("def ") for chunk in chunks[1:])
+
+
+def test_large_classes_are_split_between_methods():
+    methods = "\n".join(
+        f"    def m{index}(self):\n" + "".join(f"        y{line} = {line}\n" for line in range(8))
+        for index in range(4)
+    )
+    code = f"class Big:\n{methods}"
+
+    chunks = split_code(code, "python", max_chars=300)
+
+    assert len(chunks) > 1
+    assert all(chunk.code.lstrip().startswith("def ") for chunk in chunks[1:])
+
+
+def test_other_languages_are_split_at_unindented_lines_after_blank_lines():
+    function = "function f{index}() {{\n" + "  let x = 1;\n" * 10 + "}}\n"
+    code = "\n".join(function.format(index=index) for index in range(4))
+
+    chunks = split_code(code, "javascript", max_chars=200)
+
+    assert len(chunks) == 4
+    assert all(chunk.code.startswith("function ") for chunk in chunks)
+
+
+def test_lines_longer_than_a_chunk_are_split_between_lines():
+    code = "".join(f"x{index} = {index}\n" for index in range(100))
+
+    chunks = split_code(code, "python", max_chars=100)
+
+    assert all(len(chunk.code) <= 100 for chunk in chunks)
+    assert "".join(chunk.code for chunk in chunks) == code
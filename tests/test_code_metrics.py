@@ -0,0 +1,107 @@
+"""
+Tests of the static code metrics
+"""
+
+from code_metrics import (
+    analyze_code,
+    code_fingerprint,
+    code_tokens,
+    get_code_metrics,
+    hotspots,
+    metrics_cache_stats,
+    summarize_metrics,
+)
+
+
+# Fingerprints
+
+
+def test_fingerprint_ignores_formatting_and_comments():
+    code = "def add(a, b):\n    return a + b\n"
+    reformatted = "def add(a,b):  # sum\n\n    return a+b\n"
+
+    assert code_fingerprint(code, "python") == code_fingerprint(reformatted, "python")
+    assert code_fingerprint(code, "python") != code_fingerprint("def add(a, b):\n    return a - b\n", "python")
+
+
+def test_fingerprint_ignores_javascript_comments_and_whitespace():
+    code = "function add(a, b) { return a + b; }"
+    reformatted = "function add(a,b) {\n  // sum\n  return a + b; /* done */\n}"
+
+    assert code_fingerprint(code, "javascript") == code_fingerprint(reformatted, "javascript")
+
+
+def test_fingerprint_tells_languages_apart():
+    code = "x = [1, 2]"
+
+    assert code_fingerprint(code, "python") != code_fingerprint(code, "ruby")
+    assert code_fingerprint(code, "python") != code_fingerprint(code, None)
+    assert code_fingerprint(code, "python") == code_fingerprint(code, "py")
+    assert code_fingerprint(code, "JS") == code_fingerprint(code, "javascript")
+
+
+# Metrics
+
+
+def test_python_functions_are_measured():
+    code = (
+        "def check(value, low, high):\n"
+        "    if value < low:\n"
+        "        return low\n"
+        "    for _ in range(3):\n"
+        "        if value > high:\n"
+        "            return high\n"
+        "    return value\n"
+    )
+    metrics = analyze_code(code, "python")
+
+    assert metrics["analyzer"] == "python"
+    [function] = metrics["functions"]
+    assert (function["name"], function["complexity"], function["parameters"], function["nesting"]) == ("check", 4, 3, 2)
+    assert metrics["max_complexity"] == 4
+
+
+def test_javascript_functions_are_measured():
+    metrics = analyze_code("function f(a) { if (a && b) { return 1; } return 2; }", "js")
+
+    assert metrics["analyzer"] == "javascript"
+    assert [(f["name"], f["complexity"]) for f in metrics["functions"]] == [("f", 3)]
+
+
+def test_unknown_languages_only_get_line_counts():
+    metrics = analyze_code("SELECT *\nFROM t;\n\n", "sql")
+
+    assert metrics["analyzer"] is None
+    assert (metrics["lines"], metrics["code_lines"]) == (3, 2)
+
+
+def test_hotspots_are_functions_above_a_threshold():
+    branches = "".join(f"    if a == {i}:\n        return {i}\n" for i in range(12))
+    metrics = analyze_code(f"def busy(a):\n{branches}    return 0\n\ndef idle():\n    pass\n", "python")
+
+    assert [function["name"] for function in hotspots(metrics)] == ["busy"]
+
+
+def test_summary_points_at_the_hotspots():
+    branches = "".join(f"    if a == {i}:\n        return {i}\n" for i in range(12))
+    summary = summarize_metrics(analyze_code(f"def busy(a):\n{branches}    return 0\n", "python"))
+
+    assert summary.startswith("- 26 lines (26 non-blank), 1 functions, 0 classes")
+    assert "- hotspot: busy (line 1): complexity 13" in summary
+    assert summarize_metrics(analyze_code("SELECT 1;", "sql")) == ""
+
+
+def test_metrics_are_cached_per_language_and_code():
+    code = "def cached():\n    return 1\n"
+    before = metrics_cache_stats()
+
+    metrics = get_code_metrics(code, "python")
+    assert get_code_metrics(code, "Python") is metrics
+    get_code_metrics(code, "javascript")
+
+    after = metrics_cache_stats()
+    assert (after["hits"] - before["hits"], after["misses"] - before["misses"]) == (1, 2)
+
+
+def test_tokens_drop_comments_and_whitespace():
+    assert code_tokens("x = 1  # one\n", "python") == ["x", "=", "1"]
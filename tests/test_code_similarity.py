@@ -0,0 +1,62 @@
+"""
+Tests of MinHash signatures and LSH keys
+"""
+
+from code_similarity import (
+    LSH_BANDS,
+    NUM_PERMUTATIONS,
+    decode_signature,
+    encode_signature,
+    estimate_similarity,
+    lsh_keys,
+    minhash_signature,
+    signature_from_text,
+    signature_to_text,
+)
+
+CODE = (
+    "def total(items):\n"
+    "    result = 0\n"
+    "    for item in items:\n"
+    "        if item.price > 0:\n"
+    "            result += item.price * item.quantity\n"
+    "    return result\n"
+)
+
+
+def test_identical_code_has_the_same_signature_despite_formatting():
+    signature = minhash_signature(CODE, "python")
+
+    assert len(signature) == NUM_PERMUTATIONS
+    assert minhash_signature(CODE.replace("    ", "  ") + "# done\n", "python") == signature
+    assert estimate_similarity(signature, signature) == 1.0
+
+
+def test_similarity_is_higher_for_near_duplicates():
+    signature = minhash_signature(CODE, "python")
+    edited = minhash_signature(CODE.replace("result = 0", "result = 1"), "python")
+    unrelated = minhash_signature("class Stack:\n    def push(self, value):\n        self.values.append(value)\n", "python")
+
+    assert 0.5 < estimate_similarity(signature, edited) < 1.0
+    assert estimate_similarity(signature, unrelated) < 0.2
+
+
+def test_code_without_tokens_has_no_signature():
+    assert minhash_signature("# only a comment\n", "python") is None
+    assert len(minhash_signature("x", "python")) == NUM_PERMUTATIONS
+
+
+def test_near_duplicates_share_an_lsh_key():
+    keys = lsh_keys(minhash_signature(CODE, "python"))
+    edited = lsh_keys(minhash_signature(CODE.replace("result = 0", "result = 1"), "python"))
+
+    assert len(keys) == LSH_BANDS
+    assert all(-(1 << 63) <= key < (1 << 63) for key in keys)
+    assert set(keys) & set(edited)
+
+
+def test_signatures_round_trip_through_bytes_and_text():
+    signature = minhash_signature(CODE, "python")
+
+    assert decode_signature(encode_signature(signature)) == signature
+    assert signature_from_text(signature_to_text(signature)) == signature
@@ -0,0 +1,191 @@
+"""
+Tests of the shared expert helpers
+"""
+
+import json
+import time
+
+import anyio
+import httpx
+import pytest
+
+from experts import CodeReviewRequest, get_all_experts, store_code_snippet
+import experts.batch
+from experts.batch import BatchReviewer
+from experts.panel import ExpertPanel
+from knowledge_graph import KnowledgeGraph
+from ollama_service import OllamaService, ResponseCache
+
+
+@pytest.fixture
+def graph(tmp_path):
+    return KnowledgeGraph(str(tmp_path / "graph.json"))
+
+
+# Stored snippets
+
+
+def test_reformatted_code_is_stored_once(graph):
+    first = store_code_snippet(graph, CodeReviewRequest(code="x = 1\n", language="python"))
+    second = store_code_snippet(graph, CodeReviewRequest(code="x  =  1  # one\n", language="python"))
+
+    assert first == second
+    assert len(graph.get_nodes_by_type("CodeSnippet")) == 1
+
+
+def test_identical_text_in_another_language_is_stored_separately(graph):
+    python = store_code_snippet(graph, CodeReviewRequest(code="x = [1, 2]", language="python"))
+    ruby = store_code_snippet(graph, CodeReviewRequest(code="x = [1, 2]", language="ruby"))
+
+    assert python != ruby
+    assert graph.get_node(ruby)["properties"]["language"] == "ruby"
+
+
+# Panel
+
+
+REVIEW = json.dumps({"review": "Fine", "suggestions": ["Rename x"], "rating": 4})
+
+
+def review_handler(delay=0.0, calls=None):
+    """Answer generations with the same review after a delay, recording the requests."""
+    async def handle(request):
+        if calls is not None:
+            calls.append(json.loads(request.content))
+        await anyio.sleep(delay)
+        return httpx.Response(200, json={"response": REVIEW, "eval_count": 12})
+    return handle
+
+
+def make_service(handler):
+    """Create a service answered by the handler instead of by Ollama."""
+    service = OllamaService(hosts=["http://ollama:11434"], stream=False, hedge=False, cache=ResponseCache(None))
+    service._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return service
+
+
+def make_panel(graph, service):
+    return ExpertPanel(get_all_experts(graph, service), graph, service)
+
+
+@pytest.mark.anyio
+async def test_panel_reviews_with_every_expert_concurrently(graph):
+    panel = make_panel(graph, make_service(review_handler(delay=0.3)))
+
+    start = time.monotonic()
+    result = await panel.review_code(CodeReviewRequest(code="x = 1\n", language="python"))
+
+    # One round trip primes the shared prompt prefix, then both experts run side by side
+    assert time.monotonic() - start < 0.8
+    assert [review["expert"] for review in result["reviews"]] == ["Martin Fowler", "Robert C. Martin"]
+    assert result["averageRating"] == 4
+    [snippet] = graph.get_nodes_by_type("CodeSnippet")
+    reviews = graph.get_related_nodes(snippet["name"], edge_type="reviews", direction="incoming")
+    assert sorted(review["properties"]["reviewer"] for review in reviews) == ["Martin Fowler", "Robert C. Martin"]
+
+
+@pytest.mark.anyio
+async def test_panel_reuses_stored_reviews_of_identical_code(graph):
+    calls = []
+    panel = make_panel(graph, make_service(review_handler(calls=calls)))
+    await panel.review_code(CodeReviewRequest(code="x = 1\n", language="python"))
+    calls.clear()
+
+    result = await panel.review_code(CodeReviewRequest(code="x  =  1  # same\n", language="python"))
+
+    assert calls == []
+    assert len(result["reviews"]) == 2
+    assert len(graph.get_nodes_by_type("CodeReview")) == 2
+
+
+@pytest.mark.anyio
+async def test_panel_reports_the_combined_progress_of_the_experts(graph):
+    panel = make_panel(graph, make_service(review_handler()))
+    progress = []
+
+    async def report(value, total):
+        progress.append(value)
+
+    await panel.review_code(CodeReviewRequest(code="x = 1\n", language="python", storeInGraph=False), progress=report)
+
+    assert progress[-1] == 24
+    assert graph.get_nodes_by_type("CodeSnippet") == []
+
+
+# Batch
+
+
+def make_batch(graph, handler):
+    [expert, _] = get_all_experts(graph, make_service(handler))
+    return BatchReviewer(expert, graph)
+
+
+@pytest.mark.anyio
+async def test_batch_reviews_every_snippet_in_request_order(graph):
+    batch = make_batch(graph, review_handler())
+    streamed = []
+
+    async def on_result(result):
+        streamed.append(result["index"])
+
+    requests = [{"code": f"x = {n}\n", "language": "python"} for n in range(5)]
+    result = await batch.review_batch(requests, concurrency=3, on_result=on_result)
+
+    assert [item["index"] for item in result["results"]] == [0, 1, 2, 3, 4]
+    assert all(item["rating"] == 4 for item in result["results"])
+    assert (result["succeeded"], result["failed"]) == (5, 0)
+    assert sorted(streamed) == [0, 1, 2, 3, 4]
+    assert len(graph.get_nodes_by_type("CodeSnippet")) == 5
+    assert len(graph.get_nodes_by_type("CodeReview")) == 5
+
+
+@pytest.mark.anyio
+async def test_batch_generates_at_most_concurrency_reviews_at_once(graph):
+    active = peak = 0
+
+    async def handle(request):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await anyio.sleep(0.05)
+        active -= 1
+        return httpx.Response(200, json={"response": REVIEW, "eval_count": 12})
+
+    batch = make_batch(graph, handle)
+    requests = [{"code": f"x = {n}\n", "language": "python", "storeInGraph": False} for n in range(6)]
+    result = await batch.review_batch(requests, concurrency=2)
+
+    assert result["succeeded"] == 6
+    assert peak == 2
+    assert graph.get_nodes_by_type("CodeSnippet") == []
+
+
+@pytest.mark.anyio
+async def test_batch_reports_failing_items_without_failing_the_others(graph):
+    batch = make_batch(graph, review_handler())
+
+    result = await batch.review_batch([{"code": "x = 1\n", "language": "python"}, {"language": "python"}])
+
+    assert result["results"][0]["success"]
+    assert not result["results"][1]["success"]
+    assert "code" in result["results"][1]["error"]
+    assert (result["succeeded"], result["failed"]) == (1, 1)
+
+
+@pytest.mark.anyio
+async def test_batch_stores_reviews_one_by_one_when_a_grouped_write_fails(graph, monkeypatch):
+    def store_code_snippet(knowledge_graph, request):
+        if request.code.startswith("bad"):
+            raise OSError("disk full")
+        return original(knowledge_graph, request)
+
+    original = experts.batch.store_code_snippet
+    monkeypatch.setattr(experts.batch, "store_code_snippet", store_code_snippet)
+    batch = make_batch(graph, review_handler())
+
+    requests = [{"code": code, "language": "python"} for code in ("x = 1\n", "bad = 1\n", "y = 2\n")]
+    result = await batch.review_batch(requests, concurrency=3)
+
+    assert [item["success"] for item in result["results"]] == [True, False, True]
+    assert result["results"][1]["error"] == "disk full"
+    assert len(graph.get_nodes_by_type("CodeReview")) == 2
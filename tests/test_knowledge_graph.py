@@ -0,0 +1,547 @@
+"""
+Tests of the knowledge graph backends
+"""
+
+import json
+import os
+import sqlite3
+
+import pytest
+
+from code_metrics import FINGERPRINT_VERSION, code_fingerprint
+from knowledge_graph import (
+    FINGERPRINT_PROPERTY,
+    KnowledgeGraph,
+    SQLiteKnowledgeGraph,
+    open_knowledge_graph,
+    project_node,
+)
+
+
+@pytest.fixture
+def graph_path(tmp_path):
+    return str(tmp_path / "graph.json")
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def graph(request, tmp_path):
+    """An empty graph of each backend."""
+    if request.param == "sqlite":
+        graph = SQLiteKnowledgeGraph(str(tmp_path / "graph.db"))
+        yield graph
+        graph.close()
+    else:
+        yield KnowledgeGraph(str(tmp_path / "graph.json"), persistence="wal")
+
+
+def open_graph(path, persistence="wal", compact_threshold=1000):
+    return KnowledgeGraph(path, persistence=persistence, compact_threshold=compact_threshold)
+
+
+def node_names(graph):
+    return [node["name"] for node in graph.get_all()["nodes"]]
+
+
+# Write-ahead log
+
+
+def test_wal_appends_records_and_replays_them(graph_path):
+    graph = open_graph(graph_path)
+    graph.add_node("a", "CodeSnippet", {"code": "x = 1"})
+    graph.add_node("b", "CodeReview", {"review": "fine"})
+    graph.add_edge("b", "a", "reviews")
+
+    with open(f"{graph_path}.log") as f:
+        assert [json.loads(line)["op"] for line in f] == ["add_node", "add_node", "add_edge"]
+    assert not os.path.exists(graph_path)
+
+    reopened = open_graph(graph_path)
+    assert node_names(reopened) == ["a", "b"]
+    assert reopened.get_related_nodes("a")[0]["name"] == "b"
+
+
+def test_wal_is_compacted_into_the_snapshot(graph_path):
+    graph = open_graph(graph_path, compact_threshold=3)
+    for name in "abc":
+        graph.add_node(name, "Note", {})
+
+    assert not os.path.exists(f"{graph_path}.log")
+    graph.add_node("d", "Note", {})
+
+    reopened = open_graph(graph_path)
+    assert node_names(reopened) == ["a", "b", "c", "d"]
+
+
+def test_records_already_in_the_snapshot_are_not_replayed_again(graph_path):
+    graph = open_graph(graph_path)
+    graph.add_node("a", "Note", {})
+    graph.add_edge("a", "a", "links")
+    with open(f"{graph_path}.log") as f:
+        log = f.read()
+
+    # A crash between writing the snapshot and removing the log
+    graph.save()
+    with open(f"{graph_path}.log", "w") as f:
+        f.write(log)
+
+    reopened = open_graph(graph_path)
+    assert len(reopened.edges) == 1
+
+
+def test_log_replay_can_change_the_type_of_a_snapshot_node(graph_path):
+    graph = open_graph(graph_path)
+    graph.add_node("a", "Note", {"text": "draft"})
+    graph.add_node("b", "Note", {})
+    graph.save()
+    graph.add_node("a", "CodeReview", {"text": "final"})
+
+    reopened = open_graph(graph_path)
+    assert node_names(reopened) == ["a", "b"]
+    assert [node["name"] for node in reopened.get_nodes_by_type("CodeReview")] == ["a"]
+    assert [node["name"] for node in reopened.get_nodes_by_type("Note")] == ["b"]
+    assert [node["name"] for node in reopened.search_nodes("final")] == ["a"]
+    assert reopened.search_nodes("draft") == []
+
+
+def test_torn_log_tail_is_ignored_and_dropped(graph_path):
+    graph = open_graph(graph_path)
+    graph.add_node("a", "Note", {})
+    with open(f"{graph_path}.log", "a") as f:
+        f.write('{"op": "add_node", "name": "b", "no')
+
+    reopened = open_graph(graph_path)
+    assert node_names(reopened) == ["a"]
+    reopened.add_node("c", "Note", {})
+    assert node_names(open_graph(graph_path)) == ["a", "c"]
+
+
+def test_snapshot_mode_removes_a_leftover_log(graph_path):
+    open_graph(graph_path).add_node("a", "Note", {})
+
+    graph = open_graph(graph_path, persistence="snapshot")
+    assert not os.path.exists(f"{graph_path}.log")
+    graph.add_node("b", "Note", {})
+    assert node_names(open_graph(graph_path, persistence="snapshot")) == ["a", "b"]
+
+
+def test_unknown_persistence_mode_is_rejected(graph_path):
+    with pytest.raises(ValueError):
+        open_graph(graph_path, persistence="eventually")
+
+
+# Write failures
+
+
+def test_failed_log_write_raises_and_rolls_back(graph_path):
+    graph = open_graph(graph_path)
+    graph.add_node("a", "Note", {})
+    log_path = graph.log_path
+
+    # Appending to a directory fails
+    graph.log_path = os.path.join(os.path.dirname(graph_path), "unwritable")
+    os.mkdir(graph.log_path)
+    with pytest.raises(IOError):
+        graph.add_node("b", "Note", {"text": "lost"})
+    with pytest.raises(IOError):
+        graph.add_edge("a", "a", "links")
+
+    assert node_names(graph) == ["a"]
+    assert graph.edges == []
+    assert graph.search_nodes("lost") == []
+
+    graph.log_path = log_path
+    graph.add_node("c", "Note", {})
+    assert node_names(open_graph(graph_path)) == ["a", "c"]
+
+
+def test_failed_batch_commit_rolls_back_every_mutation(graph_path):
+    graph = open_graph(graph_path)
+    graph.add_node("a", "Note", {"text": "before"})
+
+    os.mkdir(f"{graph_path}.tmp")
+    graph.persistence = "snapshot"
+    with pytest.raises(IOError):
+        with graph.batch():
+            graph.add_node("a", "Note", {"text": "after"})
+            graph.add_node("b", "Note", {})
+            graph.add_edge("a", "b", "links")
+
+    assert node_names(graph) == ["a"]
+    assert graph.get_node("a")["properties"] == {"text": "before"}
+    assert graph.edges == []
+    assert [node["name"] for node in graph.search_nodes("before")] == ["a"]
+
+
+def test_failed_clear_keeps_the_graph(graph_path):
+    graph = open_graph(graph_path)
+    graph.add_node("a", "Note", {})
+
+    os.mkdir(f"{graph_path}.tmp")
+    with pytest.raises(IOError):
+        graph.clear()
+
+    assert node_names(graph) == ["a"]
+
+
+# Full-text search
+
+
+def test_search_matches_nodes_containing_every_term(graph):
+    graph.add_node("code-1", "CodeSnippet", {"code": "def parse_config(path): pass"})
+    graph.add_node("review-1", "CodeReview", {"review": "Split the Config parser", "suggestions": ["Extract method"]})
+    graph.add_node("review-2", "CodeReview", {"review": "Looks fine"})
+
+    assert [node["name"] for node in graph.search_nodes("config")] == ["review-1"]
+    assert [node["name"] for node in graph.search_nodes("parse_config")] == ["code-1"]
+    assert [node["name"] for node in graph.search_nodes("extract, METHOD!")] == ["review-1"]
+    assert [node["name"] for node in graph.search_nodes("review")] == ["review-1", "review-2"]
+    assert graph.search_nodes("config fine") == []
+    assert graph.search_nodes("missing") == []
+
+
+def test_search_without_terms_matches_nothing(graph):
+    graph.add_node("a", "Note", {"text": "hello"})
+
+    assert graph.search_nodes("!!!") == []
+    assert graph.get_nodes_page(query="  -- ", limit=10) == ([], None)
+    assert [node["name"] for node in graph.search_nodes("")] == ["a"]
+
+
+def test_search_index_follows_re_added_nodes(graph):
+    graph.add_node("a", "Note", {"text": "old words"})
+    graph.add_node("a", "Note", {"text": "new words"})
+
+    assert graph.search_nodes("old") == []
+    assert [node["name"] for node in graph.search_nodes("new")] == ["a"]
+
+
+# Pagination
+
+
+def test_pages_follow_the_cursor_until_the_last_node(graph):
+    for index in range(5):
+        graph.add_node(f"n{index}", "Note" if index % 2 else "CodeReview", {"text": "page"})
+
+    names = []
+    cursor = None
+    while True:
+        page, cursor = graph.get_nodes_page(query="page", cursor=cursor, limit=2)
+        names.append([node["name"] for node in page])
+        if cursor is None:
+            break
+    assert names == [["n0", "n1"], ["n2", "n3"], ["n4"]]
+
+    page, cursor = graph.get_nodes_page(node_types=["Note"], limit=1)
+    assert [node["name"] for node in page] == ["n1"]
+    page, cursor = graph.get_nodes_page(node_types=["Note"], cursor=cursor, limit=1)
+    assert [node["name"] for node in page] == ["n3"]
+    assert graph.get_nodes_page(node_types=["Note"], cursor=cursor, limit=5)[1] is None
+
+
+def test_pages_of_the_json_backend_start_after_the_cursor_position(graph_path):
+    graph = open_graph(graph_path)
+    for name in "abc":
+        graph.add_node(name, "Note", {})
+
+    page, cursor = graph.get_nodes_page(limit=1)
+    assert (page[0]["name"], cursor) == ("a", "1")
+    assert [node["name"] for node in graph.get_nodes_page(cursor=cursor)[0]] == ["b", "c"]
+
+
+@pytest.mark.parametrize("limit", [0, -1])
+def test_page_limit_below_one_is_rejected(graph, limit):
+    graph.add_node("a", "Note", {})
+
+    with pytest.raises(ValueError):
+        graph.get_nodes_page(limit=limit)
+
+
+@pytest.mark.parametrize("cursor", ["x", "-1"])
+def test_invalid_cursor_is_rejected(graph, cursor):
+    with pytest.raises(ValueError):
+        graph.get_nodes_page(cursor=cursor)
+
+
+# Fingerprints
+
+
+def test_snippets_of_an_old_snapshot_are_fingerprinted_again(graph_path):
+    graph = open_graph(graph_path, persistence="snapshot")
+    graph.add_node("code-1", "CodeSnippet", {"code": "x = 1", "language": "python", FINGERPRINT_PROPERTY: "stale"})
+    graph.add_node("code-2", "CodeSnippet", {"code": "x = 2", "language": "python"})
+    with open(graph_path) as f:
+        data = json.load(f)
+    del data["fingerprint_version"]
+    with open(graph_path, "w") as f:
+        json.dump(data, f)
+
+    reopened = open_graph(graph_path)
+    for name, code in [("code-1", "x = 1"), ("code-2", "x = 2")]:
+        fingerprint = code_fingerprint(code, "python")
+        assert [node["name"] for node in reopened.get_nodes_by_fingerprint(fingerprint)] == [name]
+    assert reopened.get_nodes_by_fingerprint("stale") == []
+    assert reopened.search_nodes("stale") == []
+    with open(graph_path) as f:
+        assert json.load(f)["fingerprint_version"] == FINGERPRINT_VERSION
+
+
+def test_snippets_of_an_old_database_are_fingerprinted_again(tmp_path):
+    path = str(tmp_path / "graph.db")
+    graph = SQLiteKnowledgeGraph(path)
+    graph.add_node("code-1", "CodeSnippet", {"code": "x = 1", "language": "python", FINGERPRINT_PROPERTY: "stale"})
+    graph.close()
+    with sqlite3.connect(path) as conn:
+        conn.execute("PRAGMA user_version = 0")
+
+    reopened = SQLiteKnowledgeGraph(path)
+    fingerprint = code_fingerprint("x = 1", "python")
+    assert [node["name"] for node in reopened.get_nodes_by_fingerprint(fingerprint)] == ["code-1"]
+    assert reopened.search_nodes("stale") == []
+    reopened.close()
+
+
+# Similar code
+
+
+TOTAL = (
+    "def total(items):\n"
+    "    result = 0\n"
+    "    for item in items:\n"
+    "        if item.price > 0:\n"
+    "            result += item.price * item.quantity\n"
+    "    return result\n"
+)
+
+
+def test_similar_snippets_are_found_most_similar_first(graph):
+    graph.add_node("exact", "CodeSnippet", {"code": TOTAL, "language": "python"})
+    graph.add_node("edited", "CodeSnippet", {"code": TOTAL.replace("result = 0", "result = 1"), "language": "python"})
+    graph.add_node("other", "CodeSnippet", {"code": "class Stack:\n    pass\n", "language": "python"})
+    graph.add_node("note", "Note", {"code": TOTAL})
+
+    similar = graph.find_similar_nodes(TOTAL, "python")
+
+    assert [node["name"] for node in similar] == ["exact", "edited"]
+    assert similar[0]["similarity"] == 1.0
+    assert similar[0]["similarity"] > similar[1]["similarity"]
+    assert [node["name"] for node in graph.find_similar_nodes(TOTAL, "python", limit=1)] == ["exact"]
+    assert graph.find_similar_nodes(TOTAL, "python", threshold=1.0)[-1]["name"] == "exact"
+
+
+def test_replaced_snippets_are_only_similar_to_their_new_code(graph):
+    graph.add_node("exact", "CodeSnippet", {"code": TOTAL, "language": "python"})
+    graph.add_node("exact", "CodeSnippet", {"code": "class Stack:\n    pass\n", "language": "python"})
+
+    assert graph.find_similar_nodes(TOTAL, "python") == []
+    assert graph.find_similar_nodes("# nothing\n", "python") == []
+
+
+def test_similar_snippet_limits_below_one_are_rejected(graph):
+    graph.add_node("exact", "CodeSnippet", {"code": TOTAL, "language": "python"})
+
+    for limit in (0, -1):
+        with pytest.raises(ValueError):
+            graph.find_similar_nodes(TOTAL, "python", limit=limit)
+
+
+def test_similar_snippets_are_found_after_reopening(graph_path):
+    open_graph(graph_path).add_node("exact", "CodeSnippet", {"code": TOTAL, "language": "python"})
+
+    assert [node["name"] for node in open_graph(graph_path).find_similar_nodes(TOTAL, "python")] == ["exact"]
+
+
+# Adjacency index
+
+
+def related(graph, name, **filters):
+    return [
+        (node["name"], node["relation"]["type"], node["relation"]["direction"])
+        for node in graph.get_related_nodes(name, **filters)
+    ]
+
+
+def test_related_nodes_follow_edges_in_both_directions(graph):
+    for name in ("code", "review-1", "review-2"):
+        graph.add_node(name, "Note", {})
+    graph.add_edge("review-1", "code", "reviews")
+    graph.add_edge("review-2", "code", "reviews")
+    graph.add_edge("review-2", "review-1", "supersedes")
+
+    assert related(graph, "code") == [("review-1", "reviews", "incoming"), ("review-2", "reviews", "incoming")]
+    assert related(graph, "review-1") == [("code", "reviews", "outgoing"), ("review-2", "supersedes", "incoming")]
+    assert related(graph, "review-2", direction="outgoing", edge_type="supersedes") == [
+        ("review-1", "supersedes", "outgoing")
+    ]
+    assert related(graph, "review-1", direction="incoming") == [("review-2", "supersedes", "incoming")]
+    assert related(graph, "code", edge_type="links") == []
+    assert related(graph, "missing") == []
+
+
+def test_edges_between_missing_nodes_are_rejected(graph):
+    graph.add_node("a", "Note", {})
+
+    with pytest.raises(ValueError):
+        graph.add_edge("a", "b", "links")
+    assert graph.get_related_nodes("a") == []
+
+
+def test_outgoing_edges_are_returned_in_insertion_order(graph):
+    for name in "abc":
+        graph.add_node(name, "Note", {})
+    graph.add_edge("b", "c", "links")
+    graph.add_edge("a", "b", "links")
+    graph.add_edge("c", "a", "links")
+
+    assert [(edge["source"], edge["target"]) for edge in graph.get_outgoing_edges(["a", "b", "a"])] == [
+        ("b", "c"),
+        ("a", "b"),
+    ]
+
+
+def test_adjacency_index_survives_a_reload(graph_path):
+    graph = open_graph(graph_path, compact_threshold=2)
+    for name in "abc":
+        graph.add_node(name, "Note", {})
+    graph.add_edge("a", "b", "links")
+    graph.add_edge("a", "c", "links")
+
+    reopened = open_graph(graph_path)
+    assert related(reopened, "a") == [("b", "links", "outgoing"), ("c", "links", "outgoing")]
+
+
+# Batches
+
+
+def test_batch_is_written_once_when_it_exits(graph_path):
+    graph = open_graph(graph_path)
+    with graph.batch():
+        graph.add_node("a", "Note", {})
+        with graph.batch():
+            graph.add_node("b", "Note", {})
+            graph.add_edge("a", "b", "links")
+        assert not os.path.exists(graph.log_path)
+
+    with open(graph.log_path) as f:
+        assert len(f.readlines()) == 3
+    assert len(open_graph(graph_path).edges) == 1
+
+
+def test_exception_in_a_batch_rolls_back_every_mutation(graph):
+    graph.add_node("a", "Note", {"text": "before"})
+
+    with pytest.raises(RuntimeError):
+        with graph.batch():
+            graph.add_node("a", "Note", {"text": "after"})
+            graph.add_node("b", "Note", {})
+            with graph.batch():
+                graph.add_edge("a", "b", "links")
+            raise RuntimeError("abort")
+
+    assert node_names(graph) == ["a"]
+    assert graph.get_node("a")["properties"] == {"text": "before"}
+    assert len(graph.edges) == 0
+    assert [node["name"] for node in graph.search_nodes("before")] == ["a"]
+    assert graph.search_nodes("after") == []
+
+
+def test_rolled_back_batch_is_not_persisted(graph_path):
+    graph = open_graph(graph_path)
+    graph.add_node("a", "Note", {})
+
+    with pytest.raises(RuntimeError):
+        with graph.batch():
+            graph.add_node("b", "Note", {})
+            raise RuntimeError("abort")
+
+    graph.add_node("c", "Note", {})
+    assert node_names(open_graph(graph_path)) == ["a", "c"]
+
+
+def test_graph_cannot_be_cleared_inside_a_batch(graph):
+    graph.add_node("a", "Note", {})
+
+    with pytest.raises(RuntimeError):
+        with graph.batch():
+            graph.clear()
+    assert node_names(graph) == ["a"]
+
+
+# SQLite backend
+
+
+@pytest.mark.parametrize("location, backend", [
+    ("graph.json", KnowledgeGraph),
+    ("graph.db", SQLiteKnowledgeGraph),
+    ("graph.SQLITE3", SQLiteKnowledgeGraph),
+])
+def test_backend_is_picked_by_the_file_extension(tmp_path, location, backend):
+    graph = open_knowledge_graph(str(tmp_path / location))
+
+    assert type(graph) is backend
+    if backend is SQLiteKnowledgeGraph:
+        graph.close()
+
+
+def test_backend_is_picked_by_a_sqlite_url(tmp_path):
+    path = tmp_path / "graph.data"
+    graph = open_knowledge_graph(f"sqlite:///{path}")
+
+    assert isinstance(graph, SQLiteKnowledgeGraph)
+    assert graph.db_path == str(path)
+    graph.close()
+
+
+def test_sqlite_graph_persists_across_connections(tmp_path):
+    path = str(tmp_path / "graph.db")
+    graph = SQLiteKnowledgeGraph(path)
+    graph.add_node("a", "Note", {"text": "first"})
+    graph.add_node("b", "CodeReview", {})
+    graph.add_edge("b", "a", "reviews", {"weight": 1})
+    graph.add_node("a", "Note", {"text": "updated"})
+    graph.close()
+
+    reopened = SQLiteKnowledgeGraph(path)
+    assert node_names(reopened) == ["a", "b"]
+    assert reopened.get_node("a")["properties"] == {"text": "updated"}
+    assert "a" in reopened.nodes and "c" not in reopened.nodes
+    assert len(reopened.nodes) == 2
+    assert reopened.edges[0]["properties"] == {"weight": 1}
+    assert [edge["type"] for edge in reopened.edges] == ["reviews"]
+    assert [node["name"] for node in reopened.get_nodes_by_type("CodeReview")] == ["b"]
+    reopened.close()
+
+
+def test_both_backends_clear_the_graph(graph):
+    graph.add_node("a", "Note", {"text": "gone"})
+    graph.add_edge("a", "a", "links")
+
+    graph.clear()
+
+    assert graph.get_all() == {"nodes": [], "edges": []}
+    assert graph.search_nodes("gone") == []
+    graph.add_node("b", "Note", {})
+    assert node_names(graph) == ["b"]
+
+
+# Projection
+
+
+NODE = {
+    "name": "review-1",
+    "type": "CodeReview",
+    "created_at": "2026-01-01T00:00:00",
+    "properties": {"rating": 4, "review": "Fine", "suggestions": []},
+}
+
+
+def test_projection_keeps_the_name_and_the_requested_fields():
+    assert project_node(NODE, ["type", "properties.rating", "properties.missing", "missing"]) == {
+        "name": "review-1",
+        "type": "CodeReview",
+        "properties": {"rating": 4},
+    }
+
+
+def test_projection_without_fields_keeps_the_whole_node():
+    assert project_node(NODE) is NODE
+    assert project_node(NODE, []) is NODE
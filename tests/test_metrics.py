@@ -0,0 +1,87 @@
+"""
+Tests of the metrics registry and its exposition format
+"""
+
+import pytest
+
+from metrics import MetricsRegistry, _Metric
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry()
+
+
+def test_metrics_must_render_their_samples():
+    with pytest.raises(TypeError):
+        _Metric("untyped_metric", "Cannot be rendered")
+
+
+def test_counters_and_gauges_are_rendered_with_help_and_type(registry):
+    calls = registry.counter("tool_calls_total", "Tool calls", ["tool", "outcome"])
+    depth = registry.gauge("queue_depth", "Waiting requests")
+    calls.inc(tool="ask_panel", outcome="success")
+    calls.inc(2, tool="ask_panel", outcome="success")
+    calls.inc(tool="read_graph", outcome="error")
+    depth.inc(3)
+    depth.dec()
+
+    assert registry.render() == (
+        "# HELP queue_depth Waiting requests\n"
+        "# TYPE queue_depth gauge\n"
+        "queue_depth 2\n"
+        "# HELP tool_calls_total Tool calls\n"
+        "# TYPE tool_calls_total counter\n"
+        'tool_calls_total{tool="ask_panel",outcome="success"} 3\n'
+        'tool_calls_total{tool="read_graph",outcome="error"} 1\n'
+    )
+
+
+def test_histograms_have_cumulative_buckets_sum_and_count(registry):
+    latency = registry.histogram("latency_seconds", "Latency", ["host"], buckets=[0.1, 1])
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, host="a")
+
+    assert latency.samples() == [
+        'latency_seconds_bucket{host="a",le="0.1"} 1',
+        'latency_seconds_bucket{host="a",le="1"} 2',
+        'latency_seconds_bucket{host="a",le="+Inf"} 3',
+        'latency_seconds_sum{host="a"} 5.55',
+        'latency_seconds_count{host="a"} 3',
+    ]
+
+
+def test_label_values_are_escaped(registry):
+    errors = registry.counter("errors_total", "Errors", ["message"])
+    errors.inc(message='say "hi"\\\n')
+
+    assert errors.samples() == ['errors_total{message="say \\"hi\\"\\\\\\n"} 1']
+
+
+def test_wrong_labels_and_decreasing_counters_are_rejected(registry):
+    calls = registry.counter("calls_total", "Calls", ["tool"])
+
+    with pytest.raises(ValueError):
+        calls.inc(host="a")
+    with pytest.raises(ValueError):
+        calls.inc(-1, tool="a")
+
+
+def test_registering_a_metric_again_returns_it(registry):
+    calls = registry.counter("calls_total", "Calls", ["tool"])
+
+    assert registry.counter("calls_total", "Calls", ["tool"]) is calls
+    with pytest.raises(ValueError):
+        registry.gauge("calls_total", "Calls", ["tool"])
+
+
+def test_collectors_run_before_rendering_and_errors_are_skipped(registry):
+    size = registry.gauge("graph_nodes", "Nodes")
+
+    def failing():
+        raise RuntimeError("unavailable")
+
+    registry.add_collector(lambda: size.set(42))
+    registry.add_collector(failing)
+
+    assert "graph_nodes 42\n" in registry.render()
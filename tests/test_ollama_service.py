@@ -0,0 +1,775 @@
+"""
+Tests of the Ollama service
+"""
+
+import json
+import os
+import time
+
+import anyio
+import httpx
+import pytest
+
+from code_chunker import CodeChunk
+from ollama_service import (
+    HEDGE_MIN_SAMPLES,
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    GenerationScheduler,
+    OllamaHost,
+    OllamaService,
+    QueueFullError,
+    ResponseCache,
+)
+
+REVIEW = json.dumps({"review": "Fine", "suggestions": ["Rename x"], "rating": 4})
+HOSTS = ["http://ollama-a:11434", "http://ollama-b:11434"]
+
+
+def make_service(handler, **options):
+    """Create a service whose requests are answered by a handler instead of Ollama."""
+    options = {"hosts": HOSTS, "stream": False, "hedge": False, "chunk_chars": 0, **options}
+    service = OllamaService(cache=ResponseCache(None), **options)
+    service._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return service
+
+
+def review_handler(delay=0.0):
+    """Answer every generation with the same review after a delay."""
+    async def handle(request):
+        await anyio.sleep(delay)
+        return httpx.Response(200, json={"response": REVIEW, "eval_count": 12})
+    return handle
+
+
+# Response cache
+
+
+def test_cache_file_is_created_on_first_use(tmp_path):
+    path = str(tmp_path / "cache" / "responses.db")
+    cache = ResponseCache(path)
+    assert not os.path.exists(path)
+
+    cache.set("key", {"review": "fine"})
+    assert os.path.exists(path)
+
+
+def test_cache_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "responses.db")
+    ResponseCache(path).set("key", {"review": "fine"})
+
+    cache = ResponseCache(path)
+    assert cache.contains("key")
+    assert cache.get("key") == {"review": "fine"}
+    assert cache.get("other") is None
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (0, 1, 1)
+
+    assert cache.get("key") == {"review": "fine"}
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_cache_entries_expire(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.db"), ttl=60)
+    cache.set("key", {"review": "fine"})
+
+    created_at, value = cache._memory["key"]
+    cache._memory["key"] = (created_at - 61, value)
+    cache._conn.execute("UPDATE responses SET created_at = ?", (time.time() - 61,))
+
+    assert not cache.contains("key")
+    assert cache.get("key") is None
+
+
+def test_memory_cache_keeps_the_most_recently_used_entries():
+    cache = ResponseCache(None, max_entries=2)
+    cache.set("a", {"review": "a"})
+    cache.set("b", {"review": "b"})
+    cache.get("a")
+    cache.set("c", {"review": "c"})
+
+    assert cache.contains("a")
+    assert not cache.contains("b")
+    assert cache.contains("c")
+
+
+def test_disk_cache_evicts_least_recently_used_entries(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.db"), max_entries=1, max_bytes=40)
+    cache.set("a", {"review": "aaaaaaaaaa"})
+    cache.set("b", {"review": "bbbbbbbbbb"})
+
+    assert cache.stats()["disk_bytes"] <= 40
+    assert not cache.contains("a")
+    assert cache.contains("b")
+
+
+def test_cache_keys_depend_on_model_expert_and_prompt():
+    key = ResponseCache.make_key("model", "expert", "prompt")
+
+    assert key == ResponseCache.make_key("model", "expert", "prompt")
+    assert key != ResponseCache.make_key("other", "expert", "prompt")
+    assert key != ResponseCache.make_key("model", "other", "prompt")
+    assert key != ResponseCache.make_key("model", "expert", "other")
+
+
+# Prompt prefix sharing
+
+
+def recording_handler(requests, fail_priming=False):
+    async def handle(request):
+        data = json.loads(request.content)
+        priming = data.get("options", {}).get("num_predict") == 1
+        requests.append((request.url.host, priming))
+        await anyio.sleep(0.01)
+        if priming and fail_priming:
+            return httpx.Response(500)
+        return httpx.Response(200, json={"response": REVIEW})
+    return handle
+
+
+async def review_with_both_experts(service, code):
+    async with service.share_prompt_prefix(code, language="python"), anyio.create_task_group() as tg:
+        tg.start_soon(service.get_martin_fowler_review, code, "python")
+        tg.start_soon(service.get_robert_c_martin_review, code, "python")
+
+
+def test_expert_prompts_start_with_the_shared_code_prefix():
+    service = make_service(review_handler())
+    prefix = service._prepare_code_prefix("x = 1\n", "python", "A constant")
+    prior = [{"similarity": 0.9, "rating": 3, "review": "Earlier", "suggestions": ["Name it"]}]
+
+    fowler = service._prepare_martin_fowler_prompt("x = 1\n", "python", "A constant", prior)
+    martin = service._prepare_robert_c_martin_prompt("x = 1\n", "python", "A constant")
+
+    assert prefix.startswith("CODE TO REVIEW in python:\nDescription: A constant\n```\nx = 1\n")
+    assert fowler.startswith(prefix) and martin.startswith(prefix)
+    assert "Earlier" in fowler[len(prefix):]
+
+
+@pytest.mark.anyio
+async def test_shared_prefix_is_primed_once_on_the_host_of_every_review():
+    requests = []
+    service = make_service(recording_handler(requests))
+
+    await review_with_both_experts(service, "x = 1\n")
+
+    assert requests[0] == ("ollama-a", True)
+    assert sorted(requests[1:]) == [("ollama-a", False), ("ollama-a", False)]
+    assert service.primed_prefixes == 1
+
+
+@pytest.mark.anyio
+async def test_failed_priming_does_not_fail_the_reviews():
+    requests = []
+    service = make_service(recording_handler(requests, fail_priming=True))
+
+    await review_with_both_experts(service, "x = 1\n")
+
+    assert len(requests) == 3
+    assert service.primed_prefixes == 0
+    assert service.cache.stats()["memory_entries"] == 2
+
+
+@pytest.mark.anyio
+async def test_cached_reviews_do_not_prime_the_prefix():
+    requests = []
+    service = make_service(recording_handler(requests))
+    await review_with_both_experts(service, "x = 1\n")
+    requests.clear()
+
+    await review_with_both_experts(service, "x = 1\n")
+
+    assert requests == []
+
+
+# Generation
+
+
+@pytest.mark.anyio
+async def test_review_is_parsed_and_records_the_model():
+    service = make_service(review_handler())
+
+    review = await service.get_martin_fowler_review("x = 1\n", "python")
+
+    assert review == {"review": "Fine", "suggestions": ["Rename x"], "rating": 4, "model": service.model}
+
+
+@pytest.mark.anyio
+async def test_concurrent_reviews_do_not_block_each_other():
+    service = make_service(review_handler(delay=0.2))
+
+    start = time.monotonic()
+    async with anyio.create_task_group() as tg:
+        for index in range(5):
+            tg.start_soon(service.get_martin_fowler_review, f"x = {index}\n", "python")
+
+    assert time.monotonic() - start < 0.6
+
+
+@pytest.mark.anyio
+async def test_http_client_is_shared_until_closed():
+    service = OllamaService(hosts=HOSTS, cache=ResponseCache(None))
+    client = service.client
+
+    assert service.client is client
+    await service.aclose()
+    assert client.is_closed
+    assert service.client is not client
+    await service.aclose()
+
+
+@pytest.mark.anyio
+async def test_unavailable_ollama_falls_back_to_a_mock_review():
+    service = make_service(review_handler())
+    for host in service.hosts:
+        host.record_failure(RuntimeError("down"), probe=True)
+
+    review = await service.get_robert_c_martin_review("def f():\n    return 1\n", "python")
+
+    assert review.get("model") is None
+    assert 1 <= review["rating"] <= 5
+    assert service.cache.stats()["memory_entries"] == 0
+
+
+@pytest.mark.anyio
+async def test_fallback_review_points_at_the_hotspots():
+    service = make_service(review_handler())
+    for host in service.hosts:
+        host.record_failure(RuntimeError("down"), probe=True)
+    branches = "".join(f"    if a == {i}:\n        return {i}\n" for i in range(12))
+
+    review = await service.get_martin_fowler_review(f"def busy(a):\n{branches}    return 0\n", "python")
+
+    assert review["suggestions"][0].startswith("Apply Extract Method to busy (complexity 13")
+    assert review["rating"] == 4
+
+
+# Streaming
+
+
+def streaming_handler(tokens, requests=None):
+    """Stream a generation token by token as NDJSON."""
+    async def handle(request):
+        if requests is not None:
+            requests.append(json.loads(request.content))
+        lines = [json.dumps({"response": token, "done": False}) for token in tokens]
+        lines.append(json.dumps({"response": "", "done": True}))
+        return httpx.Response(200, content="\n".join(lines).encode())
+    return handle
+
+
+@pytest.mark.anyio
+async def test_streamed_tokens_report_progress():
+    requests = []
+    tokens = ['{"review": "Fine", ', '"suggestions": [], ', '"rating": 4}']
+    service = make_service(streaming_handler(tokens, requests), stream=True)
+    progress = []
+
+    async def report(value, total):
+        progress.append(value)
+
+    review = await service.get_martin_fowler_review("x = 1\n", "python", progress=report)
+
+    assert requests[0]["stream"] is True
+    assert progress == [1, 2, 3]
+    assert (review["review"], review["rating"]) == ("Fine", 4)
+
+
+@pytest.mark.anyio
+async def test_stream_stops_at_the_first_complete_review():
+    tokens = ['Sure: {"review": "Fine", "suggestions": [], "rating": 4}', " and more", " text"]
+    service = make_service(streaming_handler(tokens), stream=True)
+    progress = []
+
+    async def report(value, total):
+        progress.append(value)
+
+    review = await service.get_martin_fowler_review("x = 1\n", "python", progress=report)
+
+    assert progress == [1]
+    assert review["review"] == "Fine"
+
+
+@pytest.mark.anyio
+async def test_stream_error_fails_over_to_the_mock_review():
+    async def handle(request):
+        return httpx.Response(200, content=json.dumps({"error": "model not found"}).encode())
+
+    service = make_service(handle, stream=True)
+
+    review = await service.get_martin_fowler_review("x = 1\n", "python")
+
+    assert review.get("model") is None
+
+
+# Single flight
+
+
+def counting_handler(calls, delay=0.05):
+    """Answer every generation with the same review, counting the requests."""
+    async def handle(request):
+        calls.append(json.loads(request.content)["prompt"])
+        await anyio.sleep(delay)
+        return httpx.Response(200, json={"response": REVIEW})
+    return handle
+
+
+@pytest.mark.anyio
+async def test_concurrent_identical_requests_share_one_generation():
+    calls = []
+    service = make_service(counting_handler(calls))
+    reviews = []
+
+    async def review(code):
+        reviews.append(await service.get_martin_fowler_review(code, "python"))
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(review, "x = 1\n")
+        tg.start_soon(review, "x = 1  \r\n")
+        tg.start_soon(review, "x = 1\n")
+
+    assert len(calls) == 1
+    assert service.coalesced_requests == 2
+    assert reviews[0] == reviews[1] == reviews[2]
+
+
+@pytest.mark.anyio
+async def test_waiting_requests_share_the_error_of_the_generation():
+    calls = []
+    service = make_service(counting_handler(calls))
+    errors = []
+
+    async def fail_generation(*args, **kwargs):
+        await anyio.sleep(0.05)
+        raise RuntimeError("parse failure")
+
+    service._generate_review = fail_generation
+
+    async def review():
+        try:
+            await service.get_martin_fowler_review("x = 1\n", "python")
+        except RuntimeError as e:
+            errors.append(e)
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(review)
+        tg.start_soon(review)
+
+    assert len(errors) == 2 and errors[0] is errors[1]
+
+
+@pytest.mark.anyio
+async def test_different_code_is_generated_separately():
+    calls = []
+    service = make_service(counting_handler(calls))
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(service.get_martin_fowler_review, "x = 1\n", "python")
+        tg.start_soon(service.get_martin_fowler_review, "x = 2\n", "python")
+        tg.start_soon(service.get_robert_c_martin_review, "x = 1\n", "python")
+
+    assert len(calls) == 3
+    assert service.coalesced_requests == 0
+
+
+# Scheduler
+
+
+@pytest.mark.anyio
+async def test_interactive_requests_are_admitted_before_batch_ones():
+    scheduler = GenerationScheduler(max_in_flight=1, max_queue_depth=10)
+    order = []
+
+    async def request(name, priority):
+        async with scheduler.slot(priority):
+            order.append(name)
+            await anyio.sleep(0.01)
+
+    async with anyio.create_task_group() as tg:
+        await scheduler.acquire()
+        tg.start_soon(request, "batch-1", PRIORITY_BATCH)
+        tg.start_soon(request, "batch-2", PRIORITY_BATCH)
+        tg.start_soon(request, "interactive", PRIORITY_INTERACTIVE)
+        await anyio.sleep(0.01)
+        assert scheduler.queue_depth == 3
+        scheduler.release()
+
+    assert order == ["interactive", "batch-1", "batch-2"]
+    assert scheduler.in_flight == 0
+
+
+@pytest.mark.anyio
+async def test_full_queue_rejects_requests_as_retryable():
+    scheduler = GenerationScheduler(max_in_flight=1, max_queue_depth=1)
+    await scheduler.acquire()
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(scheduler.acquire)
+        await anyio.sleep(0.01)
+        with pytest.raises(QueueFullError) as raised:
+            await scheduler.acquire(PRIORITY_BATCH)
+        assert raised.value.retryable
+        scheduler.release()
+
+    assert scheduler.stats()["rejected"] == 1
+    assert scheduler.in_flight == 1
+
+
+@pytest.mark.anyio
+async def test_cancelled_waiter_leaves_the_queue():
+    scheduler = GenerationScheduler(max_in_flight=1, max_queue_depth=5)
+    await scheduler.acquire()
+
+    with anyio.move_on_after(0.01):
+        await scheduler.acquire()
+
+    assert scheduler.queue_depth == 0
+    scheduler.release()
+    assert scheduler.in_flight == 0
+
+
+@pytest.mark.anyio
+async def test_unknown_priority_is_rejected():
+    with pytest.raises(ValueError):
+        await GenerationScheduler().acquire("urgent")
+
+
+def test_spare_slots_can_be_taken_without_waiting():
+    scheduler = GenerationScheduler(max_in_flight=1)
+
+    assert scheduler.try_acquire()
+    assert not scheduler.try_acquire()
+    scheduler.release()
+    assert scheduler.try_acquire()
+
+
+# Host health
+
+
+def test_generation_failures_open_the_circuit_after_the_threshold():
+    host = OllamaHost("http://ollama-a:11434", failure_threshold=2, retry_interval=60)
+
+    host.record_failure(RuntimeError("timeout"))
+    assert host.state == OllamaHost.STATE_UNKNOWN and host.is_available
+    host.record_failure(RuntimeError("timeout"))
+    assert host.state == OllamaHost.STATE_UNHEALTHY and not host.is_available
+
+    host.record_success(1.0)
+    assert host.state == OllamaHost.STATE_HEALTHY and host.consecutive_failures == 0
+
+
+def test_open_circuit_lets_one_trial_request_through_per_interval():
+    host = OllamaHost("http://ollama-a:11434", retry_interval=0.05)
+    host.record_failure(RuntimeError("refused"), probe=True)
+    assert not host.is_available
+
+    time.sleep(0.06)
+    assert host.is_available
+    host.start_request()
+    assert not host.is_available
+    host.finish_request()
+
+
+def test_latency_is_a_moving_average():
+    host = OllamaHost("http://ollama-a:11434")
+    host.record_success(1.0)
+    host.record_success(2.0)
+
+    assert host.latency == pytest.approx(1.0 + OllamaHost.LATENCY_SMOOTHING)
+
+
+def test_creating_the_service_does_not_contact_ollama():
+    calls = []
+    service = make_service(counting_handler(calls))
+
+    assert calls == []
+    assert service.is_available
+    assert {host.state for host in service.hosts} == {OllamaHost.STATE_UNKNOWN}
+
+
+@pytest.mark.anyio
+async def test_health_checks_probe_every_host_in_the_background():
+    async def handle(request):
+        status = 200 if request.url.host == "ollama-a" else 503
+        return httpx.Response(status, json={"models": []})
+
+    service = make_service(handle, health_interval=60)
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(service.run_health_checks)
+        await anyio.sleep(0.05)
+        tg.cancel_scope.cancel()
+
+    assert [host.state for host in service.hosts] == [OllamaHost.STATE_HEALTHY, OllamaHost.STATE_UNHEALTHY]
+
+
+@pytest.mark.anyio
+async def test_health_check_can_be_requested_right_away():
+    probes = []
+
+    async def handle(request):
+        probes.append(request.url.host)
+        return httpx.Response(200, json={"models": []})
+
+    service = make_service(handle, hosts=HOSTS[:1], health_interval=60)
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(service.run_health_checks)
+        await anyio.sleep(0.02)
+        service.request_health_check()
+        await anyio.sleep(0.02)
+        tg.cancel_scope.cancel()
+
+    assert probes == ["ollama-a", "ollama-a"]
+
+
+# Load balancing
+
+
+def test_least_loaded_healthy_host_is_selected():
+    service = make_service(review_handler(), hosts=HOSTS + ["http://ollama-c:11434"])
+    a, b, c = service.hosts
+    a.outstanding, b.outstanding, c.outstanding = 2, 1, 1
+    b.latency, c.latency = 2.0, 1.0
+
+    assert service._select_host() is c
+    assert service._select_host(exclude=[c]) is b
+    c.record_failure(RuntimeError("down"), probe=True)
+    assert service._select_host() is b
+    assert service._select_host(exclude=[a, b]) is None
+
+
+@pytest.mark.anyio
+async def test_concurrent_generations_are_spread_across_hosts():
+    hosts = []
+
+    async def handle(request):
+        hosts.append(request.url.host)
+        await anyio.sleep(0.05)
+        return httpx.Response(200, json={"response": REVIEW})
+
+    service = make_service(handle)
+    async with anyio.create_task_group() as tg:
+        for index in range(4):
+            tg.start_soon(service.get_martin_fowler_review, f"x = {index}\n", "python")
+
+    assert sorted(hosts) == ["ollama-a", "ollama-a", "ollama-b", "ollama-b"]
+
+
+@pytest.mark.anyio
+async def test_failed_generation_fails_over_to_another_host():
+    hosts = []
+
+    async def handle(request):
+        hosts.append(request.url.host)
+        if request.url.host == "ollama-a":
+            return httpx.Response(500)
+        return httpx.Response(200, json={"response": REVIEW})
+
+    service = make_service(handle)
+
+    review = await service.get_martin_fowler_review("x = 1\n", "python")
+
+    assert hosts == ["ollama-a", "ollama-b"]
+    assert review["model"] == service.model
+    assert service.hosts[0].failures == 1
+
+
+def load_tracking_handler(peaks, delay=0.05, slow_host=None):
+    """Answer generations after a delay, recording the peak of concurrent requests per host."""
+    active = {}
+
+    async def handle(request):
+        host = request.url.host
+        active[host] = active.get(host, 0) + 1
+        peaks[host] = max(peaks.get(host, 0), active[host])
+        try:
+            await anyio.sleep(1.0 if host == slow_host else delay)
+        finally:
+            active[host] -= 1
+        return httpx.Response(200, json={"response": REVIEW})
+    return handle
+
+
+@pytest.mark.anyio
+async def test_hosts_never_exceed_their_own_limit_when_another_is_down():
+    peaks = {}
+    service = make_service(load_tracking_handler(peaks), max_in_flight=2)
+    service.hosts[0].record_failure(RuntimeError("down"), probe=True)
+
+    assert service.scheduler.stats()["max_in_flight"] == 2
+    async with anyio.create_task_group() as tg:
+        for index in range(6):
+            tg.start_soon(service.get_martin_fowler_review, f"x = {index}\n", "python")
+
+    assert peaks == {"ollama-b": 2}
+    assert service.scheduler.stats()["admitted"] == 6
+    assert service.hosts[1].outstanding == 0
+
+
+@pytest.mark.anyio
+async def test_requests_wait_for_a_host_that_is_full():
+    peaks = {}
+    # A scheduler admitting more than the hosts can take, as when a host
+    # fails while requests are running
+    service = make_service(load_tracking_handler(peaks), hosts=HOSTS[:1], max_in_flight=1,
+                           scheduler=GenerationScheduler(max_in_flight=4))
+
+    async with anyio.create_task_group() as tg:
+        for index in range(3):
+            tg.start_soon(service.get_martin_fowler_review, f"x = {index}\n", "python")
+
+    assert peaks == {"ollama-a": 1}
+
+
+# Hedging
+
+
+def warmed_up_service(handler, first_token=0.05):
+    """Create a hedging service that has seen enough time-to-first-token samples."""
+    service = make_service(handler, hedge=True, hedge_percentile=90)
+    service._ttft_samples.extend([first_token] * HEDGE_MIN_SAMPLES)
+    return service
+
+
+def test_hedge_delay_is_a_percentile_of_recent_first_tokens():
+    service = make_service(review_handler(), hedge=True, hedge_percentile=50)
+    assert service._hedge_delay() is None
+
+    service._ttft_samples.extend(range(1, HEDGE_MIN_SAMPLES + 1))
+    assert service._hedge_delay() == HEDGE_MIN_SAMPLES // 2
+
+    service.hedge = False
+    assert service._hedge_delay() is None
+
+
+@pytest.mark.anyio
+async def test_slow_generation_is_hedged_on_another_host():
+    hosts = []
+
+    async def handle(request):
+        hosts.append(request.url.host)
+        await anyio.sleep(1.0 if request.url.host == "ollama-a" else 0.01)
+        return httpx.Response(200, json={"response": REVIEW})
+
+    service = warmed_up_service(handle)
+
+    start = time.monotonic()
+    review = await service.get_martin_fowler_review("x = 1\n", "python")
+
+    assert time.monotonic() - start < 0.5
+    assert hosts == ["ollama-a", "ollama-b"]
+    assert (service.hedged_requests, service.hedge_wins) == (1, 1)
+    assert review["model"] == service.model
+    assert service.scheduler.in_flight == 0
+    assert [host.outstanding for host in service.hosts] == [0, 0]
+
+
+@pytest.mark.anyio
+async def test_fast_generation_is_not_hedged():
+    hosts = []
+
+    async def handle(request):
+        hosts.append(request.url.host)
+        return httpx.Response(200, json={"response": REVIEW})
+
+    service = warmed_up_service(handle, first_token=1.0)
+
+    await service.get_martin_fowler_review("x = 1\n", "python")
+
+    assert hosts == ["ollama-a"]
+    assert service.hedged_requests == 0
+
+
+@pytest.mark.anyio
+async def test_hedge_only_uses_spare_capacity():
+    hosts = []
+
+    async def handle(request):
+        hosts.append(request.url.host)
+        await anyio.sleep(0.2)
+        return httpx.Response(200, json={"response": REVIEW})
+
+    service = warmed_up_service(handle)
+    service.scheduler.max_in_flight = 1
+
+    await service.get_martin_fowler_review("x = 1\n", "python")
+
+    assert hosts == ["ollama-a"]
+    assert service.hedged_requests == 0
+
+
+# Chunked reviews
+
+
+FUNCTIONS = "\n\n".join(f"def f{index}():\n" + "    x = 1\n" * 10 for index in range(4))
+
+
+@pytest.mark.anyio
+async def test_large_code_is_reviewed_in_chunks_and_reduced():
+    prompts = []
+
+    async def handle(request):
+        prompt = json.loads(request.content)["prompt"]
+        prompts.append(prompt)
+        return httpx.Response(200, json={"response": REVIEW, "eval_count": 12})
+
+    service = make_service(handle, chunk_chars=200)
+    progress = []
+
+    async def report(value, total=None):
+        progress.append(value)
+
+    review = await service.get_martin_fowler_review(FUNCTIONS, "python", progress=report)
+
+    assert len(prompts) == 4
+    assert all("of a larger file" in prompt for prompt in prompts)
+    assert review["review"].startswith("Lines 1-")
+    assert review["review"].count("Lines ") == 4
+    assert review["suggestions"] == ["Rename x"]
+    assert review["rating"] == 4
+    assert review["model"] == service.model
+    assert progress[-1] == 48
+
+
+@pytest.mark.anyio
+async def test_small_code_is_reviewed_at_once():
+    calls = []
+    service = make_service(counting_handler(calls, delay=0), chunk_chars=10000)
+
+    review = await service.get_martin_fowler_review(FUNCTIONS, "python")
+
+    assert len(calls) == 1
+    assert review["review"] == "Fine"
+
+
+def test_reduced_review_weights_ratings_by_chunk_size_and_merges_suggestions():
+    chunks = [CodeChunk(1, 10, "x" * 300), CodeChunk(11, 12, "y" * 100)]
+    reviews = [
+        {"review": "Long", "suggestions": ["Extract method.", "Rename x"], "rating": 5, "model": "a"},
+        {"review": "Short", "suggestions": ["extract  METHOD"], "rating": 1, "model": "b"},
+    ]
+
+    review = OllamaService._reduce_reviews(chunks, reviews)
+
+    assert review == {
+        "review": "Lines 1-10: Long\n\nLines 11-12: Short",
+        "suggestions": ["Extract method.", "Rename x"],
+        "rating": 4,
+        "model": None,
+    }
+
+
+@pytest.mark.anyio
+async def test_hedge_is_not_sent_to_a_host_at_its_limit():
+    peaks = {}
+    service = warmed_up_service(load_tracking_handler(peaks, delay=0.3))
+    for host in service.hosts:
+        host.max_in_flight = 1
+    # Leave scheduler slots to spare, so only the host limit stops the hedges
+    service.scheduler.max_in_flight = 4
+
+    async with anyio.create_task_group() as tg:
+        for index in range(2):
+            tg.start_soon(service.get_martin_fowler_review, f"x = {index}\n", "python")
+
+    assert peaks == {"ollama-a": 1, "ollama-b": 1}
+    assert service.hedged_requests == 0
@@ -0,0 +1,111 @@
+"""
+Tests of semantic search over reviews
+"""
+
+import numpy as np
+import pytest
+
+from knowledge_graph import KnowledgeGraph
+from ollama_service import PRIORITY_BATCH, PRIORITY_INTERACTIVE
+from semantic_search import SEARCH_CATCH_UP_SIZE, SemanticSearch, review_text
+from vector_index import VectorIndex
+
+WORDS = ["naming", "coupling", "testing"]
+
+
+class FakeEmbeddings:
+    """Embeds a text as the counts of a few words, recording every request."""
+
+    embed_model = "fake-embed"
+
+    def __init__(self):
+        self.requests = []
+
+    async def embed(self, texts, priority=PRIORITY_INTERACTIVE):
+        self.requests.append((len(texts), priority))
+        return np.array(
+            [[text.lower().count(word) + 0.01 for word in WORDS] for text in texts],
+            dtype=np.float32
+        )
+
+
+@pytest.fixture
+def graph(tmp_path):
+    return KnowledgeGraph(str(tmp_path / "graph.json"))
+
+
+@pytest.fixture
+def embeddings():
+    return FakeEmbeddings()
+
+
+@pytest.fixture
+def search(tmp_path, graph, embeddings):
+    return SemanticSearch(graph, embeddings, VectorIndex(str(tmp_path / "graph.vectors")))
+
+
+def add_reviews(graph, count, text="Improve naming"):
+    start = len(graph.nodes)
+    for index in range(start, start + count):
+        graph.add_node(f"review-{index}", "CodeReview", {"review": text, "suggestions": []})
+
+
+def test_review_text_lists_the_suggestions():
+    node = {"properties": {"review": "Too long", "suggestions": ["Split it", "Rename x"]}}
+
+    assert review_text(node) == "Too long\n\nSuggestions:\n- Split it\n- Rename x"
+
+
+@pytest.mark.anyio
+async def test_search_ranks_reviews_by_similarity(graph, search):
+    add_reviews(graph, 1, "Better naming, naming matters")
+    add_reviews(graph, 1, "Reduce coupling")
+
+    results = await search.search("coupling between modules", limit=2, fields=["properties.review"])
+
+    assert [result["name"] for result in results] == ["review-1", "review-0"]
+    assert results[0]["score"] > results[1]["score"]
+    assert set(results[0]) == {"name", "properties", "score"}
+
+
+@pytest.mark.anyio
+async def test_search_only_catches_up_on_a_few_reviews(graph, search, embeddings):
+    add_reviews(graph, SEARCH_CATCH_UP_SIZE * 3)
+
+    await search.search("naming")
+    assert len(search.vector_index) == SEARCH_CATCH_UP_SIZE
+    assert embeddings.requests == [(SEARCH_CATCH_UP_SIZE, PRIORITY_INTERACTIVE), (1, PRIORITY_INTERACTIVE)]
+
+    await search.search("naming")
+    assert len(search.vector_index) == SEARCH_CATCH_UP_SIZE * 2
+
+
+@pytest.mark.anyio
+async def test_backfill_embeds_every_review_with_batch_priority(graph, search, embeddings):
+    add_reviews(graph, 5)
+
+    result = await search.backfill(batch_size=2)
+
+    assert result == {"embedded": 5, "indexed": 5}
+    assert embeddings.requests == [(2, PRIORITY_BATCH)] * 2 + [(1, PRIORITY_BATCH)]
+
+    add_reviews(graph, 1)
+    assert (await search.backfill(batch_size=2))["embedded"] == 1
+
+
+@pytest.mark.anyio
+async def test_each_indexing_step_writes_the_index_metadata_once(graph, search, monkeypatch):
+    add_reviews(graph, 5)
+    saves = []
+    save = search.vector_index.save
+
+    def counting_save():
+        saves.append(search.vector_index.cursor)
+        save()
+
+    monkeypatch.setattr(search.vector_index, "save", counting_save)
+
+    await search.backfill(batch_size=2)
+
+    assert len(saves) == 3
+    assert saves[-1] == search.vector_index.cursor is not None
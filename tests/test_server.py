@@ -0,0 +1,57 @@
+"""
+Tests of the MCP server helpers
+"""
+
+import anyio
+import pytest
+
+from ollama_service import QueueFullError
+from server import is_retryable, paginated
+
+
+# Error results
+
+
+async def fail_in_task_group(error):
+    async with anyio.create_task_group() as tg:
+        async def fail():
+            raise error
+        tg.start_soon(fail)
+
+
+@pytest.mark.anyio
+async def test_queue_full_error_from_a_task_group_is_retryable():
+    with pytest.raises(Exception) as raised:
+        await fail_in_task_group(QueueFullError("queue full"))
+
+    assert is_retryable(raised.value)
+
+
+@pytest.mark.anyio
+async def test_other_errors_from_a_task_group_are_not_retryable():
+    with pytest.raises(Exception) as raised:
+        await fail_in_task_group(ValueError("bad request"))
+
+    assert not is_retryable(raised.value)
+
+
+@pytest.mark.anyio
+async def test_retryable_flag_is_found_in_nested_task_groups():
+    with pytest.raises(Exception) as raised:
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(fail_in_task_group, QueueFullError("queue full"))
+
+    assert is_retryable(raised.value)
+    assert is_retryable(QueueFullError())
+    assert not is_retryable(ValueError())
+
+
+# Pagination
+
+
+def test_unpaged_requests_get_a_plain_list():
+    nodes = [{"name": "a"}]
+
+    assert paginated(nodes, None, {}) is nodes
+    assert paginated(nodes, "1", {"limit": 1}) == {"nodes": nodes, "next_cursor": "1"}
+    assert paginated(nodes, None, {"cursor": "0"}) == {"nodes": nodes, "next_cursor": None}
@@ -0,0 +1,104 @@
+"""
+Tests of request tracing
+"""
+
+import json
+
+import anyio
+import pytest
+
+import tracing
+from tracing import record_span, set_attribute, span, trace_request
+
+
+@pytest.fixture
+def tracer(monkeypatch, tmp_path):
+    tracer = tracing.Tracer(path=str(tmp_path / "traces.jsonl"), history=10)
+    monkeypatch.setattr(tracing, "TRACER", tracer)
+    return tracer
+
+
+def test_spans_outside_a_request_are_not_recorded(tracer):
+    with span("parse_review") as current:
+        set_attribute("ignored", True)
+        record_span("ignored", 0, 1)
+
+    assert current is None
+    assert tracer.slowest() == []
+
+
+def test_request_summary_breaks_down_its_stages(tracer):
+    with trace_request("ask_martin", language="python"):
+        with span("generate", host="a"):
+            with span("parse_review"):
+                set_attribute("rating", 4)
+
+    [summary] = tracer.slowest()
+    assert (summary["name"], summary["status"], summary["attributes"]) == ("ask_martin", "ok", {"language": "python"})
+    assert [(stage["name"], stage["depth"]) for stage in summary["stages"]] == [("generate", 1), ("parse_review", 2)]
+    assert summary["stages"][1]["attributes"] == {"rating": 4}
+    assert summary["stages"][0]["offset_ms"] <= summary["stages"][1]["offset_ms"]
+
+
+def test_failed_requests_record_their_error(tracer):
+    with pytest.raises(ValueError):
+        with trace_request("ask_martin"):
+            with span("generate"):
+                raise ValueError("bad review")
+
+    [summary] = tracer.slowest()
+    assert summary["status"] == "error"
+    assert summary["error"] == "ValueError: bad review"
+    assert summary["stages"][0]["error"] == "ValueError: bad review"
+
+
+@pytest.mark.anyio
+async def test_spans_of_concurrent_tasks_join_the_request(tracer):
+    async def stage(name):
+        with span(name):
+            await anyio.sleep(0.01)
+
+    with trace_request("ask_panel"):
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(stage, "martin")
+            tg.start_soon(stage, "fowler")
+
+    [summary] = tracer.slowest()
+    assert sorted(stage["name"] for stage in summary["stages"]) == ["fowler", "martin"]
+    assert all(stage["depth"] == 1 for stage in summary["stages"])
+
+
+def test_slowest_requests_come_first_and_can_be_filtered(tracer):
+    for name, duration_ns in [("fast", 1_000_000), ("slow", 5_000_000), ("other", 9_000_000)]:
+        with trace_request(name) as root:
+            root.start_ns -= duration_ns
+
+    assert [summary["name"] for summary in tracer.slowest()] == ["other", "slow", "fast"]
+    assert [summary["name"] for summary in tracer.slowest(limit=1, name="fast")] == ["fast"]
+
+
+def test_traces_are_exported_as_otlp_json_lines(tracer):
+    with trace_request("ask_martin", cached=False):
+        record_span("queue", 1_000, 2_000, priority="batch")
+
+    with open(tracer.path) as f:
+        [line] = f.read().splitlines()
+    spans = json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    root = next(span for span in spans if "parentSpanId" not in span)
+    [queued] = [span for span in spans if span["name"] == "queue"]
+    assert queued["parentSpanId"] == root["spanId"]
+    assert (queued["startTimeUnixNano"], queued["endTimeUnixNano"]) == ("1000", "2000")
+    assert queued["attributes"] == [{"key": "priority", "value": {"stringValue": "batch"}}]
+    assert root["attributes"] == [{"key": "cached", "value": {"boolValue": False}}]
+
+
+def test_export_file_is_rotated_when_full(tracer):
+    tracer.max_bytes = 1
+    for _ in range(3):
+        with trace_request("ask_martin"):
+            pass
+
+    with open(tracer.path) as f:
+        assert len(f.read().splitlines()) == 1
+    with open(f"{tracer.path}.1") as f:
+        assert len(f.read().splitlines()) == 1
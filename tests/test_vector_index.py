@@ -0,0 +1,127 @@
+"""
+Tests of the memory-mapped vector index
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from vector_index import INITIAL_CAPACITY, VectorIndex
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return str(tmp_path / "graph.vectors")
+
+
+def test_search_ranks_by_cosine_similarity(index_path):
+    index = VectorIndex(index_path)
+    index.add(["a", "b", "c"], np.array([[1, 0], [1, 1], [0, 3]]), "model")
+
+    results = index.search(np.array([2, 0]), limit=2)
+
+    assert [name for name, _ in results] == ["a", "b"]
+    assert results[0][1] == pytest.approx(1.0)
+    assert results[1][1] == pytest.approx(np.sqrt(0.5))
+    assert index.search(np.array([1, 0]), limit=0) == []
+    with pytest.raises(ValueError):
+        index.search(np.array([1, 0, 0]))
+
+
+def test_adding_a_name_again_replaces_its_vector(index_path):
+    index = VectorIndex(index_path)
+    index.add(["a", "b"], np.array([[1, 0], [0, 1]]), "model")
+    index.add(["a"], np.array([[0, 1]]), "model")
+
+    assert len(index) == 2
+    assert index.search(np.array([0, 1]))[0][1] == pytest.approx(1.0)
+    assert index.search(np.array([1, 0]))[0][1] == pytest.approx(0.0)
+
+
+def test_vectors_and_cursor_survive_a_restart(index_path):
+    index = VectorIndex(index_path)
+    index.add(["a", "b"], np.array([[1, 0], [0, 1]]), "model")
+    index.set_cursor("2")
+    index._close()
+
+    reopened = VectorIndex(index_path)
+    assert (len(reopened), reopened.model, reopened.cursor) == (2, "model", "2")
+    assert "a" in reopened and "c" not in reopened
+    assert reopened.search(np.array([0, 1]), limit=1)[0][0] == "b"
+
+
+def test_matrix_grows_when_full(index_path):
+    index = VectorIndex(index_path)
+    index.add([f"n{row}" for row in range(INITIAL_CAPACITY)], np.ones((INITIAL_CAPACITY, 2)), "model")
+    assert index.stats()["capacity"] == INITIAL_CAPACITY
+
+    index.add(["last"], np.array([[0, 1]]), "model")
+
+    assert index.stats() == {"model": "model", "dim": 2, "vectors": INITIAL_CAPACITY + 1, "capacity": 2 * INITIAL_CAPACITY}
+    assert index.search(np.array([0, 1]), limit=1)[0][0] == "last"
+
+
+def test_another_model_discards_the_vectors(index_path):
+    index = VectorIndex(index_path)
+    index.add(["a"], np.array([[1, 0]]), "old")
+    index.set_cursor("1")
+
+    index.add(["b"], np.array([[1, 0, 0]]), "new")
+
+    assert (len(index), index.model, index.dim, index.cursor) == (1, "new", 3, None)
+    assert "a" not in index
+
+
+def test_clear_removes_every_vector(index_path):
+    index = VectorIndex(index_path)
+    index.add(["a"], np.array([[1, 0]]), "model")
+
+    index.clear()
+
+    assert len(index) == 0
+    assert index.search(np.array([1, 0])) == []
+    assert len(VectorIndex(index_path)) == 0
+
+
+def test_names_are_appended_and_saved_with_the_cursor(index_path):
+    index = VectorIndex(index_path)
+    index.add(["a", "b"], np.array([[1, 0], [0, 1]]), "model", cursor="2")
+    index.add(["c", "a"], np.array([[1, 1], [1, 0]]), "model", cursor="4")
+
+    with open(index.names_path) as f:
+        assert f.read().splitlines() == ['"a"', '"b"', '"c"']
+    with open(index.meta_path) as f:
+        assert json.load(f) == {"model": "model", "dim": 2, "cursor": "4", "count": 3}
+
+
+def test_names_of_an_interrupted_add_are_cut_off(index_path):
+    index = VectorIndex(index_path)
+    index.add(["a"], np.array([[1, 0]]), "model")
+    index._close()
+    with open(index.names_path, "a") as f:
+        f.write('"lost"\n"partial')
+
+    reopened = VectorIndex(index_path)
+    reopened.add(["b"], np.array([[0, 1]]), "model")
+
+    assert len(VectorIndex(index_path)) == 2
+    assert "lost" not in reopened
+    with open(index.names_path) as f:
+        assert f.read().splitlines() == ['"a"', '"b"']
+
+
+def test_names_stored_in_the_metadata_are_moved_to_the_names_file(index_path):
+    index = VectorIndex(index_path)
+    index.add(["a", "b"], np.array([[1, 0], [0, 1]]), "model")
+    index._close()
+    with open(index.meta_path, "w") as f:
+        json.dump({"model": "model", "dim": 2, "cursor": "2", "names": ["a", "b"]}, f)
+
+    reopened = VectorIndex(index_path)
+
+    assert (len(reopened), reopened.cursor) == (2, "2")
+    assert reopened.search(np.array([0, 1]), limit=1)[0][0] == "b"
+    with open(index.meta_path) as f:
+        assert "names" not in json.load(f)
+    assert len(VectorIndex(index_path)) == 2
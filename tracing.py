@@ -0,0 +1,340 @@
+"""
+Tracing
+
+Lightweight spans that record where the time of a request goes, e.g. request
+validation, queueing, Ollama prefill and generation, response parsing and
+knowledge graph writes. The current span is kept in a context variable, so
+spans opened anywhere below a tool call (also in concurrent tasks) become its
+children. Finished requests are kept in memory for get_slow_requests and
+appended to a file in the OpenTelemetry (OTLP) JSON format, one trace per line.
+"""
+
+import datetime
+import json
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# File the traces are appended to ("" disables the export), size at which it
+# is rotated to "<path>.1", and number of recent requests kept in memory
+TRACE_PATH = os.environ.get("TRACE_PATH", "data/traces.jsonl")
+TRACE_MAX_BYTES = int(os.environ.get("TRACE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_HISTORY = int(os.environ.get("TRACE_HISTORY", "200"))
+
+# Maximum number of spans recorded per request, so large batches stay bounded
+MAX_SPANS_PER_TRACE = 2000
+
+# Service name reported in exported traces
+SERVICE_NAME = "mcp-code-expert"
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class Span:
+    """A timed stage of a request."""
+
+    def __init__(
+        self,
+        trace: "Trace",
+        name: str,
+        parent: Optional["Span"] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+        start_ns: Optional[int] = None
+    ):
+        """Start a span.
+
+        Args:
+            trace: Trace the span belongs to
+            name: Name of the stage, e.g. 'ollama.generate'
+            parent: Enclosing span, None for the root span of a request
+            attributes: Attributes describing the stage
+            start_ns: Start time in nanoseconds since the epoch, defaults to now
+        """
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.depth = parent.depth + 1 if parent else 0
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        """Duration in milliseconds, up to now while the span is open."""
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Set an attribute of the span."""
+        self.attributes[key] = value
+
+    def set_error(self, error: BaseException) -> None:
+        """Mark the stage as failed with an exception."""
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self, end_ns: Optional[int] = None, error: Optional[BaseException] = None) -> None:
+        """Finish the span and hand it to its trace.
+
+        Args:
+            end_ns: End time in nanoseconds since the epoch, defaults to now
+            error: Exception the stage failed with, if any
+        """
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+        if error is not None:
+            self.set_error(error)
+        self.trace.finish(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Convert the span to its OTLP JSON representation."""
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KIND_INTERNAL if self.parent_id else SPAN_KIND_SERVER,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": STATUS_ERROR, "message": self.error} if self.error else {"code": STATUS_OK}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Trace:
+    """The spans of one request."""
+
+    def __init__(self, tracer: "Tracer"):
+        self.tracer = tracer
+        self.trace_id = secrets.token_hex(16)
+        self.root: Optional[Span] = None
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def finish(self, span: Span) -> None:
+        """Record a finished span; the trace is complete with its root span."""
+        with self._lock:
+            if len(self.spans) < MAX_SPANS_PER_TRACE:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+        if span is self.root:
+            self.tracer.complete(self)
+
+    def summary(self) -> Dict[str, Any]:
+        """Summarize the request with its per-stage breakdown.
+
+        Returns:
+            Dictionary with the request's name, start, duration, status and
+            its stages in start order, each with its offset from the start
+            of the request and its nesting depth
+        """
+        root = self.root
+        with self._lock:
+            stages = sorted((span for span in self.spans if span is not root), key=lambda span: span.start_ns)
+        summary = {
+            "trace_id": self.trace_id,
+            "name": root.name,
+            "start": datetime.datetime.fromtimestamp(root.start_ns / 1e9).isoformat(),
+            "duration_ms": round(root.duration_ms, 3),
+            "attributes": root.attributes,
+            "status": "error" if root.error else "ok",
+            "stages": [
+                {
+                    "name": span.name,
+                    "offset_ms": round((span.start_ns - root.start_ns) / 1e6, 3),
+                    "duration_ms": round(span.duration_ms, 3),
+                    "depth": span.depth,
+                    **({"attributes": span.attributes} if span.attributes else {}),
+                    **({"error": span.error} if span.error else {})
+                }
+                for span in stages
+            ]
+        }
+        if root.error:
+            summary["error"] = root.error
+        if self.dropped:
+            summary["dropped_stages"] = self.dropped
+        return summary
+
+
+class Tracer:
+    """Collects finished requests and exports them."""
+
+    def __init__(
+        self,
+        path: str = TRACE_PATH,
+        max_bytes: int = TRACE_MAX_BYTES,
+        history: int = TRACE_HISTORY
+    ):
+        """Initialize the tracer.
+
+        Args:
+            path: File the traces are appended to, "" to disable the export
+            max_bytes: Size at which the file is rotated
+            history: Number of recent requests kept in memory
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.recent: Deque[Trace] = deque(maxlen=max(1, history))
+        self._lock = threading.Lock()
+
+    def complete(self, trace: Trace) -> None:
+        """Keep a finished request and export its spans."""
+        with self._lock:
+            self.recent.append(trace)
+            if self.path:
+                self._export(trace)
+
+    def slowest(self, limit: int = 10, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get the slowest recent requests.
+
+        Args:
+            limit: Maximum number of requests
+            name: Only include requests with this name, e.g. a tool name
+
+        Returns:
+            Request summaries with their per-stage breakdown, slowest first
+        """
+        with self._lock:
+            traces = [trace for trace in self.recent if name is None or trace.root.name == name]
+        traces.sort(key=lambda trace: trace.root.duration_ms, reverse=True)
+        return [trace.summary() for trace in traces[:max(0, limit)]]
+
+    def _export(self, trace: Trace) -> None:
+        """Append a trace to the export file as an OTLP JSON line."""
+        with trace._lock:
+            spans = [span.to_otlp() for span in trace.spans]
+        line = json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": spans}]
+            }]
+        })
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if self.max_bytes > 0 and os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                os.replace(self.path, f"{self.path}.1")
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            print(f"Error exporting trace: {e}")
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    """Convert an attribute to an OTLP key/value pair."""
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+# Tracer shared by the server and the services it instruments
+TRACER = Tracer()
+
+# Span of the stage currently running in this context
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def trace_request(name: str, **attributes: Any) -> Iterator[Span]:
+    """Trace a request, such as a tool call, as the root of a new trace.
+
+    Args:
+        name: Name of the request, e.g. the tool name
+        attributes: Attributes describing the request
+
+    Yields:
+        The root span
+    """
+    trace = Trace(TRACER)
+    root = Span(trace, name, attributes=attributes)
+    trace.root = root
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.end(error=e)
+        raise
+    else:
+        root.end()
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Time a stage of the current request.
+
+    Outside of a traced request nothing is recorded.
+
+    Args:
+        name: Name of the stage, e.g. 'parse_review'
+        attributes: Attributes describing the stage
+
+    Yields:
+        The span, or None outside of a traced request
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    current = Span(parent.trace, name, parent, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(error=e)
+        raise
+    else:
+        current.end()
+    finally:
+        _current_span.reset(token)
+
+
+def record_span(name: str, start_ns: int, end_ns: int, **attributes: Any) -> None:
+    """Record a stage of the current request that was timed elsewhere.
+
+    Args:
+        name: Name of the stage
+        start_ns: Start time in nanoseconds since the epoch
+        end_ns: End time in nanoseconds since the epoch
+        attributes: Attributes describing the stage
+    """
+    parent = _current_span.get()
+    if parent is not None:
+        Span(parent.trace, name, parent, attributes, start_ns).end(end_ns)
+
+
+def set_attribute(key: str, value: Any) -> None:
+    """Set an attribute of the current span, if there is one."""
+    current = _current_span.get()
+    if current is not None:
+        current.set_attribute(key, value)
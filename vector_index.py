@@ -0,0 +1,294 @@
+"""
+Vector Index
+
+Embeddings of knowledge graph nodes, stored as one contiguous float32 matrix
+in a memory-mapped file next to the graph. The node name of each row is
+appended to a names file, and a small JSON file holds the model, the number
+of valid rows and the indexing cursor, so adding a batch costs time in the
+size of the batch rather than of the index. Vectors are normalized when
+added, so cosine similarity is a single matrix-vector product.
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Rows allocated when the matrix file is created; it doubles when full
+INITIAL_CAPACITY = 1024
+
+
+class VectorIndex:
+    """Memory-mapped matrix of unit-length node embeddings.
+
+    The index belongs to one embedding model. Adding vectors of another
+    model or dimension discards the existing ones, as they cannot be
+    compared.
+    """
+
+    def __init__(self, path: str):
+        """Initialize the index.
+
+        Args:
+            path: Path of the index without extension; the matrix is stored
+                in "<path>.f32", the row names in "<path>.names" and the
+                metadata in "<path>.json"
+        """
+        self.path = path
+        self.matrix_path = f"{path}.f32"
+        self.names_path = f"{path}.names"
+        self.meta_path = f"{path}.json"
+        self.model: Optional[str] = None
+        self.dim = 0
+        self.cursor: Optional[str] = None
+        self._names: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._matrix: Optional[np.memmap] = None
+        self.load()
+
+    def __len__(self) -> int:
+        """Number of vectors in the index."""
+        return len(self._names)
+
+    def __contains__(self, name: object) -> bool:
+        """Whether a node has a vector in the index."""
+        return name in self._rows
+
+    def load(self) -> None:
+        """Open the matrix file and read its names and metadata, if they exist.
+
+        Names appended after the metadata was last written (e.g. by an
+        interrupted add) are not part of the index and are cut off.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._close()
+        self.model, self.dim, self.cursor = None, 0, None
+        self._names, self._rows = [], {}
+        if not os.path.exists(self.meta_path) or not os.path.exists(self.matrix_path):
+            return
+
+        try:
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Error loading vector index: {e}")
+            return
+
+        # Indexes written before the names file kept the names in the metadata
+        legacy_names = meta.get("names")
+        try:
+            names = legacy_names if legacy_names is not None else self._read_names(meta.get("count", 0))
+        except (ValueError, IOError) as e:
+            print(f"Error loading vector index names: {e}")
+            return
+        if names is None:
+            print("Vector index names file is shorter than its metadata, discarding the index")
+            return
+
+        capacity = os.path.getsize(self.matrix_path) // (4 * meta["dim"]) if meta.get("dim") else 0
+        if capacity < len(names):
+            print("Vector index matrix is shorter than its metadata, discarding the index")
+            return
+
+        self.model = meta.get("model")
+        self.dim = meta["dim"]
+        self.cursor = meta.get("cursor")
+        self._names = names
+        self._rows = {name: row for row, name in enumerate(self._names)}
+        if capacity:
+            self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        if legacy_names is not None:
+            self._write_names(self._names, "w")
+            self.save()
+
+    def add(
+        self,
+        names: List[str],
+        vectors: np.ndarray,
+        model: str,
+        cursor: Optional[str] = None
+    ) -> None:
+        """Add or replace the vectors of nodes.
+
+        Args:
+            names: Node names
+            vectors: One vector per name
+            model: Embedding model the vectors come from
+            cursor: Optional new indexing cursor, saved together with the
+                vectors; ignored when the vectors of another model are
+                discarded
+        """
+        if not names:
+            return
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        discarded = False
+        if model != self.model or vectors.shape[1] != self.dim:
+            if self._names:
+                print(f"Embedding model changed to {model}, discarding {len(self._names)} vectors")
+                discarded = True
+            self._reset(model, vectors.shape[1])
+        if cursor is not None and not discarded:
+            self.cursor = cursor
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        rows = []
+        added = []
+        for name in names:
+            row = self._rows.get(name)
+            if row is None:
+                row = len(self._names)
+                self._names.append(name)
+                self._rows[name] = row
+                added.append(name)
+            rows.append(row)
+
+        self._reserve(len(self._names))
+        self._matrix[rows] = vectors
+        self._matrix.flush()
+        # The names and rows are only counted once the metadata is written
+        self._write_names(added, "a")
+        self.save()
+
+    def search(self, vector: np.ndarray, limit: int = 10) -> List[Tuple[str, float]]:
+        """Find the nodes whose vectors are most similar to a vector.
+
+        Args:
+            vector: Query vector of the index's model
+            limit: Maximum number of results
+
+        Returns:
+            Node names with their cosine similarity, most similar first
+        """
+        count = len(self._names)
+        if not count or limit <= 0:
+            return []
+
+        query = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if query.shape[0] != self.dim:
+            raise ValueError(f"Query has {query.shape[0]} dimensions, the index has {self.dim}")
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        scores = self._matrix[:count] @ query
+        if limit < count:
+            top = np.argpartition(-scores, limit)[:limit]
+        else:
+            top = np.arange(count)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self._names[row], float(scores[row])) for row in top]
+
+    def set_cursor(self, cursor: Optional[str]) -> None:
+        """Remember where indexing of new nodes continues.
+
+        Args:
+            cursor: Opaque page cursor of the knowledge graph
+        """
+        if cursor != self.cursor:
+            self.cursor = cursor
+            self.save()
+
+    def save(self) -> None:
+        """Write the metadata of the index; the names are written as they are added."""
+        tmp_path = f"{self.meta_path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({
+                    "model": self.model,
+                    "dim": self.dim,
+                    "cursor": self.cursor,
+                    "count": len(self._names)
+                }, f)
+            os.replace(tmp_path, self.meta_path)
+        except IOError as e:
+            print(f"Error saving vector index: {e}")
+
+    def clear(self) -> None:
+        """Remove all vectors."""
+        self._reset(None, 0)
+        self.save()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the statistics of the index.
+
+        Returns:
+            Dictionary with the model, dimension, vector count and allocated rows
+        """
+        return {
+            "model": self.model,
+            "dim": self.dim,
+            "vectors": len(self._names),
+            "capacity": self._matrix.shape[0] if self._matrix is not None else 0
+        }
+
+    def _read_names(self, count: int) -> Optional[List[str]]:
+        """Read the names of the first rows and cut off any names after them.
+
+        Args:
+            count: Number of rows in the index
+
+        Returns:
+            The names, or None if the file holds fewer than count names
+        """
+        if not count:
+            self._write_names([], "w")
+            return []
+        if not os.path.exists(self.names_path):
+            return None
+
+        names: List[str] = []
+        with open(self.names_path, "r+b") as f:
+            while len(names) < count:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    return None
+                names.append(json.loads(line.decode("utf-8")))
+            f.truncate(f.tell())
+        return names
+
+    def _write_names(self, names: List[str], mode: str) -> None:
+        """Write row names to the names file, one JSON string per line.
+
+        Args:
+            names: Names of the rows, in row order
+            mode: "a" to append them, "w" to replace the file with them
+        """
+        try:
+            with open(self.names_path, mode, encoding="utf-8") as f:
+                f.writelines(json.dumps(name) + "\n" for name in names)
+        except IOError as e:
+            print(f"Error saving vector index names: {e}")
+
+    def _reset(self, model: Optional[str], dim: int) -> None:
+        """Drop all vectors and start over for a model and dimension."""
+        self._close()
+        for path in (self.matrix_path, self.names_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.model, self.dim, self.cursor = model, dim, None
+        self._names, self._rows = [], {}
+
+    def _reserve(self, rows: int) -> None:
+        """Grow the matrix file so it holds at least the given number of rows."""
+        capacity = self._matrix.shape[0] if self._matrix is not None else 0
+        if rows <= capacity:
+            return
+
+        new_capacity = max(INITIAL_CAPACITY, capacity * 2, rows)
+        self._close()
+        with open(self.matrix_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+", shape=(new_capacity, self.dim))
+
+    def _close(self) -> None:
+        """Flush and release the memory map."""
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None